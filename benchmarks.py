@@ -0,0 +1,434 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+import numpy as np
+import xarray as xr
+
+
+# Набор замеров производительности на синтетических данных (без сети и без файлов репозитория).
+# Результаты сохраняются в JSON; при заданном базовом файле выводится сравнение по медианам.
+#
+#   python benchmarks.py -o results.json
+#   python benchmarks.py --preset full --fail-on-regression
+#   python benchmarks.py -o benchmark-baseline.json --no-baseline   # обновить базовый файл
+
+PRESETS = {
+    'quick': dict(stations=[100, 1000], edges=[4, 64], grid_sizes=[101, 301], grace_files=[250], repeat=5),
+    'full': dict(stations=[100, 1000, 10000], edges=[4, 64, 256], grid_sizes=[101, 301, 1001],
+                 grace_files=[250, 2500], prism_grid_limit=301, repeat=10),
+}
+
+# Базовый файл результатов в репозитории: с ним по умолчанию сравнивается каждый запуск
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark-baseline.json')
+
+CASES = {}
+
+
+def case(name):
+    """
+    Регистрирует замер: функция получает параметры и возвращает вызываемый объект без аргументов.
+    """
+    def decorator(function):
+        CASES[name] = function
+        return function
+    return decorator
+
+
+def synthetic_grid(n, seed=0):
+    """
+    Сетка n x n в духе набора по Гавайям: рельеф из гауссовых «вулканов» на дне океана,
+    высоты над эллипсоидом и наблюденная сила тяжести.
+    """
+    rng = np.random.default_rng(seed)
+    lat = np.linspace(13, 28, n)
+    lon = np.linspace(195, 210, n)
+    lon2, lat2 = np.meshgrid(lon, lat)
+    topography = np.full((n, n), -5000.0)
+    for _ in range(8):
+        center = rng.uniform([15, 197], [26, 208])
+        topography += rng.uniform(3000, 9000) * np.exp(-((lat2 - center[0]) ** 2 + (lon2 - center[1]) ** 2) / rng.uniform(0.1, 1.0))
+    height = np.maximum(topography, 0) + 2.0
+    gravity = 978000 + 30 * np.sin(np.radians(lat2)) ** 2 * 100 + 0.1 * topography / 10
+    dims = ('latitude', 'longitude')
+    return xr.Dataset(
+        {
+            'gravity_earth': (dims, gravity.astype(np.float32)),
+            'h_over_ellipsoid': (dims, height.astype(np.float32)),
+            'topography_grd': (dims, topography.astype(np.float32)),
+            'topography_ell': (dims, topography.astype(np.float32)),
+        },
+        coords={'latitude': lat.astype(np.float32), 'longitude': lon.astype(np.float32)},
+    )
+
+
+def synthetic_polygon(n_edges, seed=0):
+    """
+    Звездообразный многоугольник с n_edges вершинами (м), обход по часовой стрелке, z вниз.
+    """
+    rng = np.random.default_rng(seed)
+    angles = -np.linspace(0, 2 * np.pi, n_edges, endpoint=False)
+    radius = 1500 * (1 + 0.3 * rng.uniform(-1, 1, n_edges))
+    return np.column_stack([3000 + radius * np.cos(angles), 2500 + radius * np.sin(angles)])
+
+
+def _natural_earth_available(resolutions=('110m', '50m', '10m')):
+    import cartopy
+    template = 'shapefiles/natural_earth/physical/ne_{}_coastline.shp'
+    roots = [cartopy.config['data_dir'], cartopy.config['pre_existing_data_dir']]
+    return all(any(os.path.exists(os.path.join(root, template.format(r))) for root in roots) for r in resolutions)
+
+
+_coastlines_source = None
+
+
+def offline_coastlines(n_rings=300, points=120, seed=0):
+    """
+    Без данных Natural Earth (нет сети) пишет синтетическую береговую линию - n_rings
+    замкнутых контуров по points вершин - во временный каталог и подключает его как
+    pre_existing_data_dir cartopy. Отрисовка проходит тот же путь, что и с настоящими данными.
+    Возвращает источник береговой линии: 'natural_earth' или 'synthetic'.
+    """
+    global _coastlines_source
+    if _coastlines_source is not None:
+        return _coastlines_source
+    if _natural_earth_available():
+        _coastlines_source = 'natural_earth'
+        return _coastlines_source
+    import cartopy
+    import shapefile
+    rng = np.random.default_rng(seed)
+    root = tempfile.mkdtemp(prefix='coastlines-')
+    directory = os.path.join(root, 'shapefiles', 'natural_earth', 'physical')
+    os.makedirs(directory)
+    angles = np.linspace(0, 2 * np.pi, points)
+    rings = []
+    for _ in range(n_rings):
+        lon, lat = rng.uniform(-175, 175), rng.uniform(-80, 80)
+        radius = rng.uniform(0.2, 5) * (1 + 0.2 * np.sin(5 * angles + rng.uniform(0, 2 * np.pi)))
+        rings.append(np.column_stack([lon + radius * np.cos(angles), lat + radius * np.sin(angles)]).tolist())
+    for resolution in ('110m', '50m', '10m'):
+        with shapefile.Writer(os.path.join(directory, f"ne_{resolution}_coastline"), shapeType=shapefile.POLYLINE) as writer:
+            writer.field('featurecla', 'C', 20)
+            for ring in rings:
+                writer.line([ring])
+                writer.record('Coastline')
+    cartopy.config['pre_existing_data_dir'] = root
+    _coastlines_source = 'synthetic'
+    return _coastlines_source
+
+
+def _fake_png(path, width=1200, height=800):
+    # Минимальный PNG: сигнатура, IHDR и пустой IDAT - достаточно для индексации каталога
+    def chunk(kind, payload):
+        return struct.pack('>I', len(payload)) + kind + payload + struct.pack('>I', zlib.crc32(kind + payload))
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+                + chunk(b'IDAT', zlib.compress(b'')) + chunk(b'IEND', b''))
+
+
+@case('talwani_scalar')
+def talwani_scalar(stations, edges):
+    from gravity import talwani
+    vertices = synthetic_polygon(edges)
+    x = np.linspace(-10000, 16000, stations)
+    start, end = vertices, np.roll(vertices, -1, axis=0)
+
+    def run():
+        return [sum(talwani(x1 - xs, x2 - xs, z1, z2, 500.0) for (x1, z1), (x2, z2) in zip(start, end)) for xs in x]
+    return run
+
+
+@case('talwani_profile')
+def talwani_profile_case(stations, edges):
+    from gravity import talwani_profile
+    vertices = synthetic_polygon(edges)
+    x = np.linspace(-10000, 16000, stations)
+    return lambda: talwani_profile(x, [vertices], [500.0])
+
+
+@case('talwani_edit')
+def talwani_edit(stations, edges):
+    # Перемещение одной вершины в модели с кэшем рёбер (интерактивная правка gravity_app)
+    from gravity import ProfileModel
+    vertices = synthetic_polygon(edges)
+    model = ProfileModel(np.linspace(-10000, 16000, stations))
+    model.set_body(0, vertices, 500.0)
+    offsets = np.array([[50.0, 0.0], [-50.0, 0.0]])
+    state = {'step': 0}
+
+    def run():
+        state['step'] += 1
+        edited = vertices.copy()
+        edited[state['step'] % edges] += offsets[state['step'] % 2]
+        model.set_body(0, edited, 500.0)
+        return model.gravity()
+    return run
+
+
+@case('point_reductions')
+def point_reductions(grid_size):
+    from gravity_data import compute_point_fields
+    data = synthetic_grid(grid_size)
+    return lambda: compute_point_fields(data.copy())
+
+
+@case('terrain_correction')
+def terrain_correction_case(grid_size):
+    from terrain import add_terrain_correction
+    from gravity_data import compute_point_fields
+    data = compute_point_fields(synthetic_grid(grid_size))
+    return lambda: add_terrain_correction(data.copy())
+
+
+@case('profile_extraction')
+def profile_extraction(grid_size):
+    # Серия срезов, которыми пользуется ProfileSelector (хранилище построено заранее)
+    from gravity_data import compute_point_fields
+    from profiles import ProfileStore
+    data = compute_point_fields(synthetic_grid(grid_size))
+    fields = ['gravity_disturbance', 'gravity_bouguer', 'topography_ell']
+    store = ProfileStore(data, fields)
+    locations = np.linspace(14, 27, 50)
+
+    def run():
+        for location in locations:
+            store.profile('latitude', location)
+            store.profile('longitude', location + 182)
+    return run
+
+
+@case('profile_store_build')
+def profile_store_build(grid_size):
+    from gravity_data import compute_point_fields
+    from profiles import ProfileStore
+    data = compute_point_fields(synthetic_grid(grid_size))
+    fields = ['gravity_disturbance', 'gravity_bouguer', 'topography_ell']
+    return lambda: ProfileStore(data, fields)
+
+
+@case('plot_field')
+def plot_field_case(grid_size):
+    # Полная отрисовка cartopy с береговой линией и сохранение PNG
+    import io
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import cartopy.crs as ccrs
+    from gravity_data import compute_point_fields
+    from nc_calculate import plot_field, RENDER_DPI
+    data = compute_point_fields(synthetic_grid(grid_size))
+    offline_coastlines()
+
+    def run():
+        fig = plt.figure(figsize=(12, 13))
+        ax = plt.axes(projection=ccrs.PlateCarree())
+        plot_field(ax, data, 'gravity_bouguer', cmap='RdBu_r')
+        fig.savefig(io.BytesIO(), format='png', dpi=RENDER_DPI)
+        plt.close(fig)
+    run()
+    return run
+
+
+@case('field_image')
+def field_image_case(grid_size):
+    # Быстрый путь отрисовки: растр и береговая линия готовы, меняются только пределы шкалы
+    from gravity_data import compute_point_fields
+    from map_render import FieldRenderer
+    data = compute_point_fields(synthetic_grid(grid_size))
+    offline_coastlines()
+    renderer = FieldRenderer(data)
+    renderer.colorize('gravity_bouguer', 'RdBu_r')
+    limits = iter(range(10 ** 9))
+
+    def run():
+        vlim = 100 + next(limits)
+        return renderer.image('gravity_bouguer', 'RdBu_r', -vlim, vlim)
+    return run
+
+
+@case('grace_index')
+def grace_index(grace_files):
+    from st import GraceManifest
+    directory = tempfile.mkdtemp(prefix='grace-bench-')
+    start = np.datetime64('2002-04-01')
+    for i in range(grace_files):
+        label = str(start + np.timedelta64(30 * i, 'D')).replace('-', '_')
+        _fake_png(os.path.join(directory, f"GRACE_{label}.png"))
+
+    def run():
+        manifest = GraceManifest.scan(directory)
+        manifest.nearest(manifest.dates[len(manifest) // 2])
+        manifest.between(str(manifest.dates[0]), str(manifest.dates[-1]))
+        return manifest
+    run.cleanup = lambda: shutil.rmtree(directory, ignore_errors=True)
+    return run
+
+
+@case('topography_prisms')
+def topography_prisms(grid_size):
+    # Прямой расчет призмами в одном процессе: время на ядро без накладных расходов пула
+    from prisms import topography_effect
+    data = synthetic_grid(grid_size)
+    data['geoid'] = xr.zeros_like(data['topography_grd'])
+    return lambda: topography_effect(data, workers=1)
+
+
+def plan(preset):
+    """
+    Список (замер, параметры) для набора параметров preset.
+    """
+    items = []
+    for stations in preset['stations']:
+        for edges in preset['edges']:
+            if stations * edges <= 64000:
+                items.append(('talwani_scalar', dict(stations=stations, edges=edges)))
+            items.append(('talwani_profile', dict(stations=stations, edges=edges)))
+            items.append(('talwani_edit', dict(stations=stations, edges=edges)))
+    for name in ('point_reductions', 'terrain_correction', 'profile_store_build', 'profile_extraction',
+                 'field_image', 'plot_field'):
+        for grid_size in preset['grid_sizes']:
+            items.append((name, dict(grid_size=grid_size)))
+    for grid_size in preset['grid_sizes']:
+        # Полная сетка 301 x 301 считается десятки секунд на ядро - только в наборе full
+        if grid_size <= preset.get('prism_grid_limit', 101):
+            items.append(('topography_prisms', dict(grid_size=grid_size)))
+    for grace_files in preset['grace_files']:
+        items.append(('grace_index', dict(grace_files=grace_files)))
+    return items
+
+
+def measure(function, repeat, min_time=0.05):
+    """
+    Время вызова: repeat серий, в каждой вызов повторяется, пока серия не займет min_time.
+    Возвращает длительности одного вызова (с) по сериям.
+    """
+    function()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1000:
+            break
+        number *= 2
+    times = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        times.append((time.perf_counter() - start) / number)
+    return times
+
+
+def case_key(name, params):
+    return f"{name}[{','.join(f'{k}={v}' for k, v in sorted(params.items()))}]"
+
+
+def run_case(name, params, repeat):
+    result = dict(case=name, params=params, key=case_key(name, params))
+    try:
+        function = CASES[name](**params)
+    except Exception as error:
+        # Ошибка подготовки данных замера: замер пропускается с причиной
+        result['skipped'] = f"{type(error).__name__}: {error}"
+        return result
+    try:
+        times = measure(function, repeat)
+    finally:
+        getattr(function, 'cleanup', lambda: None)()
+    result.update(min=min(times), median=float(np.median(times)), mean=float(np.mean(times)), runs=len(times))
+    return result
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return dict(timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'), commit=commit, python=platform.python_version(),
+                numpy=np.__version__, platform=platform.platform(), cpu_count=os.cpu_count(),
+                coastlines=_coastlines_source)
+
+
+def compare(results, baseline, threshold):
+    """
+    Отношение медиан к базовым значениям; регрессия - отношение больше threshold.
+    """
+    reference = {r['key']: r for r in baseline.get('results', []) if 'median' in r}
+    regressions = []
+    for result in results:
+        base = reference.get(result['key'])
+        if base is None or 'median' not in result:
+            continue
+        result['baseline_median'] = base['median']
+        result['ratio'] = result['median'] / base['median']
+        if result['ratio'] > threshold:
+            regressions.append(result)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры производительности на синтетических данных")
+    parser.add_argument('-o', '--output', default='benchmark-results.json', help="Файл результатов JSON")
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='quick')
+    parser.add_argument('--cases', nargs='+', choices=sorted(CASES), default=None, help="Только указанные замеры")
+    parser.add_argument('--stations', type=int, nargs='+', help="Число станций для Talwani")
+    parser.add_argument('--edges', type=int, nargs='+', help="Число ребер многоугольника")
+    parser.add_argument('--grid-sizes', type=int, nargs='+', help="Размеры синтетических сеток (узлов по стороне)")
+    parser.add_argument('--grace-files', type=int, nargs='+', help="Число файлов в синтетическом каталоге GRACE")
+    parser.add_argument('--repeat', type=int, help="Число серий замера")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="Базовый файл результатов для сравнения")
+    parser.add_argument('--no-baseline', action='store_true', help="Не сравнивать с базовым файлом")
+    parser.add_argument('--threshold', type=float, default=1.2, help="Порог регрессии по отношению медиан")
+    parser.add_argument('--fail-on-regression', action='store_true', help="Код возврата 1 при регрессиях")
+    args = parser.parse_args(argv)
+
+    preset = dict(PRESETS[args.preset])
+    for option in ('stations', 'edges', 'grid_sizes', 'grace_files', 'repeat'):
+        if getattr(args, option) is not None:
+            preset[option] = getattr(args, option)
+
+    results = []
+    for name, params in plan(preset):
+        if args.cases and name not in args.cases:
+            continue
+        result = run_case(name, params, preset['repeat'])
+        results.append(result)
+        if 'skipped' in result:
+            print(f"{result['key']:<55} пропущен: {result['skipped']}")
+        else:
+            print(f"{result['key']:<55} {result['median'] * 1e3:10.3f} мс")
+
+    report = dict(environment=environment(), preset=preset, results=results)
+    regressions = []
+    # Отсутствующий базовый файл по умолчанию (новая ветка) не считается ошибкой
+    use_baseline = args.baseline and not args.no_baseline and (args.baseline != BASELINE_PATH or os.path.exists(args.baseline))
+    if use_baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        report['baseline'] = dict(path=args.baseline, environment=baseline.get('environment'), threshold=args.threshold)
+        print("\nСравнение с базовым файлом:")
+        for result in results:
+            if 'ratio' in result:
+                mark = ' <- регрессия' if result in regressions else ''
+                print(f"{result['key']:<55} x{result['ratio']:.2f}{mark}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
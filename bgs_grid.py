@@ -0,0 +1,290 @@
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from object_cache import ObjectCache
+
+
+# Интерполяция значений станций на регулярную сетку национальной сетки (м).
+# Область делится на квадратные тайлы; в каждом тайле по станциям тайла и полосы
+# перекрытия вокруг него подбирается бигармонический сплайн (функция Грина
+# r^2 (ln r - 1), Sandwell, 1987) с линейным трендом. Стоимость - O(n^3) от числа
+# станций одного окна, а не всего набора. Веса сплайна не зависят от шага сетки,
+# поэтому при смене разрешения тайлы только перевычисляются в новых узлах.
+# Растр тайла выходит за его границы на половину полосы перекрытия; в этой полосе
+# прогнозы соседних тайлов смешиваются с линейными весами, дающими в сумме единицу,
+# поэтому на границах тайлов нет скачков.
+
+TILE_SIZE = 50000.0
+MARGIN = 0.25
+MAX_STATIONS = 1000
+LENGTH_SCALE = 1000.0  # Координаты в окне переводятся в км для обусловленности матрицы
+
+_MISSING = object()  # Пустой тайл хранит сплайн None, поэтому отсутствие обозначается отдельно
+
+
+def green(r):
+    """
+    Функция Грина бигармонического уравнения на плоскости: r^2 (ln r - 1), g(0) = 0.
+    """
+    return green_squared(r * r)
+
+
+def green_squared(r2):
+    # То же через квадрат расстояния: r^2 (ln r^2 / 2 - 1), без извлечения корня
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(r2 > 0, r2 * (0.5 * np.log(r2) - 1), 0.0)
+
+
+def decimate(x, y, values, max_stations):
+    """
+    Блочное усреднение станций, если их больше max_stations: размер блока
+    подбирается по площади окна.
+    """
+    if len(x) <= max_stations:
+        return x, y, values
+    width, height = np.ptp(x) or 1.0, np.ptp(y) or 1.0
+    size = np.sqrt(width * height / max_stations)
+    while True:
+        ix = ((x - x.min()) // size).astype(np.int64)
+        iy = ((y - y.min()) // size).astype(np.int64)
+        cells, inverse = np.unique(iy * (ix.max() + 1) + ix, return_inverse=True)
+        if len(cells) <= max_stations:
+            break
+        size *= 1.2
+    count = np.bincount(inverse)
+    return (np.bincount(inverse, x) / count, np.bincount(inverse, y) / count,
+            np.bincount(inverse, values) / count)
+
+
+def fit_spline(x, y, values, damping=0.0):
+    """
+    Подбирает сплайн по станциям окна. Возвращает (центр, станции, веса, тренд);
+    координаты внутри - в км относительно центра окна.
+    """
+    center = np.array([x.mean(), y.mean()])
+    xs, ys = (x - center[0]) / LENGTH_SCALE, (y - center[1]) / LENGTH_SCALE
+    trend_matrix = np.column_stack([np.ones_like(xs), xs, ys])
+    trend = np.linalg.lstsq(trend_matrix, values, rcond=None)[0] if len(xs) >= 3 else np.array([values.mean(), 0, 0])
+    residual = values - trend_matrix @ trend
+    matrix = green(np.hypot(xs[:, None] - xs, ys[:, None] - ys))
+    if damping:
+        matrix[np.diag_indices_from(matrix)] += damping
+    try:
+        weights = np.linalg.solve(matrix, residual)
+    except np.linalg.LinAlgError:
+        weights = np.linalg.lstsq(matrix, residual, rcond=None)[0]
+    return center, np.column_stack([xs, ys]), weights, trend
+
+
+def evaluate_spline(fit, x, y, chunk=4096):
+    """
+    Значения сплайна в точках (x, y), по частям, чтобы матрица расстояний оставалась небольшой.
+    Возвращает также расстояние от каждой точки до ближайшей станции окна (м).
+    """
+    center, stations, weights, trend = fit
+    xs, ys = (x - center[0]) / LENGTH_SCALE, (y - center[1]) / LENGTH_SCALE
+    result = trend[0] + trend[1] * xs + trend[2] * ys
+    nearest = np.empty(len(xs))
+    for start in range(0, len(xs), chunk):
+        part = slice(start, start + chunk)
+        r2 = (xs[part, None] - stations[:, 0]) ** 2 + (ys[part, None] - stations[:, 1]) ** 2
+        result[part] += green_squared(r2) @ weights
+        nearest[part] = r2.min(axis=1)
+    return result, np.sqrt(nearest) * LENGTH_SCALE
+
+
+def _fit_tile(x, y, values, damping, max_stations):
+    # Выполняется в процессе-обработчике
+    if len(x) == 0:
+        return None
+    return fit_spline(*decimate(x, y, values, max_stations), damping)
+
+
+def _tile_nodes(tile, tile_size, resolution, blend=0.0):
+    # Узлы сетки, кратные шагу, внутри тайла с полосой смешивания:
+    # [x0 - blend, x0 + size + blend) x [y0 - blend, y0 + size + blend)
+    tx, ty = tile
+    first = np.ceil((np.array([tx, ty]) * tile_size - blend) / resolution).astype(np.int64)
+    last = np.ceil(((np.array([tx, ty]) + 1) * tile_size + blend) / resolution).astype(np.int64)
+    return np.arange(first[0], last[0]), np.arange(first[1], last[1])
+
+
+def blend_weights(coordinates, start, size, blend):
+    """
+    Вес тайла [start, start + size) вдоль одной оси: 1 внутри, линейно спадает до 0
+    в полосе шириной 2 * blend вокруг каждой границы. Веса соседних тайлов в сумме дают 1.
+    """
+    if blend <= 0:
+        return ((coordinates >= start) & (coordinates < start + size)).astype(float)
+    rising = (coordinates - (start - blend)) / (2 * blend)
+    falling = ((start + size + blend) - coordinates) / (2 * blend)
+    return np.clip(np.minimum(rising, falling), 0.0, 1.0)
+
+
+def _evaluate_tile(fit, tile, tile_size, resolution, max_distance, blend=0.0):
+    # Растр тайла с полосой смешивания; узлы дальше max_distance от станций окна маскируются.
+    # Выполняется в процессе-обработчике
+    ix, iy = _tile_nodes(tile, tile_size, resolution, blend)
+    if fit is None:
+        return np.full((len(iy), len(ix)), np.nan)
+    nx, ny = np.meshgrid(ix * resolution, iy * resolution)
+    values, nearest = evaluate_spline(fit, nx.ravel(), ny.ravel())
+    values[nearest > max_distance] = np.nan
+    return values.reshape(nx.shape)
+
+
+class StationGridder:
+    """
+    Сеточная интерполяция одного поля хранилища станций по тайлам.
+    Кэшируются подобранные сплайны тайлов и готовые растры тайлов для каждого шага.
+    """
+
+    def __init__(self, stations, field, tile_size=TILE_SIZE, margin=MARGIN, damping=0.0,
+                 max_stations=MAX_STATIONS, max_distance=None, max_fits=512, max_rasters=1024):
+        self.stations = stations
+        self.field = field
+        self.tile_size = float(tile_size)
+        self.margin = float(margin)
+        self.damping = float(damping)
+        self.max_stations = int(max_stations)
+        # Узлы дальше max_distance от ближайшей станции окна (после прореживания) маскируются;
+        # по умолчанию - ширина полосы перекрытия
+        self.max_distance = max_distance if max_distance is not None else self.tile_size * self.margin
+        # Полоса смешивания - половина полосы перекрытия: прогноз на ней опирается на станции окна
+        self.blend = self.tile_size * self.margin / 2
+        self.max_fits = max_fits
+        self.max_rasters = max_rasters
+        self._fits = OrderedDict()
+        self._rasters = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _map(self, function, *args, workers):
+        # Пул процессов создается один раз на интерполятор и закрывается вместе с ним
+        if workers == 1 or len(args[0]) == 1:
+            return list(map(function, *args))
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=workers)
+                weakref.finalize(self, self._pool.shutdown, wait=False)
+            pool = self._pool
+        try:
+            return list(pool.map(function, *args))
+        except BrokenProcessPool:
+            with self._pool_lock:
+                if self._pool is pool:
+                    self._pool = None
+            pool.shutdown(wait=False)
+            raise
+
+    def _window(self, tile):
+        # Станции тайла с полосой перекрытия; пропуски значений отбрасываются
+        tx, ty = tile
+        pad = self.tile_size * self.margin
+        indices = self.stations.bbox(tx * self.tile_size - pad, ty * self.tile_size - pad,
+                                     (tx + 1) * self.tile_size + pad, (ty + 1) * self.tile_size + pad)
+        x = self.stations['EASTING'][indices]
+        y = self.stations['NORTHING'][indices]
+        values = self.stations[self.field][indices].astype(float)
+        valid = np.isfinite(values)
+        return x[valid], y[valid], values[valid]
+
+    def _fits_for(self, tiles, workers):
+        # Сплайны тайлов: недостающие подбираются на пуле процессов
+        with self._lock:
+            fits = {tile: self._fits.get(tile, _MISSING) for tile in tiles}
+            missing = [tile for tile in tiles if fits[tile] is _MISSING]
+        if not missing:
+            return fits
+        windows = [self._window(tile) for tile in missing]
+        computed = self._map(_fit_tile, *zip(*windows), [self.damping] * len(missing),
+                             [self.max_stations] * len(missing), workers=workers)
+        with self._lock:
+            for tile, fit in zip(missing, computed):
+                fits[tile] = self._fits[tile] = fit
+            while len(self._fits) > self.max_fits:
+                self._fits.popitem(last=False)
+        return fits
+
+    def _rasters_for(self, tiles, fits, resolution, workers):
+        # Растры тайлов для шага resolution: недостающие считаются на пуле процессов
+        with self._lock:
+            rasters = {tile: self._rasters.get((tile, resolution)) for tile in tiles}
+            for tile in tiles:
+                if rasters[tile] is not None:
+                    self._rasters.move_to_end((tile, resolution))
+            missing = [tile for tile in tiles if rasters[tile] is None]
+        if not missing:
+            return rasters
+        n = len(missing)
+        computed = self._map(_evaluate_tile, [fits[tile] for tile in missing], missing, [self.tile_size] * n,
+                             [resolution] * n, [self.max_distance] * n, [self.blend] * n, workers=workers)
+        with self._lock:
+            for tile, raster in zip(missing, computed):
+                raster.setflags(write=False)
+                rasters[tile] = raster
+                self._rasters[(tile, resolution)] = raster
+            while len(self._rasters) > self.max_rasters:
+                self._rasters.popitem(last=False)
+        return rasters
+
+    def grid(self, bbox, resolution, workers=None):
+        """
+        Растр поля в прямоугольнике bbox = (xmin, ymin, xmax, ymax) с шагом resolution (м).
+        Узлы кратны шагу, поэтому тайлы повторно используются при сдвиге области.
+        Вблизи границ тайлов значения - взвешенное среднее прогнозов соседних тайлов.
+        Возвращает (восток, север, значения[север, восток]).
+        """
+        resolution = float(resolution)
+        xmin, ymin, xmax, ymax = bbox
+        ix = np.arange(np.ceil(xmin / resolution), np.floor(xmax / resolution) + 1).astype(np.int64)
+        iy = np.arange(np.ceil(ymin / resolution), np.floor(ymax / resolution) + 1).astype(np.int64)
+        result = np.full((len(iy), len(ix)), np.nan)
+        if not len(ix) or not len(iy):
+            return ix * resolution, iy * resolution, result
+        size, blend = self.tile_size, self.blend
+        tiles = [(tx, ty)
+                 for ty in range(int((iy[0] * resolution - blend) // size), int((iy[-1] * resolution + blend) // size) + 1)
+                 for tx in range(int((ix[0] * resolution - blend) // size), int((ix[-1] * resolution + blend) // size) + 1)]
+        workers = workers or os.cpu_count() or 1
+        tiles = [tile for tile in tiles if all(map(len, _tile_nodes(tile, size, resolution, blend)))]
+        fits = self._fits_for(tiles, workers)
+        rasters = self._rasters_for(tiles, fits, resolution, workers)
+        total = np.zeros(result.shape)
+        weight = np.zeros(result.shape)
+        for tile in tiles:
+            tile_ix, tile_iy = _tile_nodes(tile, size, resolution, blend)
+            # Пересечение узлов тайла с узлами запроса (номера узлов глобальные)
+            x0, x1 = max(tile_ix[0], ix[0]), min(tile_ix[-1], ix[-1]) + 1
+            y0, y1 = max(tile_iy[0], iy[0]), min(tile_iy[-1], iy[-1]) + 1
+            if x0 >= x1 or y0 >= y1:
+                continue
+            values = rasters[tile][y0 - tile_iy[0]:y1 - tile_iy[0], x0 - tile_ix[0]:x1 - tile_ix[0]]
+            w = np.outer(blend_weights(np.arange(y0, y1) * resolution, tile[1] * size, size, blend),
+                         blend_weights(np.arange(x0, x1) * resolution, tile[0] * size, size, blend))
+            # Замаскированные узлы тайла не участвуют: вес переходит к соседям
+            w[np.isnan(values)] = 0.0
+            region = np.s_[y0 - iy[0]:y1 - iy[0], x0 - ix[0]:x1 - ix[0]]
+            total[region] += w * np.nan_to_num(values)
+            weight[region] += w
+        covered = weight > 0
+        result[covered] = total[covered] / weight[covered]
+        return ix * resolution, iy * resolution, result
+
+
+_gridders = ObjectCache(max_entries=8)
+
+
+def get_gridder(stations, field, **options):
+    """
+    Интерполятор из памяти процесса: один на (хранилище, поле, параметры).
+    """
+    return _gridders.get(stations, (field, tuple(sorted(options.items()))),
+                         lambda: StationGridder(stations, field, **options))
@@ -0,0 +1,268 @@
+import argparse
+import csv
+import os
+import warnings
+
+import numpy as np
+
+
+# Поля стандартного формата BGS для наземных гравиметрических съемок и их типы
+STRING_COLUMNS = ('SURVEY_AREA', 'STATION_ID', 'STATION_CODE')
+FLOAT64_COLUMNS = ('LATITUDE', 'LONGITUDE')
+FLOAT32_COLUMNS = ('STATION_ELEV', 'BOUGUER_DENS', 'OBSERVED_GRAV', 'FREE AIR AN', 'TOT_TC', 'BOUGUER ANOMALY')
+
+# Параметры британской национальной сетки (поперечная проекция Меркатора на эллипсоиде Эйри 1830)
+_AIRY_A = 6377563.396
+_AIRY_B = 6356256.909
+_F0 = 0.9996012717
+_LAT0 = np.radians(49.0)
+_LON0 = np.radians(-2.0)
+_E0 = 400000.0
+_N0 = -100000.0
+
+
+def osgb36_to_grid(latitude, longitude):
+    """
+    Перевод широты и долготы OSGB36 (градусы) в восток/север национальной сетки (м)
+    по формулам Ordnance Survey, векторизованно.
+    """
+    phi = np.radians(np.asarray(latitude, dtype=float))
+    lam = np.radians(np.asarray(longitude, dtype=float))
+    a, b = _AIRY_A, _AIRY_B
+    e2 = (a * a - b * b) / (a * a)
+    n = (a - b) / (a + b)
+    sin, cos, tan = np.sin(phi), np.cos(phi), np.tan(phi)
+    nu = a * _F0 / np.sqrt(1 - e2 * sin ** 2)
+    rho = a * _F0 * (1 - e2) * (1 - e2 * sin ** 2) ** -1.5
+    eta2 = nu / rho - 1
+
+    dphi, sphi = phi - _LAT0, phi + _LAT0
+    M = b * _F0 * ((1 + n + 5 / 4 * n ** 2 + 5 / 4 * n ** 3) * dphi
+                   - (3 * n + 3 * n ** 2 + 21 / 8 * n ** 3) * np.sin(dphi) * np.cos(sphi)
+                   + (15 / 8 * n ** 2 + 15 / 8 * n ** 3) * np.sin(2 * dphi) * np.cos(2 * sphi)
+                   - 35 / 24 * n ** 3 * np.sin(3 * dphi) * np.cos(3 * sphi))
+    I = M + _N0
+    II = nu / 2 * sin * cos
+    III = nu / 24 * sin * cos ** 3 * (5 - tan ** 2 + 9 * eta2)
+    IIIA = nu / 720 * sin * cos ** 5 * (61 - 58 * tan ** 2 + tan ** 4)
+    IV = nu * cos
+    V = nu / 6 * cos ** 3 * (nu / rho - tan ** 2)
+    VI = nu / 120 * cos ** 5 * (5 - 18 * tan ** 2 + tan ** 4 + 14 * eta2 - 58 * tan ** 2 * eta2)
+
+    dlam = lam - _LON0
+    northing = I + II * dlam ** 2 + III * dlam ** 4 + IIIA * dlam ** 6
+    easting = _E0 + IV * dlam + V * dlam ** 3 + VI * dlam ** 5
+    return easting, northing
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+def read_csv(path, batch=100000):
+    """
+    Потоково читает CSV формата BGS и возвращает словарь типизированных столбцов.
+    Строки накапливаются пачками по batch и сразу переводятся в массивы numpy.
+    Строки, в которых меньше столбцов, чем нужно, пропускаются с предупреждением об их числе.
+    """
+    parts = {name: [] for name in STRING_COLUMNS + FLOAT64_COLUMNS + FLOAT32_COLUMNS}
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        header = [name.strip() for name in next(reader)]
+        positions = {name: header.index(name) for name in parts if name in header}
+        missing = {'LATITUDE', 'LONGITUDE'} - set(positions)
+        if missing:
+            raise ValueError(f"В файле {path} нет столбцов {', '.join(sorted(missing))}")
+        width = max(positions.values()) + 1
+        rows = []
+        skipped = 0
+
+        def flush():
+            for name in parts:
+                if name not in positions:
+                    continue
+                i = positions[name]
+                if name in STRING_COLUMNS:
+                    parts[name].append(np.array([row[i].strip() for row in rows]))
+                else:
+                    dtype = np.float32 if name in FLOAT32_COLUMNS else np.float64
+                    parts[name].append(np.array([_to_float(row[i]) for row in rows], dtype=dtype))
+            rows.clear()
+
+        for row in reader:
+            if len(row) >= width:
+                rows.append(row)
+            elif any(cell.strip() for cell in row):
+                skipped += 1
+            if len(rows) >= batch:
+                flush()
+        flush()
+    if skipped:
+        warnings.warn(f"В файле {path} пропущено строк с недостающими столбцами: {skipped}")
+    return {name: np.concatenate(chunks) for name, chunks in parts.items() if chunks}
+
+
+# Индекс по ячейкам регулярной сетки: станции отсортированы по номеру ячейки,
+# для каждой ячейки известен диапазон в отсортированном массиве
+class GridIndex:
+    def __init__(self, x, y, cell_size=5000.0, order=None, offsets=None, origin=None, shape=None):
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.cell_size = float(cell_size)
+        if order is None:
+            finite = np.isfinite(self.x) & np.isfinite(self.y)
+            origin = (np.nanmin(self.x), np.nanmin(self.y)) if finite.any() else (0.0, 0.0)
+            shape = (int((np.nanmax(self.y) - origin[1]) // cell_size) + 1 if finite.any() else 1,
+                     int((np.nanmax(self.x) - origin[0]) // cell_size) + 1 if finite.any() else 1)
+            self.origin, self.shape = origin, shape
+            cells = self._cell_ids(self.x[finite], self.y[finite])
+            order = np.flatnonzero(finite)[np.argsort(cells, kind='stable')]
+            offsets = np.searchsorted(np.sort(cells), np.arange(shape[0] * shape[1] + 1))
+        self.origin = tuple(origin)
+        self.shape = tuple(shape)
+        self.order = order
+        self.offsets = offsets
+
+    def _cell_ids(self, x, y):
+        ix = ((x - self.origin[0]) // self.cell_size).astype(np.int64)
+        iy = ((y - self.origin[1]) // self.cell_size).astype(np.int64)
+        return iy * self.shape[1] + ix
+
+    def _cells_in(self, xmin, ymin, xmax, ymax):
+        ix0 = max(int((xmin - self.origin[0]) // self.cell_size), 0)
+        ix1 = min(int((xmax - self.origin[0]) // self.cell_size), self.shape[1] - 1)
+        iy0 = max(int((ymin - self.origin[1]) // self.cell_size), 0)
+        iy1 = min(int((ymax - self.origin[1]) // self.cell_size), self.shape[0] - 1)
+        if ix0 > ix1 or iy0 > iy1:
+            return np.array([], dtype=np.int64)
+        # Ячейки одной строки сетки идут подряд: для строки берется один непрерывный срез
+        chunks = [self.order[self.offsets[iy * self.shape[1] + ix0]:self.offsets[iy * self.shape[1] + ix1 + 1]]
+                  for iy in range(iy0, iy1 + 1)]
+        return np.concatenate(chunks)
+
+    def bbox(self, xmin, ymin, xmax, ymax):
+        """
+        Индексы станций в прямоугольнике.
+        """
+        candidates = self._cells_in(xmin, ymin, xmax, ymax)
+        x, y = self.x[candidates], self.y[candidates]
+        return candidates[(x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)]
+
+    def radius(self, x, y, r):
+        """
+        Индексы станций в круге радиуса r, отсортированные по расстоянию.
+        """
+        candidates = self._cells_in(x - r, y - r, x + r, y + r)
+        distance = np.hypot(self.x[candidates] - x, self.y[candidates] - y)
+        inside = distance <= r
+        return candidates[inside][np.argsort(distance[inside], kind='stable')]
+
+    def nearest(self, x, y, k=1):
+        """
+        Индексы и расстояния k ближайших станций: поиск по расширяющимся кольцам ячеек.
+        """
+        total = len(self.order)
+        k = min(k, total)
+        if k == 0:
+            return np.array([], dtype=np.int64), np.array([])
+        r = self.cell_size
+        max_r = self.cell_size * (max(self.shape) + 1) + np.hypot(x - self.origin[0], y - self.origin[1])
+        while True:
+            candidates = self._cells_in(x - r, y - r, x + r, y + r)
+            if len(candidates) >= k or r > max_r:
+                distance = np.hypot(self.x[candidates] - x, self.y[candidates] - y)
+                best = np.argsort(distance, kind='stable')[:k]
+                # Результат точен, только если k-е расстояние не выходит за квадрат поиска
+                if len(best) == k and (distance[best[-1]] <= r or r > max_r):
+                    return candidates[best], distance[best]
+            r *= 2
+
+
+# Колоночное хранилище станций с координатами национальной сетки и индексом
+class StationStore:
+    def __init__(self, columns, index=None, cell_size=5000.0):
+        self.columns = columns
+        if 'EASTING' not in columns:
+            columns['EASTING'], columns['NORTHING'] = osgb36_to_grid(columns['LATITUDE'], columns['LONGITUDE'])
+        self.index = index or GridIndex(columns['EASTING'], columns['NORTHING'], cell_size)
+
+    def __len__(self):
+        return len(self.columns['LATITUDE'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def take(self, indices):
+        """
+        Подмножество станций: словарь столбцов.
+        """
+        return {name: values[indices] for name, values in self.columns.items()}
+
+    def bbox(self, xmin, ymin, xmax, ymax):
+        return self.index.bbox(xmin, ymin, xmax, ymax)
+
+    def radius(self, latitude, longitude, r):
+        x, y = osgb36_to_grid(latitude, longitude)
+        return self.index.radius(float(x), float(y), r)
+
+    def nearest(self, latitude, longitude, k=1):
+        x, y = osgb36_to_grid(latitude, longitude)
+        return self.index.nearest(float(x), float(y), k)
+
+    @classmethod
+    def from_csv(cls, path, cell_size=5000.0):
+        return cls(read_csv(path), cell_size=cell_size)
+
+    def save(self, path):
+        """
+        Сохраняет столбцы и индекс в несжатый npz.
+        """
+        index = self.index
+        np.savez(path, **{f"col:{name}": values for name, values in self.columns.items()},
+                 index_order=index.order, index_offsets=index.offsets,
+                 index_params=np.array([index.cell_size, *index.origin, *index.shape], dtype=float))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            columns = {key[4:]: f[key] for key in f.files if key.startswith('col:')}
+            cell_size, ox, oy, ny, nx = f['index_params']
+            index = GridIndex(columns['EASTING'], columns['NORTHING'], cell_size, f['index_order'],
+                              f['index_offsets'], (ox, oy), (int(ny), int(nx)))
+        return cls(columns, index)
+
+
+def store_path(csv_path):
+    root, _ = os.path.splitext(csv_path)
+    return f"{root}.stations.npz"
+
+
+def load_stations(csv_path, cell_size=5000.0):
+    """
+    Хранилище станций для CSV: читается из npz, если тот новее CSV, иначе строится заново.
+    """
+    path = store_path(csv_path)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(csv_path):
+        return StationStore.load(path)
+    store = StationStore.from_csv(csv_path, cell_size)
+    try:
+        store.save(path)
+    except OSError:
+        pass
+    return store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Преобразование CSV BGS в колоночное хранилище с пространственным индексом")
+    parser.add_argument('csv', help="CSV-файл наземной гравиметрической съемки BGS")
+    parser.add_argument('-o', '--output', default=None, help="Файл npz (по умолчанию <csv>.stations.npz)")
+    parser.add_argument('--cell-size', type=float, default=5000.0, help="Размер ячейки индекса, м")
+    args = parser.parse_args(argv)
+    StationStore.from_csv(args.csv, args.cell_size).save(args.output or store_path(args.csv))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+from functools import lru_cache
+
+import numpy as np
+
+
+EARTH_RADIUS = 6371008.8  # Средний радиус Земли, м
+
+
+def grid_spacing(data):
+    """
+    Шаг сетки (dy, dx) в метрах для регулярной сетки широта/долгота
+    в плоском приближении на средней широте.
+    """
+    lat = data.latitude.values
+    lon = data.longitude.values
+    dlat = np.radians(abs(lat[1] - lat[0]))
+    dlon = np.radians(abs(lon[1] - lon[0]))
+    return EARTH_RADIUS * dlat, EARTH_RADIUS * dlon * np.cos(np.radians(lat.mean()))
+
+
+def pad(array, fraction=0.25, mode='reflect', taper=True):
+    """
+    Расширяет сетку на fraction размера с каждой стороны (numpy.pad mode),
+    при taper=True расширенная часть плавно (косинусом) сводится к среднему значению.
+    Возвращает расширенный массив и срезы исходной области.
+    """
+    ny, nx = array.shape
+    py, px = int(ny * fraction), int(nx * fraction)
+    padded = np.pad(array, ((py, py), (px, px)), mode=mode)
+    if taper and (py or px):
+        mean = array.mean()
+        window = np.outer(_taper_window(ny, py), _taper_window(nx, px))
+        padded = mean + (padded - mean) * window
+    return padded, (slice(py, py + ny), slice(px, px + nx))
+
+
+def _taper_window(n, width):
+    window = np.ones(n + 2 * width)
+    if width:
+        ramp = 0.5 * (1 - np.cos(np.pi * np.arange(width) / width))
+        window[:width] = ramp
+        window[-width:] = ramp[::-1]
+    return window
+
+
+@lru_cache(maxsize=16)
+def wavenumbers(shape, dy, dx):
+    """
+    Волновые числа (ky, kx, |k|) в рад/м для rfft2 сетки формы shape.
+    Кэшируются по форме и шагу: повторные преобразования той же сетки их не пересчитывают.
+    """
+    ky = 2 * np.pi * np.fft.fftfreq(shape[0], d=dy)[:, None]
+    kx = 2 * np.pi * np.fft.rfftfreq(shape[1], d=dx)[None, :]
+    k = np.hypot(ky, kx)
+    for array in (ky, kx, k):
+        array.setflags(write=False)
+    return ky, kx, k
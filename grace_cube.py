@@ -0,0 +1,166 @@
+import argparse
+from datetime import datetime
+
+import numpy as np
+import netCDF4
+
+from grace_shm import parse_shm, mean_coefficients, synthesize_ewh, grid
+
+
+TIME_UNITS = 'days since 2002-01-01'
+VARIABLE = 'ewh'
+
+
+def _chunksizes(chunking, n_time, n_lat, n_lon, tile=32):
+    # time - карта за месяц читается одним чанком; space - ряд пикселя читается одним чанком
+    if chunking == 'time':
+        return (1, n_lat, n_lon)
+    if chunking == 'space':
+        return (n_time, min(tile, n_lat), min(tile, n_lon))
+    raise ValueError("chunking должен быть 'time' или 'space'")
+
+
+def build_cube(sources, path, resolution=1.0, radius=300, lmax=None, chunking='time', batch=12):
+    """
+    Строит на диске куб аномалий эквивалентного слоя воды (время, широта, долгота)
+    в сжатом чанкованном netCDF. Файлы SHM синтезируются пачками по batch месяцев,
+    поэтому в памяти одновременно находится не более batch сеток.
+    """
+    solutions = [parse_shm(source) for source in sources]
+    solutions = [s for s in solutions if s['info'] is not None]
+    if not solutions:
+        raise ValueError("Не найдено ни одного файла продукта уровня 2")
+    solutions.sort(key=lambda s: s['info']['start'])
+    if lmax is None:
+        lmax = min(s['lmax'] for s in solutions)
+    mean_C, mean_S = mean_coefficients(solutions)
+    latitudes, longitudes = grid(resolution)
+    epoch = datetime(2002, 1, 1)
+    times = [((s['info']['start'] - epoch) + (s['info']['end'] - s['info']['start']) / 2).total_seconds() / 86400
+             for s in solutions]
+
+    with netCDF4.Dataset(path, 'w') as nc:
+        nc.createDimension('time', len(solutions))
+        nc.createDimension('latitude', len(latitudes))
+        nc.createDimension('longitude', len(longitudes))
+        nc.createVariable('time', 'f8', ('time',))[:] = times
+        nc['time'].units = TIME_UNITS
+        nc.createVariable('latitude', 'f4', ('latitude',))[:] = latitudes
+        nc.createVariable('longitude', 'f4', ('longitude',))[:] = longitudes
+        nc.createVariable('source', str, ('time',))
+        for i, s in enumerate(solutions):
+            nc['source'][i] = s['name']
+        chunks = _chunksizes(chunking, len(solutions), len(latitudes), len(longitudes))
+        ewh = nc.createVariable(VARIABLE, 'f4', ('time', 'latitude', 'longitude'),
+                                zlib=True, complevel=4, chunksizes=chunks)
+        ewh.units = 'cm'
+        ewh.long_name = 'Эквивалентный слой воды'
+        nc.lmax = lmax
+        nc.smoothing_radius_km = radius
+        nc.chunking = chunking
+
+        for start in range(0, len(solutions), batch):
+            part = solutions[start:start + batch]
+            dC = np.stack([s['C'][:lmax + 1, :lmax + 1] - mean_C[:lmax + 1, :lmax + 1] for s in part])
+            dS = np.stack([s['S'][:lmax + 1, :lmax + 1] - mean_S[:lmax + 1, :lmax + 1] for s in part])
+            ewh[start:start + len(part)] = synthesize_ewh(dC, dS, latitudes, longitudes, lmax, radius)
+    return path
+
+
+# Ленивый доступ к кубу: читаются только затронутые чанки
+class GraceCube:
+    def __init__(self, path):
+        self.path = path
+        self._nc = netCDF4.Dataset(path, 'r')
+        self._ewh = self._nc[VARIABLE]
+        self.latitudes = self._nc['latitude'][:].filled(np.nan)
+        self.longitudes = self._nc['longitude'][:].filled(np.nan)
+        self.time = self._nc['time'][:].filled(np.nan)
+        self.dates = netCDF4.num2date(self.time, TIME_UNITS, only_use_cftime_datetimes=False,
+                                      only_use_python_datetimes=True)
+        self.chunks = self._ewh.chunking()
+
+    def close(self):
+        self._nc.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _nearest(self, values, value):
+        return int(np.abs(values - value).argmin())
+
+    def pixel_series(self, latitude, longitude):
+        """
+        Полный временной ряд ближайшего к точке пикселя.
+        """
+        i = self._nearest(self.latitudes, latitude)
+        j = self._nearest(self.longitudes, longitude)
+        return np.asarray(self._ewh[:, i, j], dtype=float)
+
+    def _region(self, lat_range, lon_range):
+        lat = np.flatnonzero((self.latitudes >= min(lat_range)) & (self.latitudes <= max(lat_range)))
+        lon = np.flatnonzero((self.longitudes >= min(lon_range)) & (self.longitudes <= max(lon_range)))
+        if not len(lat) or not len(lon):
+            raise ValueError("Регион не содержит узлов сетки")
+        return slice(lat[0], lat[-1] + 1), slice(lon[0], lon[-1] + 1)
+
+    def regional_mean(self, lat_range, lon_range):
+        """
+        Средний по площади (вес cos широты) ряд для прямоугольного региона.
+        Читается по блокам времени, вся область целиком в память не загружается.
+        """
+        lat_slice, lon_slice = self._region(lat_range, lon_range)
+        weights = np.cos(np.radians(self.latitudes[lat_slice]))[:, None]
+        weights = np.broadcast_to(weights, (weights.shape[0], lon_slice.stop - lon_slice.start))
+        series = np.empty(len(self.time))
+        step = self.chunks[0] if self.chunks != 'contiguous' else 1
+        for t0 in range(0, len(self.time), step):
+            block = np.asarray(self._ewh[t0:t0 + step, lat_slice, lon_slice], dtype=float)
+            series[t0:t0 + step] = (block * weights).sum(axis=(1, 2)) / weights.sum()
+        return series
+
+    def _blocks(self):
+        # Блоки чтения, выровненные по чанкам файла
+        n_time, n_lat, n_lon = self._ewh.shape
+        chunks = self.chunks if self.chunks != 'contiguous' else (1, n_lat, n_lon)
+        for i in range(0, n_lat, chunks[1]):
+            for j in range(0, n_lon, chunks[2]):
+                for t in range(0, n_time, chunks[0]):
+                    yield slice(t, t + chunks[0]), slice(i, i + chunks[1]), slice(j, j + chunks[2])
+
+    def harmonic_fit(self):
+        """
+        Поканальная регрессия ряда на среднее, тренд и годовую гармонику,
+        выполняемая по чанкам: накапливается X^T y формы (4, широта, долгота).
+        Возвращает словарь карт: trend (см/год) и amplitude (см).
+        """
+        years = self.time / 365.25
+        omega = 2 * np.pi * years
+        X = np.column_stack([np.ones_like(years), years - years.mean(), np.cos(omega), np.sin(omega)])
+        XtX_inv = np.linalg.inv(X.T @ X)
+        Xty = np.zeros((X.shape[1],) + self._ewh.shape[1:])
+        for t, i, j in self._blocks():
+            block = np.asarray(self._ewh[t, i, j], dtype=float)
+            Xty[:, i, j] += np.tensordot(X[t].T, block, axes=1)
+        coef = np.tensordot(XtX_inv, Xty, axes=1)
+        return dict(trend=coef[1], amplitude=np.hypot(coef[2], coef[3]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сборка куба GRACE (время, широта, долгота) из файлов SHM уровня 2")
+    parser.add_argument('sources', nargs='+', help="Файлы GSM-2_*.gz")
+    parser.add_argument('-o', '--output', default='GRACE/grace_cube.nc')
+    parser.add_argument('--resolution', type=float, default=1.0, help="Шаг сетки, градусы")
+    parser.add_argument('--radius', type=float, default=300, help="Радиус гауссова сглаживания, км")
+    parser.add_argument('--lmax', type=int, default=None)
+    parser.add_argument('--chunking', choices=['time', 'space'], default='time')
+    parser.add_argument('--batch', type=int, default=12, help="Число месяцев, синтезируемых за один проход")
+    args = parser.parse_args(argv)
+    build_cube(args.sources, args.output, args.resolution, args.radius, args.lmax, args.chunking, args.batch)
+
+
+if __name__ == '__main__':
+    main()
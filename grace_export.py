@@ -0,0 +1,168 @@
+import os
+import shutil
+import subprocess
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image, ImageDraw, ImageFont, GifImagePlugin
+
+
+FORMATS = ('gif', 'webp', 'mp4')
+
+# Пулы процессов декодирования создаются один раз на процесс сервера (по числу обработчиков)
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def available_formats():
+    """
+    Форматы, доступные в текущем окружении (mp4 требует ffmpeg).
+    """
+    return [fmt for fmt in FORMATS if fmt != 'mp4' or shutil.which('ffmpeg')]
+
+
+def _caption_font(height):
+    try:
+        return ImageFont.load_default(size=max(12, height // 20))
+    except TypeError:
+        return ImageFont.load_default()
+
+
+def decode_frame(path, size, caption=None, palette=False):
+    """
+    Декодирует и масштабирует один кадр, при необходимости подписывает дату.
+    Выполняется в процессе-обработчике; для GIF кадр сразу переводится в палитру.
+    """
+    with Image.open(path) as image:
+        frame = image.convert('RGB')
+    if frame.size != size:
+        # reducing_gap: сначала быстрое целочисленное уменьшение, затем точная фильтрация
+        frame = frame.resize(size, Image.LANCZOS, reducing_gap=3.0)
+    if caption:
+        draw = ImageDraw.Draw(frame)
+        font = _caption_font(size[1])
+        margin = max(4, size[1] // 50)
+        left, top, right, bottom = draw.textbbox((margin, margin), caption, font=font)
+        draw.rectangle((left - 2, top - 2, right + 2, bottom + 2), fill=(255, 255, 255))
+        draw.text((margin, margin), caption, fill=(0, 0, 0), font=font)
+    if palette:
+        frame = frame.quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+    return frame
+
+
+def get_pool(workers=None):
+    """
+    Общий пул процессов декодирования кадров: повторные экспорты не запускают новые процессы.
+    """
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = ProcessPoolExecutor(max_workers=workers)
+            _pools[workers] = pool
+    return pool
+
+
+def _discard_pool(workers, pool):
+    # Сломанный пул (обработчик завершился аварийно) заменяется при следующем экспорте
+    with _pools_lock:
+        if _pools.get(workers) is pool:
+            del _pools[workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_frames(paths, size, captions=None, palette=False, workers=None, in_flight=4):
+    """
+    Кадры в исходном порядке; декодирование идет на общем пуле процессов,
+    одновременно в работе не более in_flight кадров.
+    """
+    captions = captions or [None] * len(paths)
+    pool = get_pool(workers)
+    queue = deque()
+    try:
+        for path, caption in zip(paths, captions):
+            queue.append(pool.submit(decode_frame, path, size, caption, palette))
+            if len(queue) >= in_flight:
+                yield queue.popleft().result()
+        while queue:
+            yield queue.popleft().result()
+    except BrokenProcessPool:
+        _discard_pool(workers, pool)
+        raise
+    finally:
+        # Прерванный экспорт не оставляет задач в общем пуле
+        for future in queue:
+            future.cancel()
+
+
+def _write_ffmpeg(frames, size, output, fmt, fps):
+    # Кадры передаются в ffmpeg потоком сырых RGB-данных
+    codec = ['-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-movflags', '+faststart'] if fmt == 'mp4' else \
+        ['-c:v', 'libwebp', '-loop', '0', '-lossless', '0', '-quality', '80']
+    command = ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+               '-s', f'{size[0]}x{size[1]}', '-r', str(fps), '-i', '-', *codec, output]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    broken = False
+    try:
+        for frame in frames:
+            process.stdin.write(frame.tobytes())
+    except BrokenPipeError:
+        # ffmpeg завершился раньше времени; причина - в его stderr
+        broken = True
+    finally:
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            broken = True
+        error = process.stderr.read().decode(errors='replace').strip()
+        process.stderr.close()
+        if process.wait() != 0 or broken:
+            raise RuntimeError(f"ffmpeg завершился с кодом {process.returncode}: {error}")
+
+
+def _write_gif(frames, output, fps):
+    # GIF пишется по кадру: заголовок по первому кадру, затем каждый кадр со своей палитрой,
+    # поэтому в памяти не накапливаются все кадры анимации
+    duration = int(1000 / fps)
+    with open(output, 'wb') as f:
+        for i, frame in enumerate(frames):
+            if i == 0:
+                header, _ = GifImagePlugin.getheader(frame, info={'loop': 0})
+                f.write(b''.join(header))
+            for fragment in GifImagePlugin.getdata(frame, duration=duration, include_color_table=True):
+                f.write(fragment)
+        f.write(b';')
+
+
+def export_timelapse(paths, output, fmt='gif', fps=8, scale=0.5, captions=None, workers=None, in_flight=4,
+                     source_size=None):
+    """
+    Записывает анимацию из изображений paths в файл output.
+    scale - коэффициент уменьшения кадров, captions - подписи кадров (даты) или None.
+    GIF пишется по кадру, MP4 и, при наличии ffmpeg, WebP кодируются потоково:
+    в памяти одновременно не более in_flight кадров. WebP без ffmpeg
+    собирается средствами Pillow, которая хранит все кадры.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат {fmt}")
+    if not paths:
+        raise ValueError("Не выбрано ни одного кадра")
+    if source_size is None:
+        with Image.open(paths[0]) as image:
+            source_size = image.size
+    # Четные размеры требуются кодекам с субдискретизацией цвета
+    size = tuple(max(2, int(dimension * scale) // 2 * 2) for dimension in source_size)
+    use_ffmpeg = fmt == 'mp4' or (fmt == 'webp' and shutil.which('ffmpeg'))
+    frames = iter_frames(paths, size, captions, palette=(fmt == 'gif'), workers=workers, in_flight=in_flight)
+
+    if use_ffmpeg:
+        _write_ffmpeg(frames, size, os.fspath(output), fmt, fps)
+        return output
+    if fmt == 'gif':
+        _write_gif(frames, output, fps)
+        return output
+    first = next(frames)
+    first.save(output, format=fmt.upper(), save_all=True, append_images=frames,
+               duration=int(1000 / fps), loop=0)
+    return output
@@ -0,0 +1,115 @@
+import io
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+
+CACHE_BUDGET = 64 * 1024 * 1024  # Бюджет памяти кэша изображений, байт
+VARIANT_WIDTHS = (480, 800)  # Ширины уменьшенных вариантов, пиксели; None - оригинал
+
+
+# Ограниченный по объему LRU-кэш закодированных изображений архива GRACE
+class ImageCache:
+    def __init__(self, budget=CACHE_BUDGET, widths=VARIANT_WIDTHS, workers=2):
+        self.budget = budget
+        self.widths = tuple(sorted(widths))
+        self.size = 0
+        self._items = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='grace-prefetch')
+
+    def variant(self, viewport_width):
+        """
+        Наименьшая ширина варианта, которая не меньше ширины области вывода (None - оригинал).
+        """
+        if viewport_width is None:
+            return None
+        for width in self.widths:
+            if width >= viewport_width:
+                return width
+        return None
+
+    def _load(self, path, width):
+        with open(path, 'rb') as f:
+            content = f.read()
+        if width is None:
+            return content
+        image = Image.open(io.BytesIO(content))
+        if image.width <= width:
+            return content
+        image.thumbnail((width, image.height * width // image.width), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG', optimize=False, compress_level=3)
+        return buffer.getvalue()
+
+    def _store(self, key, content):
+        with self._lock:
+            if key in self._items:
+                return
+            self._items[key] = content
+            self.size += len(content)
+            while self.size > self.budget and len(self._items) > 1:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+    def get(self, path, width=None):
+        """
+        Байты изображения (оригинал или уменьшенный до width вариант).
+        """
+        key = (path, width)
+        with self._lock:
+            content = self._items.get(key)
+            if content is not None:
+                self._items.move_to_end(key)
+                return content
+            future = self._pending.get(key)
+        # Если файл уже загружается в фоне, дожидаемся результата вместо повторного чтения;
+        # неудачная фоновая загрузка считается промахом и повторяется синхронно
+        if future is not None:
+            try:
+                return future.result()
+            except Exception:
+                pass
+        content = self._load(path, width)
+        self._store(key, content)
+        return content
+
+    def _prefetch_one(self, key):
+        try:
+            content = self._load(*key)
+            self._store(key, content)
+            return content
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def prefetch(self, paths, width=None):
+        """
+        Загружает изображения в фоне на пуле потоков (например, соседние месяцы).
+        """
+        for path in paths:
+            if path is None:
+                continue
+            key = (path, width)
+            with self._lock:
+                if key in self._items or key in self._pending:
+                    continue
+                self._pending[key] = self._executor.submit(self._prefetch_one, key)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_image_cache():
+    """
+    Общий для всех сессий кэш изображений.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ImageCache()
+    return _cache
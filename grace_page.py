@@ -0,0 +1,201 @@
+import io
+import os
+import tempfile
+
+import streamlit as st
+import matplotlib.pyplot as plt
+import numpy as np
+
+from st import get_manifest
+from grace_shm import parse_shm, synthesize_solutions
+from grace_cube import GraceCube
+from grace_images import get_image_cache
+from grace_export import export_timelapse, available_formats
+from tracing import span, traced
+
+@traced('page')
+def grace_app():
+    images_dir = "GRACE"
+    with span('manifest'):
+        manifest = get_manifest(images_dir)
+    dates = manifest.labels
+
+    st.write("""
+    <div style="text-align: justify; margin-bottom: 20px;">
+    Зонд GRACE измеряет силу земного притяжения исключительно простым способом. 
+    Во время полета расстояние между двумя аппаратами непрерывно отслеживается с очень высокой точностью. 
+    Если бы Земля была однородным шаром, то сила тяжести была бы одинаковой во всех точках круговой орбиты. 
+    Спутники бы тогда двигались со строго постоянной скоростью, и расстояние между ними всегда оставалось бы неизменным. 
+    Однако на реальной Земле есть профиль — горы, долины, океаны, а также те неоднородности земной коры, которые скрываются под поверхностью. 
+    Они тоже оказывают гравитационное воздействие на спутники, а значит, и слегка влияют на их движение. 
+    Это дополнительное гравитационное воздействие приводит, в частности, к небольшим изменениям расстояния между спутниками.
+    </div>
+    """, unsafe_allow_html=True)
+    
+    st.write("""
+    <div style="text-align: justify; margin-bottom: 20px;">
+    Ниже приведены данные, полученные путем построения моделей на основе месячных данных с 2002 по 2024 года.
+    
+    [Источник данных](https://grace.jpl.nasa.gov/data/get-data/)
+    </div>
+    """, unsafe_allow_html=True)
+
+    selected_date = st.selectbox('Выберите дату', dates)
+    image_sizes = {'Миниатюра': 480, 'Средний': 800, 'Полный': None}
+    viewport = st.sidebar.selectbox('Размер изображения', list(image_sizes), index=1)
+
+    image_path = manifest.path(selected_date)
+
+    if image_path is not None:
+        # Изображение берется из общего кэша; соседние месяцы загружаются заранее в фоне
+        cache = get_image_cache()
+        width = cache.variant(image_sizes[viewport])
+        with span('image_cache', width=width):
+            image = cache.get(image_path, width)
+        st.image(image, caption=f"Данные GRACE за {selected_date}", use_column_width=True)
+        index = dates.index(selected_date)
+        neighbors = [dates[i] for i in (index - 1, index + 1) if 0 <= i < len(dates)]
+        cache.prefetch([manifest.path(date) for date in neighbors], width)
+    else:
+        st.write("Изображение не найдено.")
+
+    grace_export_section(manifest)
+    
+    st.write("""
+    <div style="text-align: justify; margin-bottom: 20px;">
+    Продукты уровня 2 миссий GRACE и GRACE-FO состоят из коэффициентов сферических гармоник гравитационного поля Земли. Файлы данных модели сферических гармоник (SHM) обычно представляют собой сжатые gzip ASCII-файлы с именами, формат которых следующий: PID-2_YYYYDOY-yyyydoy_ndays_center_flag_rrrr или PID-2_YYYYDOY-yyyydoy_mssn_center_flag_rrrr.
+
+    - PID — строка идентификации продукта (для стандартных продуктов: GSM, GAD, GAC, GAA, GAB).
+
+    - -2 обозначает, что данные относятся к продукту уровня 2 миссии GRACE.
+
+    - YYYYDOY обозначает начальную дату (год и день года) диапазона измерений.
+
+    - yyyydoy обозначает конечную дату (год и день года) диапазона измерений.
+
+    - ndays — количество календарных дней, использованных для получения месячной оценки.
+
+    - mssn — миссия: GRAC для GRACE и GRFO для GRACE Follow-On.
+
+    - center — строка, специфичная для учреждения (UTCSR для CSR, JPLEM для JPL Spherical Harmonics, JPLMSC для JPL Mascons, EIGEN или GFZOP для GFZ).
+
+    - flag — строка из 4 символов, зависящая от центра обработки данных (CSR обозначает максимальную степень и, возможно, максимальный порядок решений, JPL обозначает промежуточный выпуск данных, GFZ обозначает ограниченные или неограниченные решения). Для выпуска Release-6 и последующих этот флаг обозначает процессинг.
+
+    - rrrr — строка из 4 символов, обозначающая выпуск, обычно представляющая собой 4-значное число (в наборах данных GFZ может обозначать промежуточные выпуски в 4-м символе).
+    </div>
+    """, unsafe_allow_html=True)
+
+    st.write("""
+    <div style="text-align: center; margin-bottom: 20px;">
+        <h2>Синтез эквивалентного слоя воды по коэффициентам</h2>
+    </div>
+    """, unsafe_allow_html=True)
+
+    uploaded = st.file_uploader("Файлы SHM уровня 2 (GSM, gzip)", accept_multiple_files=True)
+    if uploaded:
+        resolution = st.select_slider('Шаг сетки (°)', options=[2.0, 1.0, 0.5, 0.25], value=1.0)
+        radius = st.slider('Радиус гауссова сглаживания (км)', 0, 500, 300, step=50)
+        files = tuple(sorted((f.name, f.getvalue()) for f in uploaded))
+        if len(files) < 2:
+            st.write("Для расчета аномалий загрузите не менее двух месячных решений.")
+        else:
+            with span('synthesize', files=len(files), resolution=resolution):
+                names, lat, lon, ewh = synthesize_uploaded(files, resolution, radius)
+            index = st.selectbox('Решение', range(len(names)), format_func=lambda i: names[i])
+            limit = float(np.nanmax(np.abs(ewh)))
+            fig, ax = plt.subplots(figsize=(10, 5))
+            mesh = ax.pcolormesh(lon, lat, ewh[index], cmap='RdBu', vmin=-limit, vmax=limit)
+            fig.colorbar(mesh, ax=ax, label='Эквивалентный слой воды (см)')
+            ax.set_xlabel('Долгота')
+            ax.set_ylabel('Широта')
+            with span('st.pyplot'):
+                st.pyplot(fig)
+
+    if os.path.exists(GRACE_CUBE_PATH):
+        grace_cube_section(GRACE_CUBE_PATH)
+
+def grace_export_section(manifest):
+    if len(manifest) == 0:
+        st.info("Архив GRACE пуст: экспортировать нечего.")
+        return
+    with st.expander("Экспорт анимации"):
+        start, end = st.select_slider('Диапазон дат', options=manifest.labels,
+                                      value=(manifest.labels[0], manifest.labels[-1]))
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            fmt = st.selectbox('Формат', available_formats())
+        with col2:
+            scale = st.select_slider('Масштаб', options=[0.25, 0.5, 0.75, 1.0], value=0.5)
+        with col3:
+            fps = st.number_input('Кадров в секунду', min_value=1, max_value=30, value=8)
+        caption = st.checkbox('Подписывать дату', value=True)
+
+        if st.button('Сформировать анимацию'):
+            frames = manifest.between(start.replace('_', '-'), end.replace('_', '-'))
+            labels = manifest.labels[frames]
+            paths = [manifest.path(label) for label in labels]
+            captions = [label.replace('_', '-') for label in labels] if caption else None
+            # Кадры декодируются на пуле процессов и сразу передаются кодировщику
+            with tempfile.TemporaryDirectory() as tmp:
+                output = os.path.join(tmp, f"grace.{fmt}")
+                with st.spinner('Формирование анимации...'):
+                    with span('export_timelapse', frames=len(paths), fmt=fmt):
+                        export_timelapse(paths, output, fmt, fps=fps, scale=scale, captions=captions,
+                                         source_size=manifest.dimensions[frames.start])
+                with open(output, 'rb') as f:
+                    content = f.read()
+            st.download_button('Скачать', content, file_name=f"GRACE_{start}_{end}.{fmt}")
+
+# Куб аномалий, собранный командой: python grace_cube.py GSM-2_*.gz -o GRACE/grace_cube.nc
+GRACE_CUBE_PATH = os.path.join("GRACE", "grace_cube.nc")
+
+def grace_cube_section(path):
+    st.write("""
+    <div style="text-align: center; margin-bottom: 20px;">
+        <h2>Временной ряд в точке</h2>
+    </div>
+    """, unsafe_allow_html=True)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        latitude = st.number_input('Широта', min_value=-90.0, max_value=90.0, value=55.75)
+    with col2:
+        longitude = st.number_input('Долгота', min_value=-180.0, max_value=180.0, value=37.62)
+
+    # Из куба читаются только чанки, содержащие выбранный пиксель
+    with span('cube_series'), GraceCube(path) as cube:
+        series = cube.pixel_series(latitude, longitude)
+        dates = cube.dates
+    st.line_chart({'Эквивалентный слой воды (см)': dict(zip(dates, series))})
+
+    field = st.selectbox('Карта', ['trend', 'amplitude'],
+                         format_func={'trend': 'Тренд (см/год)', 'amplitude': 'Амплитуда сезонного сигнала (см)'}.get)
+    with span('cube_maps'):
+        lat, lon, maps = grace_cube_maps(path, os.path.getmtime(path))
+    fig, ax = plt.subplots(figsize=(10, 5))
+    cmap = 'RdBu' if field == 'trend' else 'viridis'
+    mesh = ax.pcolormesh(lon, lat, maps[field], cmap=cmap)
+    fig.colorbar(mesh, ax=ax)
+    with span('st.pyplot'):
+        st.pyplot(fig)
+
+# Карты тренда и амплитуды считаются по чанкам и кэшируются до изменения файла
+@st.cache_data(max_entries=2)
+def grace_cube_maps(path, mtime):
+    with GraceCube(path) as cube:
+        return cube.latitudes, cube.longitudes, cube.harmonic_fit()
+
+# Разбор и синтез загруженных решений; функции Лежандра кэшируются в grace_shm
+@st.cache_data(max_entries=4)
+def synthesize_uploaded(files, resolution, radius):
+    solutions = [parse_shm(io.BytesIO(content), name) for name, content in files]
+    solutions.sort(key=lambda s: (s['info'] is None, s['info']['start'] if s['info'] else s['name']))
+    lat, lon, ewh = synthesize_solutions(solutions, resolution, radius=radius)
+    return [s['name'] for s in solutions], lat, lon, ewh
+
+
+def warm_up():
+    """
+    Предварительная загрузка манифеста снимков (выполняется в фоне после первой отрисовки).
+    """
+    get_manifest("GRACE")
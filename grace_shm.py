@@ -0,0 +1,226 @@
+import gzip
+import io
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+
+# Параметры Земли для пересчета коэффициентов в эквивалентный слой воды
+EARTH_RADIUS = 6378136.3  # Экваториальный радиус, м
+EARTH_DENSITY = 5517.0  # Средняя плотность Земли, кг/м^3
+WATER_DENSITY = 1000.0  # Плотность воды, кг/м^3
+
+# Нагрузочные числа Лява k_l (Wahr et al., 1998), между узлами - линейная интерполяция
+_LOVE_DEGREES = np.array([0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 12, 15, 20, 30, 40, 50, 70, 100, 150, 200])
+_LOVE_K = np.array([0.0, 0.027, -0.303, -0.194, -0.132, -0.104, -0.089, -0.081, -0.076, -0.072, -0.069,
+                    -0.064, -0.058, -0.051, -0.040, -0.033, -0.027, -0.020, -0.014, -0.010, -0.007])
+
+# PID-2_YYYYDOY-yyyydoy_ndays|mssn_center_flag_rrrr
+_FILENAME_PATTERN = re.compile(
+    r'^(?P<pid>[A-Z]{3})-2_(?P<start>\d{7})-(?P<end>\d{7})_(?P<span>\w{4})_(?P<center>[A-Z]+)_(?P<flag>\w{4})_(?P<release>\w{4})'
+)
+_RECORD_KEYS = ('GRCOF2', 'gfc', 'gfct')
+
+
+def _doy_to_datetime(value):
+    return datetime(int(value[:4]), 1, 1) + timedelta(days=int(value[4:]) - 1)
+
+
+def parse_filename(filename):
+    """
+    Разбирает имя файла продукта уровня 2. Возвращает словарь с полями
+    pid, start, end (datetime), span, center, flag, release или None.
+    """
+    match = _FILENAME_PATTERN.match(os.path.basename(filename))
+    if match is None:
+        return None
+    info = match.groupdict()
+    info['start'] = _doy_to_datetime(info['start'])
+    info['end'] = _doy_to_datetime(info['end'])
+    return info
+
+
+def _open_text(source):
+    # Поддерживаются пути и двоичные файловые объекты, сжатые gzip или нет
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            magic = f.read(2)
+        raw = open(source, 'rb')
+    else:
+        raw = source
+        magic = raw.read(2)
+        raw.seek(0)
+    if magic == b'\x1f\x8b':
+        raw = gzip.open(raw, 'rb')
+    return io.TextIOWrapper(raw, encoding='ascii', errors='replace')
+
+
+def parse_shm(source, name=None):
+    """
+    Потоково читает файл коэффициентов сферических гармоник (GRCOF2/gfc).
+    Возвращает словарь с матрицами C и S формы (lmax + 1, lmax + 1),
+    максимальной степенью lmax и сведениями из имени файла.
+    """
+    if name is None:
+        name = source if isinstance(source, (str, os.PathLike)) else getattr(source, 'name', '')
+    degrees, orders, cnm, snm = [], [], [], []
+    with _open_text(source) as text:
+        for line in text:
+            parts = line.split()
+            if not parts or parts[0] not in _RECORD_KEYS:
+                continue
+            degrees.append(int(parts[1]))
+            orders.append(int(parts[2]))
+            cnm.append(float(parts[3].replace('D', 'E')))
+            snm.append(float(parts[4].replace('D', 'E')))
+    if not degrees:
+        raise ValueError(f"В файле {name} нет записей коэффициентов")
+
+    degrees = np.array(degrees)
+    orders = np.array(orders)
+    lmax = int(degrees.max())
+    C = np.zeros((lmax + 1, lmax + 1))
+    S = np.zeros((lmax + 1, lmax + 1))
+    C[degrees, orders] = cnm
+    S[degrees, orders] = snm
+    return dict(C=C, S=S, lmax=lmax, info=parse_filename(str(name)), name=os.path.basename(str(name)))
+
+
+def love_numbers(lmax):
+    """
+    Нагрузочные числа Лява k_l для степеней 0..lmax.
+    """
+    return np.interp(np.arange(lmax + 1), _LOVE_DEGREES, _LOVE_K)
+
+
+def gaussian_weights(lmax, radius):
+    """
+    Веса гауссова сглаживания (Jekeli) для радиуса radius в км.
+    """
+    weights = np.ones(lmax + 1)
+    if not radius:
+        return weights
+    b = np.log(2) / (1 - np.cos(radius * 1000 / EARTH_RADIUS))
+    weights[1] = (1 + np.exp(-2 * b)) / (1 - np.exp(-2 * b)) - 1 / b
+    for l in range(1, lmax):
+        weights[l + 1] = -(2 * l + 1) / b * weights[l] + weights[l - 1]
+        # Рекурсия неустойчива на высоких степенях: малые веса обнуляются
+        if weights[l + 1] < 1e-10 or weights[l + 1] > weights[l]:
+            weights[l + 1:] = 0
+            break
+    return weights
+
+
+def _legendre(latitudes, lmax):
+    # Полностью нормированные присоединенные функции Лежандра P[l, m, широта]
+    phi = np.radians(latitudes)
+    t = np.sin(phi)
+    u = np.cos(phi)
+    P = np.zeros((lmax + 1, lmax + 1, len(latitudes)))
+    P[0, 0] = 1.0
+    if lmax == 0:
+        return P
+    P[1, 1] = np.sqrt(3.0) * u
+    for m in range(2, lmax + 1):
+        P[m, m] = np.sqrt((2 * m + 1) / (2 * m)) * u * P[m - 1, m - 1]
+    for m in range(lmax):
+        P[m + 1, m] = np.sqrt(2 * m + 3) * t * P[m, m]
+    # Рекурсия по степени векторизована по всем порядкам m <= l - 2
+    for l in range(2, lmax + 1):
+        m = np.arange(l - 1)
+        a = np.sqrt((2 * l - 1) * (2 * l + 1) / ((l - m) * (l + m)))
+        b = np.sqrt((2 * l + 1) * (l + m - 1) * (l - m - 1) / ((l - m) * (l + m) * (2 * l - 3)))
+        P[l, :l - 1] = a[:, None] * t * P[l - 1, :l - 1] - b[:, None] * P[l - 2, :l - 1]
+    return P
+
+
+_legendre_cache = {}
+_legendre_lock = threading.Lock()
+
+
+def legendre(latitudes, lmax, max_entries=8):
+    """
+    Функции Лежандра для сетки широт, кэшированные по (сетка широт, lmax)
+    и общие для всех месячных решений.
+    """
+    latitudes = np.ascontiguousarray(latitudes, dtype=float)
+    key = (latitudes.tobytes(), lmax)
+    with _legendre_lock:
+        P = _legendre_cache.get(key)
+        if P is None:
+            P = _legendre(latitudes, lmax)
+            P.setflags(write=False)
+            _legendre_cache[key] = P
+            while len(_legendre_cache) > max_entries:
+                _legendre_cache.pop(next(iter(_legendre_cache)))
+    return P
+
+
+def grid(resolution=1.0):
+    """
+    Центры ячеек глобальной сетки заданного шага в градусах: (широты, долготы).
+    """
+    latitudes = np.arange(-90 + resolution / 2, 90, resolution)
+    longitudes = np.arange(-180 + resolution / 2, 180, resolution)
+    return latitudes, longitudes
+
+
+def mean_coefficients(solutions):
+    """
+    Средние коэффициенты C и S по набору решений (для вычисления аномалий).
+    """
+    lmax = min(solution['lmax'] for solution in solutions)
+    C = np.mean([solution['C'][:lmax + 1, :lmax + 1] for solution in solutions], axis=0)
+    S = np.mean([solution['S'][:lmax + 1, :lmax + 1] for solution in solutions], axis=0)
+    return C, S
+
+
+def synthesize_ewh(dC, dS, latitudes, longitudes, lmax=None, radius=0):
+    """
+    Эквивалентный слой воды (см) по аномалиям коэффициентов.
+    dC, dS - массивы формы (lmax + 1, lmax + 1) или (месяцы, lmax + 1, lmax + 1);
+    все месяцы синтезируются одним матричным произведением.
+    Возвращает массив (широта, долгота) или (месяцы, широта, долгота).
+    """
+    dC = np.asarray(dC, dtype=float)
+    dS = np.asarray(dS, dtype=float)
+    single = dC.ndim == 2
+    if single:
+        dC, dS = dC[None], dS[None]
+    if lmax is None:
+        lmax = dC.shape[1] - 1
+    dC = dC[:, :lmax + 1, :lmax + 1]
+    dS = dS[:, :lmax + 1, :lmax + 1]
+
+    l = np.arange(lmax + 1)
+    factor = EARTH_RADIUS * EARTH_DENSITY / (3 * WATER_DENSITY) * 100  # м -> см
+    weights = factor * (2 * l + 1) / (1 + love_numbers(lmax)) * gaussian_weights(lmax, radius)
+    weights[0] = 0.0  # Масса Земли постоянна: нулевая степень не синтезируется
+
+    P = legendre(latitudes, lmax)
+    # Суммирование по степени: A[t, широта, m] = sum_l w_l C[t, l, m] P[l, m, широта]
+    A = np.einsum('tlm,lmk->tkm', dC * weights[:, None], P, optimize=True)
+    B = np.einsum('tlm,lmk->tkm', dS * weights[:, None], P, optimize=True)
+    mlon = np.outer(np.arange(lmax + 1), np.radians(longitudes))
+    ewh = A @ np.cos(mlon) + B @ np.sin(mlon)
+    return ewh[0] if single else ewh
+
+
+def synthesize_solutions(solutions, resolution=1.0, lmax=None, radius=300, mean=None):
+    """
+    Синтезирует аномалии эквивалентного слоя воды для списка решений parse_shm
+    относительно среднего поля mean (по умолчанию - среднее по решениям).
+    Возвращает (широты, долготы, массив (месяцы, широта, долгота)).
+    """
+    if lmax is None:
+        lmax = min(solution['lmax'] for solution in solutions)
+    if mean is None:
+        mean = mean_coefficients(solutions)
+    mean_C, mean_S = mean
+    dC = np.stack([solution['C'][:lmax + 1, :lmax + 1] - mean_C[:lmax + 1, :lmax + 1] for solution in solutions])
+    dS = np.stack([solution['S'][:lmax + 1, :lmax + 1] - mean_S[:lmax + 1, :lmax + 1] for solution in solutions])
+    latitudes, longitudes = grid(resolution)
+    return latitudes, longitudes, synthesize_ewh(dC, dS, latitudes, longitudes, lmax, radius)
@@ -37,3 +37,201 @@ def talwani(x1, x2, z1, z2, density):
     grav = 2 * G * density * zz * 1e5
     return -grav  
 
+
+
+# Векторизованный вариант talwani: массивы рёбер вместо скаляров
+def talwani_edges(x1, x2, z1, z2):
+    """
+    Линейный интеграл Талвани для массивов рёбер (без множителя 2Gρ).
+    Аргументы транслируются numpy, особые случаи обрабатываются так же, как в talwani.
+    """
+    epsilon = 1e-6
+    x1 = np.asarray(x1, dtype=float)
+    x2 = np.asarray(x2, dtype=float)
+    z1 = np.asarray(z1, dtype=float)
+    z2 = np.asarray(z2, dtype=float)
+    x1 = np.where(x1 == 0, x1 + epsilon, x1)
+    x2 = np.where(x2 == 0, x2 + epsilon, x2)
+    x2 = np.where((x2 - x1) == 0, x1 - epsilon, x2)
+    denom = z2 - z1
+    denom = np.where(denom == 0, epsilon, denom)
+    alpha = (x2 - x1) / denom
+    beta = (x1 * z2 - x2 * z1) / denom
+    factor = beta / (1 + alpha * alpha)
+    r1sq = (x1 * x1 + z1 * z1)
+    r2sq = (x2 * x2 + z2 * z2)
+    term1 = 0.5 * (np.log(r2sq) - np.log(r1sq))
+    term2 = np.arctan2(z2, x2) - np.arctan2(z1, x1)
+    return factor * (term1 - alpha * term2)
+
+# Сборка рёбер всех тел в плоские массивы
+def polygon_edges(polygons, densities):
+    """
+    Преобразует список многоугольников (массивы вершин (n, 2): x, z в метрах)
+    в массивы начал и концов рёбер и плотность каждого ребра.
+    """
+    if len(polygons) != len(densities):
+        raise ValueError("Количество плотностей должно совпадать с количеством тел")
+    starts, ends, edge_density = [], [], []
+    for vertices, density in zip(polygons, densities):
+        vertices = np.asarray(vertices, dtype=float)
+        if vertices.ndim != 2 or vertices.shape[1] != 2 or len(vertices) < 3:
+            raise ValueError("Многоугольник задаётся массивом не менее чем из 3 вершин (x, z)")
+        starts.append(vertices)
+        ends.append(np.roll(vertices, -1, axis=0))
+        edge_density.append(np.full(len(vertices), float(density)))
+    return np.concatenate(starts), np.concatenate(ends), np.concatenate(edge_density)
+
+# Гравитационная аномалия нескольких тел в профиле станций
+def talwani_profile(stations, polygons, densities, station_z=0.0):
+    """
+    Рассчитывает аномалию (mGal) в точках профиля stations (м) от набора
+    многоугольников с произвольным числом вершин и своей плотностью каждый.
+    Расчет выполняется одним транслируемым вызовом для всех станций и рёбер.
+    """
+    stations = np.atleast_1d(np.asarray(stations, dtype=float))
+    start, end, edge_density = polygon_edges(polygons, densities)
+    x1 = start[:, 0] - stations[:, None]
+    x2 = end[:, 0] - stations[:, None]
+    z1 = start[:, 1] - station_z
+    z2 = end[:, 1] - station_z
+    zz = talwani_edges(x1, x2, z1, z2)
+    G = 6.67e-11
+    return -2 * G * 1e5 * (zz @ edge_density)
+
+# Линейный интеграл Талвани вместе с аналитическими производными по координатам концов ребра
+def talwani_edges_jacobian(x1, x2, z1, z2):
+    """
+    Возвращает линейный интеграл (как talwani_edges) и его производные
+    по (x1, z1, x2, z2) - массив формы (4, ...). Интеграл записан в виде
+    N / L^2 * (dz ln(r2/r1) + dx (theta1 - theta2)), N = x1 z2 - x2 z1, L^2 = dx^2 + dz^2,
+    без деления на z2 - z1, поэтому производные конечны и для горизонтальных рёбер.
+    """
+    epsilon = 1e-6
+    x1 = np.asarray(x1, dtype=float)
+    x2 = np.asarray(x2, dtype=float)
+    z1 = np.asarray(z1, dtype=float)
+    z2 = np.asarray(z2, dtype=float)
+    x1 = np.where(x1 == 0, x1 + epsilon, x1)
+    x2 = np.where(x2 == 0, x2 + epsilon, x2)
+    dx = x2 - x1
+    dz = z2 - z1
+    r1sq = x1 * x1 + z1 * z1
+    r2sq = x2 * x2 + z2 * z2
+    lsq = dx * dx + dz * dz
+    lsq = np.where(lsq == 0, epsilon, lsq)
+    n = x1 * z2 - x2 * z1
+    log_ratio = 0.5 * (np.log(r2sq) - np.log(r1sq))
+    dtheta = np.arctan2(z1, x1) - np.arctan2(z2, x2)
+    c = n / lsq
+    s = dz * log_ratio + dx * dtheta
+    zz = c * s
+
+    # Производные по x1, z1, x2, z2 (в этом порядке)
+    dn = (z2, -x2, -z1, x1)
+    dlsq = (-2 * dx, -2 * dz, 2 * dx, 2 * dz)
+    dlog = (-x1 / r1sq, -z1 / r1sq, x2 / r2sq, z2 / r2sq)
+    dth = (-z1 / r1sq, x1 / r1sq, z2 / r2sq, -x2 / r2sq)
+    ddx = (-1, 0, 1, 0)
+    ddz = (0, -1, 0, 1)
+    jacobian = np.stack([
+        (dn[k] - c * dlsq[k]) / lsq * s + c * (ddz[k] * log_ratio + dz * dlog[k] + ddx[k] * dtheta + dx * dth[k])
+        for k in range(4)
+    ])
+    return zz, jacobian
+
+# Модель профиля с кэшем вкладов рёбер для интерактивного редактирования
+class ProfileModel:
+    """
+    Несколько многоугольных тел на профиле станций. Для каждого тела хранятся
+    линейные интегралы всех рёбер во всех станциях и их суммы: перемещение вершины
+    пересчитывает только два примыкающих ребра, изменение плотности - только масштаб.
+    """
+
+    def __init__(self, stations=(), station_z=0.0):
+        self.stations = np.atleast_1d(np.asarray(stations, dtype=float))
+        self.station_z = station_z
+        self.bodies = []
+        self.densities = []
+        self._edges = []  # (станция, ребро) для каждого тела
+        self._sums = []  # сумма по рёбрам для каждого тела
+        self.recomputed = 0  # число рёбер, пересчитанных последним обновлением
+
+    def _edge_integrals(self, vertices, edges):
+        start = vertices[edges]
+        end = vertices[(edges + 1) % len(vertices)]
+        return talwani_edges(start[:, 0] - self.stations[:, None], end[:, 0] - self.stations[:, None],
+                             start[:, 1] - self.station_z, end[:, 1] - self.station_z)
+
+    def _rebuild(self, index):
+        vertices = self.bodies[index]
+        self._edges[index] = self._edge_integrals(vertices, np.arange(len(vertices)))
+        self._sums[index] = self._edges[index].sum(axis=1)
+        self.recomputed += len(vertices)
+
+    def set_stations(self, stations, station_z=0.0):
+        """
+        Задает станции профиля; при их изменении все тела пересчитываются заново.
+        """
+        stations = np.atleast_1d(np.asarray(stations, dtype=float))
+        self.recomputed = 0
+        if station_z == self.station_z and np.array_equal(stations, self.stations):
+            return
+        self.stations = stations
+        self.station_z = station_z
+        for index in range(len(self.bodies)):
+            self._rebuild(index)
+
+    def set_body(self, index, vertices, density):
+        """
+        Добавляет тело index (index == числу тел) или обновляет его вершины и плотность.
+        Пересчитываются рёбра, примыкающие к изменившимся вершинам; при изменении
+        числа вершин тело пересчитывается целиком.
+        """
+        vertices = np.array(vertices, dtype=float)
+        if vertices.ndim != 2 or vertices.shape[1] != 2 or len(vertices) < 3:
+            raise ValueError("Многоугольник задаётся массивом не менее чем из 3 вершин (x, z)")
+        self.recomputed = 0
+        if index == len(self.bodies):
+            self.bodies.append(vertices)
+            self.densities.append(float(density))
+            self._edges.append(None)
+            self._sums.append(None)
+            self._rebuild(index)
+            return
+        self.densities[index] = float(density)
+        previous = self.bodies[index]
+        self.bodies[index] = vertices
+        if previous.shape != vertices.shape:
+            self._rebuild(index)
+            return
+        changed = np.flatnonzero((previous != vertices).any(axis=1))
+        if changed.size == 0:
+            return
+        # Вершина i - начало ребра i и конец ребра i - 1
+        edges = np.unique(np.concatenate([changed, (changed - 1) % len(vertices)]))
+        edge_integrals = self._edges[index]
+        old = edge_integrals[:, edges].sum(axis=1)
+        edge_integrals[:, edges] = self._edge_integrals(vertices, edges)
+        self._sums[index] = self._sums[index] - old + edge_integrals[:, edges].sum(axis=1)
+        self.recomputed = len(edges)
+
+    def truncate(self, count):
+        """
+        Оставляет первые count тел.
+        """
+        for items in (self.bodies, self.densities, self._edges, self._sums):
+            del items[count:]
+
+    def body_gravity(self, index):
+        G = 6.67e-11
+        return -2 * G * 1e5 * self.densities[index] * self._sums[index]
+
+    def gravity(self):
+        """
+        Аномалия (mGal) всех тел в станциях профиля - то же, что talwani_profile.
+        """
+        total = np.zeros(len(self.stations))
+        for index in range(len(self.bodies)):
+            total += self.body_gravity(index)
+        return total
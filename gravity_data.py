@@ -0,0 +1,201 @@
+import glob
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+import xarray as xr
+import boule as bl
+
+from terrain import add_terrain_correction
+from mmap_store import write_store, open_store, is_store, META
+from tracing import span
+
+
+DATA_PATH = './Gravity/hawaii-gravity.nc'
+G = 6.67430e-11  # Гравитационная постоянная в м^3 кг^-1 с^-2
+BOUGUER_DENSITY = 2670.0  # Плотность пластины Буге в кг/м^3
+DERIVED_FIELDS = ('normal_gravity', 'gravity_disturbance', 'bouguer_plate_correction', 'gravity_bouguer',
+                  'terrain_correction', 'gravity_bouguer_complete')
+
+# Режим хранения: 'memory' - набор в памяти процесса, 'mmap' - каталог файлов .npy,
+# отображаемых в память только для чтения и общих для всех процессов сервера.
+# GRAVITY_DATA_FLOAT32=1 хранит производные поля в float32.
+STORAGE = os.environ.get('GRAVITY_DATA_STORAGE', 'memory')
+FLOAT32 = os.environ.get('GRAVITY_DATA_FLOAT32', '0') == '1'
+
+# Кэш процесса: общий для всех сессий Streamlit внутри одного сервера
+_datasets = {}
+_lock = threading.Lock()
+
+
+POINT_FIELDS = DERIVED_FIELDS[:4]
+
+
+def compute_point_fields(data, ellipsoid=bl.WGS84, density=BOUGUER_DENSITY):
+    """
+    Добавляет в набор данных нормальную силу тяжести, возмущение,
+    поправку за плиту Буге и редукцию Буге. Все они вычисляются поточечно,
+    поэтому функцию можно применять к любому фрагменту сетки.
+    """
+    with span('normal_gravity'):
+        data['normal_gravity'] = ellipsoid.normal_gravity(data.latitude, data.h_over_ellipsoid)
+    data['gravity_disturbance'] = data.gravity_earth - data['normal_gravity']
+    data['bouguer_plate_correction'] = 2 * np.pi * G * density * data['topography_grd'] * 1e5  # преобразование из м/с^2 в mGal
+    data['gravity_bouguer'] = data['gravity_disturbance'] - data['bouguer_plate_correction']
+    return data
+
+
+def compute_derived_fields(data, ellipsoid=bl.WGS84, density=BOUGUER_DENSITY):
+    """
+    Добавляет поточечные поля compute_point_fields, поправку за рельеф
+    и полную редукцию Буге (требует всей сетки).
+    """
+    compute_point_fields(data, ellipsoid, density)
+    with span('terrain_correction'):
+        add_terrain_correction(data, density)
+    return data
+
+
+def dataset_key(path, ellipsoid='WGS84', density=BOUGUER_DENSITY):
+    """
+    Ключ кэша: путь к файлу, время его изменения, эллипсоид и плотность.
+    """
+    return (os.path.abspath(path), os.path.getmtime(path), ellipsoid, float(density))
+
+
+def sidecar_path(path, key):
+    """
+    Путь к файлу-спутнику с уже рассчитанными полями для данного ключа.
+    """
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()[:12]
+    root, _ = os.path.splitext(path)
+    return f"{root}.derived-{digest}.nc"
+
+
+def shared_path(path, key):
+    """
+    Путь к каталогу отображаемого в память набора для данного ключа.
+    """
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()[:12]
+    root, _ = os.path.splitext(path)
+    return f"{root}.shared-{digest}"
+
+
+def _read_sidecar(path):
+    with xr.open_dataset(path) as ds:
+        data = ds.load()
+    if not all(field in data for field in DERIVED_FIELDS):
+        return None
+    return data
+
+
+def _write_sidecar(data, path):
+    # Запись через временный файл, чтобы параллельные процессы не прочли недописанный файл
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        data.to_netcdf(tmp_path)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _compute_dataset(path, key, ellipsoid, density, sidecar):
+    # Набор с производными полями: из файла-спутника или расчетом
+    cached_path = sidecar_path(path, key)
+    data = None
+    if sidecar and os.path.exists(cached_path):
+        with span('read_sidecar'):
+            data = _read_sidecar(cached_path)
+    if data is None:
+        with span('read_netcdf', path=path):
+            with xr.open_dataset(path) as ds:
+                data = ds.load()
+        compute_derived_fields(data, getattr(bl, ellipsoid), density)
+        if sidecar:
+            _write_sidecar(data, cached_path)
+    return data
+
+
+def remove_stale_stores(path, directory=None):
+    """
+    Удаляет каталоги <root>.shared-* файла (рядом с ним или в directory), созданные
+    до его последнего изменения: они построены по прежней версии файла и больше не откроются.
+    """
+    root = os.path.splitext(os.path.basename(path))[0]
+    directory = directory or os.path.dirname(os.path.abspath(path))
+    source_mtime = os.path.getmtime(path)
+    for store in glob.glob(os.path.join(glob.escape(directory), f"{glob.escape(root)}.shared-*")):
+        meta = os.path.join(store, META)
+        try:
+            stale = os.path.getmtime(meta) < source_mtime
+        except OSError:
+            continue
+        if stale:
+            shutil.rmtree(store, ignore_errors=True)
+
+
+def _open_shared(path, key, ellipsoid, density, sidecar, float32):
+    # Каталог рядом с файлом, при отсутствии прав на запись - во временном каталоге системы;
+    # если записать не удалось нигде, набор остается в памяти процесса
+    name = os.path.basename(shared_path(path, key + (float32,)))
+    candidates = [os.path.join(os.path.dirname(os.path.abspath(path)), name),
+                  os.path.join(tempfile.gettempdir(), 'gravity-data', name)]
+    data = None
+    for store in candidates:
+        if is_store(store):
+            return open_store(store)
+        if data is None:
+            data = _compute_dataset(path, key, ellipsoid, density, sidecar)
+        try:
+            os.makedirs(os.path.dirname(store), exist_ok=True)
+            write_store(data, store, DERIVED_FIELDS if float32 else ())
+        except OSError:
+            continue
+        remove_stale_stores(path, os.path.dirname(store))
+        return open_store(store)
+    if float32:
+        for field in DERIVED_FIELDS:
+            data[field] = data[field].astype(np.float32)
+    return data
+
+
+def load_dataset(path=DATA_PATH, ellipsoid='WGS84', density=BOUGUER_DENSITY, sidecar=True, storage=None, float32=None):
+    """
+    Возвращает набор данных с производными полями.
+    Расчет выполняется один раз на ключ (путь, mtime, эллипсоид, плотность),
+    результат хранится в памяти процесса и, при sidecar=True, в файле-спутнике.
+    При storage='mmap' поля записываются один раз в каталог рядом с файлом и
+    открываются как представления mmap: все процессы разделяют одни страницы памяти.
+    float32=True хранит производные поля в float32.
+    Возвращаемый набор общий для всех сессий и не должен изменяться.
+    """
+    storage = storage or STORAGE
+    float32 = FLOAT32 if float32 is None else float32
+    base_key = dataset_key(path, ellipsoid, density)
+    key = base_key + (storage, float32)
+    data = _datasets.get(key)
+    if data is not None:
+        return data
+    with _lock:
+        data = _datasets.get(key)
+        if data is not None:
+            return data
+        if storage == 'mmap':
+            data = _open_shared(path, base_key, ellipsoid, density, sidecar, float32)
+        else:
+            data = _compute_dataset(path, base_key, ellipsoid, density, sidecar)
+            if float32:
+                for field in DERIVED_FIELDS:
+                    data[field] = data[field].astype(np.float32)
+        # Источник и ключ набора: по ним находятся записанные заранее производные файлы (пирамида)
+        data.encoding.update(source=os.path.abspath(path), dataset_key=repr(base_key))
+        # Версии того же файла с прежним mtime устарели; наборы с другими параметрами остаются
+        for old_key in [k for k in _datasets if k[0] == key[0] and k[1] != key[1]]:
+            del _datasets[old_key]
+        _datasets[key] = data
+    return data
+
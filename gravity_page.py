@@ -0,0 +1,287 @@
+import io
+
+import streamlit as st
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.patches import Polygon
+
+from gravity import ProfileModel
+from inversion import invert_profile, orient
+from tracing import span, traced
+
+
+MAX_BODIES = 5
+BODY_COLORS = ('r', 'b', 'g', 'm', 'c')
+# Ширина оси рисунка и шаг станций профиля (в единицах рисунка): сетка станций не зависит
+# от вершин, поэтому правка тела пересчитывает только его изменившиеся рёбра
+X_EXTENT = 600
+STATION_STEP = 10
+
+
+def model_figure(n_bodies, x_zero, depth_zero, mgal_zero):
+    """
+    Рисунок модели, хранимый в сессии: при правке меняются только данные
+    многоугольников и точек аномалии, оси и подписи создаются один раз.
+    """
+    figure = st.session_state.get('talwani_figure')
+    if figure is None:
+        fig = Figure()
+        ax = fig.subplots()
+        ax.set_xlim(0, X_EXTENT)
+        ax.set_ylim(0, 480)
+        ax.axhline(y=depth_zero, color='k')
+        ax.axhline(y=mgal_zero, color='k')
+        ax.axvline(x=x_zero, color='k')
+        ax.set_xlabel('Расстояние (км)')
+        ax.set_ylabel('Глубина (км)')
+        ax.set_title('Гравитационный потенциал')
+        points, = ax.plot([], [], 'ro')
+        figure = dict(figure=fig, axes=ax, points=points, patches=[])
+        st.session_state['talwani_figure'] = figure
+    patches = figure['patches']
+    while len(patches) < n_bodies:
+        color = BODY_COLORS[len(patches) % len(BODY_COLORS)]
+        patches.append(figure['axes'].add_patch(Polygon(np.zeros((3, 2)), closed=True, fill=None, edgecolor=color)))
+    while len(patches) > n_bodies:
+        patches.pop().remove()
+    return figure
+
+
+@traced('page')
+def gravity_app():
+    st.write("""
+    <div style="text-align: justify; margin-bottom: 20px;">
+    Маник Талвани разработал метод расчет гравитационной аномалии, обусловленной многоугольным телом в вертикальном поперечном сечении.
+    При расчете модели используется контурный интеграл. 
+    Гравитационная аномалия определяется путем вычисления линейного интеграла вдоль каждого ребра многоугольника (тела). 
+    Результирующая гравитационная аномалия прямо пропорциональна сумме линейных интегралов и разнице плотности между телом и окружающей породой.
+    </div>
+    """, unsafe_allow_html=True)
+
+    density_contrast_default = 500.0
+    x_zero = 50
+    x_scale = 100  
+    depth_zero = 200  
+    depth_scale = 100  
+    mgal_zero = 190  
+    mgal_scale = 10
+
+    default_x = [100, 200, 200, 100]
+    default_y = [120, 120, 20, 20]
+
+    n_bodies = st.number_input('Количество тел', min_value=1, max_value=MAX_BODIES, value=1)
+    bodies = []
+    tabs = st.tabs([f'Тело {i + 1}' for i in range(n_bodies)])
+    for i, tab in enumerate(tabs):
+        with tab:
+            label = 'Плотность тела (кг/м2)' if i == 0 else f'Плотность тела {i + 1} (кг/м2)'
+            density = st.slider(label, -1000, 1000, int(density_contrast_default), key=f'talwani_density_{i}')
+            # Таблица вершин: правка одной ячейки меняет одну вершину модели
+            shift = 120 * i
+            table = st.data_editor({'X': [value + shift for value in default_x], 'Y': list(default_y)},
+                                   num_rows='dynamic', key=f'talwani_vertices_{i}')
+            bodies.append((density, table))
+
+    polygons = []
+    for density, table in bodies:
+        points = np.column_stack((np.asarray(table['X'], dtype=float), np.asarray(table['Y'], dtype=float)))
+        points = points[np.isfinite(points).all(axis=1)]
+        polygons.append((density, points))
+
+    # Все станции и рёбра считаются одним вызовом векторизованного движка;
+    # модель хранится в сессии и пересчитывает только изменившиеся рёбра
+    gravity_x = np.arange(x_zero, X_EXTENT, STATION_STEP)
+    model = st.session_state.setdefault('talwani_model', ProfileModel())
+    model.set_stations(gravity_x / x_scale * 1000)
+    recomputed = model.recomputed
+    try:
+        for i, (density, points) in enumerate(polygons):
+            vertices = np.column_stack((points[:, 0] / x_scale * 1000, (points[:, 1] - depth_zero) / depth_scale * 1000))
+            with span('talwani_update', body=i, vertices=len(vertices)):
+                model.set_body(i, vertices, density)
+            recomputed += model.recomputed
+    except ValueError as error:
+        st.write(f"Тело {i + 1}: {error}")
+        return
+    model.truncate(len(polygons))
+    with span('talwani_profile', stations=len(gravity_x)):
+        gravity = model.gravity()
+
+    figure = model_figure(len(polygons), x_zero, depth_zero, mgal_zero)
+    for patch, (_, points) in zip(figure['patches'], polygons):
+        patch.set_xy(points)
+    figure['points'].set_data(gravity_x, mgal_zero - gravity * mgal_scale)
+    with span('st.pyplot'):
+        st.pyplot(figure['figure'])
+    st.caption(f"Пересчитано рёбер: {recomputed}")
+
+    x, y = polygons[0][1][:, 0], polygons[0][1][:, 1]
+    density_contrast = polygons[0][0]
+
+    st.write("""
+    ### Инструкции
+    - Выберите количество тел и установите плотность каждого
+    - Введите координаты вершин в таблице тела; строки можно добавлять и удалять
+    - Точки должны располагаться в порядке обхода по часовой стрелке !
+    """)
+
+    inversion_section(x, y, density_contrast, x_scale, depth_zero, depth_scale)
+
+    st.write("""
+    <div style="text-align: center; margin-bottom: 20px;">
+        <h2>Листинг кода для вычиления гравитационного потенциала</h2>
+    </div>
+    """, unsafe_allow_html=True)
+
+    st.write("""
+    ```py
+    def talwani(x1, x2, z1, z2, density):
+        G = 6.67e-11
+        pi = np.pi
+        epsilon = 1e-6  
+        if x1 == 0:
+            x1 += epsilon
+        if x2 == 0:
+            x2 += epsilon
+        if (x2 - x1) == 0:
+            x2 = x1 - epsilon
+        denom = z2 - z1
+        if denom == 0:
+            denom = epsilon
+        alpha = (x2 - x1) / denom
+        beta = (x1 * z2 - x2 * z1) / denom
+        factor = beta / (1 + alpha * alpha)
+        r1sq = (x1 * x1 + z1 * z1)
+        r2sq = (x2 * x2 + z2 * z2)
+        term1 = 0.5 * (np.log(r2sq) - np.log(r1sq))
+        term2 = np.arctan2(z2, x2) - np.arctan2(z1, x1)
+        zz = factor * (term1 - alpha * term2)
+        grav = 2 * G * density * zz * 1e5
+        return -grav       
+    ```
+    """, unsafe_allow_html=True)
+
+
+def bouguer_profile():
+    """
+    Профиль редукции Буге по сетке Гавайев: расстояние (м) и значения (mGal).
+    По умолчанию берется срез, выбранный в разделе «Редукция Буге».
+    """
+    # Набор данных загружается только при выборе этого источника
+    from gravity_data import load_dataset
+    from profiles import get_profile_store
+    from fft_grid import EARTH_RADIUS
+
+    data = load_dataset()
+    store = get_profile_store(data, ['gravity_bouguer'])
+    selector = st.session_state.get('profile_selector')
+    cut = getattr(selector, 'cut', None) or ('latitude', None)
+    dims = list(store.dims)
+    dimension = st.selectbox("Профиль вдоль", dims, index=dims.index(cut[0]))
+    other = store.other_dim(dimension)
+    options = store.coords[other].tolist()
+    default = cut[1] if cut[1] is not None and cut[0] == dimension else options[len(options) // 2]
+    location = st.select_slider(f"на значении {other}", options=options, value=options[store.index(dimension, default)])
+    coords, profile = store.profile(dimension, location)
+    # Расстояние вдоль профиля по дуге; вдоль долготы - с учетом широты среза
+    scale = EARTH_RADIUS * np.pi / 180
+    if dimension == 'longitude':
+        scale *= np.cos(np.radians(location))
+    return (coords - coords[0]) * scale, profile['gravity_bouguer'].astype(float)
+
+
+def read_profile_csv(content):
+    """
+    Первые два числовых столбца CSV: расстояние (км) и аномалия (mGal); строки заголовка пропускаются.
+    """
+    table = np.genfromtxt(io.BytesIO(content), delimiter=',', invalid_raise=False)
+    table = np.atleast_2d(table)
+    if table.shape[1] < 2:
+        raise ValueError("В файле нужны два столбца: расстояние (км) и аномалия (mGal)")
+    table = table[np.isfinite(table[:, :2]).all(axis=1)]
+    order = np.argsort(table[:, 0])
+    return table[order, 0] * 1000, table[order, 1]
+
+
+def initial_body(distance, observed):
+    """
+    Начальное тело: прямоугольник под экстремумом аномалии шириной в пятую часть профиля.
+    """
+    length = distance[-1] - distance[0]
+    anomaly = observed - np.nanmedian(observed)
+    center = distance[np.nanargmax(np.abs(anomaly))]
+    half = length / 10
+    top, bottom = 0.05 * length, 0.15 * length
+    return orient([[center - half, top], [center + half, top], [center + half, bottom], [center - half, bottom]])
+
+
+def inversion_section(x, y, density_contrast, x_scale, depth_zero, depth_scale):
+    st.write("""
+    <div style="text-align: center; margin-bottom: 20px;">
+        <h2>Инверсия профиля</h2>
+    </div>
+    """, unsafe_allow_html=True)
+    if not st.checkbox("Подобрать тело по наблюденному профилю"):
+        return
+
+    source = st.radio("Наблюденный профиль", ["Редукция Буге (Гавайи)", "Файл CSV"], horizontal=True)
+    if source == "Файл CSV":
+        uploaded = st.file_uploader("CSV: расстояние (км), аномалия (mGal)", type=['csv', 'txt'])
+        if uploaded is None:
+            return
+        try:
+            distance, observed = read_profile_csv(uploaded.getvalue())
+        except ValueError as error:
+            st.write(str(error))
+            return
+    else:
+        distance, observed = bouguer_profile()
+    if len(distance) < 3:
+        st.write("В профиле слишком мало точек.")
+        return
+
+    start = st.radio("Начальное тело", ["Прямоугольник под экстремумом", "Вершины из полей выше"], horizontal=True)
+    if start == "Вершины из полей выше":
+        # Те же вершины, что и в прямой задаче, глубина - вниз от линии наблюдений
+        initial = orient(np.column_stack((np.asarray(x, dtype=float) / x_scale * 1000,
+                                          (depth_zero - np.asarray(y, dtype=float)) / depth_scale * 1000)))
+    else:
+        initial = initial_body(distance, observed)
+
+    col1, col2, col3 = st.columns(3)
+    fit_vertices = col1.checkbox("Вершины", value=True)
+    fit_density = col2.checkbox("Плотность", value=True)
+    fit_offset = col3.checkbox("Региональный уровень", value=True)
+    if not (fit_vertices or fit_density or fit_offset):
+        st.write("Выберите хотя бы один подбираемый параметр.")
+        return
+
+    with span('talwani_inversion', stations=len(distance), vertices=len(initial)):
+        result = invert_profile(distance, observed, initial, float(density_contrast), fit_vertices=fit_vertices,
+                                fit_density=fit_density, fit_offset=fit_offset, offset=float(np.nanmedian(observed)),
+                                z_limits=(0.0, np.inf))
+    st.write(f"Итераций: {result.iterations}, невязка (СКО): {result.history[0]:.3g} → {result.rms:.3g} mGal, "
+             f"плотность: {result.density:.0f} кг/м³, региональный уровень: {result.offset:.3g} mGal")
+    if result.stagnated:
+        st.warning("Подбор остановился: ни один шаг не уменьшает невязку, требуемая точность не достигнута")
+    elif not result.converged:
+        st.warning(f"Требуемая точность не достигнута за {result.iterations} итераций")
+
+    fig, (ax_profile, ax_body) = plt.subplots(2, 1, figsize=(10, 8), sharex=True)
+    km = distance / 1000
+    ax_profile.plot(km, observed, 'k.', markersize=3, label='Наблюденный')
+    ax_profile.plot(km, result.predicted, 'r-', label='Подобранный')
+    ax_profile.set_ylabel('mGal')
+    ax_profile.legend()
+    ax_profile.grid(True)
+    ax_body.add_patch(Polygon(initial / 1000, closed=True, fill=None, edgecolor='gray', linestyle='--', label='Начальное'))
+    ax_body.add_patch(Polygon(result.vertices / 1000, closed=True, alpha=0.5, color='r', label='Подобранное'))
+    depth = max(initial[:, 1].max(), result.vertices[:, 1].max()) / 1000
+    ax_body.set_ylim(depth * 1.1, 0)
+    ax_body.set_xlim(km.min(), km.max())
+    ax_body.set_xlabel('Расстояние (км)')
+    ax_body.set_ylabel('Глубина (км)')
+    ax_body.legend()
+    with span('st.pyplot'):
+        st.pyplot(fig)
@@ -1,5 +1,93 @@
+import glob
+import os
+import threading
+
+import numpy as np
 import streamlit as st
+from matplotlib.figure import Figure
+
+from bgs_stations import load_stations
+from bgs_grid import get_gridder
+from tracing import traced
+
+STATIONS_DIR = './landgrav_csv'
+MAX_NODES = 250000  # Наибольшее число узлов сетки на карте
+
+
+_stations = {}
+_stations_lock = threading.Lock()
+
+
+def get_stations(csv_path):
+    """
+    Хранилище станций CSV из памяти процесса, общее для сессий и фонового прогрева;
+    перечитывается при изменении mtime файла. Не зависит от контекста скрипта Streamlit.
+    """
+    mtime = os.path.getmtime(csv_path)
+    entry = _stations.get(csv_path)
+    if entry is None or entry[0] != mtime:
+        with _stations_lock:
+            entry = _stations.get(csv_path)
+            if entry is None or entry[0] != mtime:
+                entry = (mtime, load_stations(csv_path))
+                _stations[csv_path] = entry
+    return entry[1]
+
+
+def anomaly_map_section(stations):
+    st.subheader("Карта аномалий по станциям")
+    fields = [field for field in ('BOUGUER ANOMALY', 'FREE AIR AN') if field in stations.columns]
+    field = st.selectbox("Поле", fields)
+    resolution_km = st.select_slider("Шаг сетки, км", options=[0.5, 1, 2, 5, 10], value=5)
+    x, y = stations['EASTING'], stations['NORTHING']
+    full = [float(np.nanmin(x)) // 1000, float(np.nanmax(x)) // 1000 + 1,
+            float(np.nanmin(y)) // 1000, float(np.nanmax(y)) // 1000 + 1]
+    col1, col2 = st.columns(2)
+    east = col1.slider("Восток, км", full[0], full[1], (full[0], full[1]))
+    north = col2.slider("Север, км", full[2], full[3], (full[2], full[3]))
 
+    # Шаг увеличивается, если узлов слишком много для интерактивного расчета
+    nodes = (east[1] - east[0]) * (north[1] - north[0]) / resolution_km ** 2
+    if nodes > MAX_NODES:
+        resolution_km = float(np.ceil(np.sqrt((east[1] - east[0]) * (north[1] - north[0]) / MAX_NODES)))
+        st.caption(f"Для выбранной области шаг увеличен до {resolution_km:g} км")
+
+    # Сплайны тайлов общие для всех сессий; смена области или шага пересчитывает только новые тайлы
+    gridder = get_gridder(stations, field)
+    with st.spinner("Интерполяция..."):
+        easting, northing, values = gridder.grid((east[0] * 1000, north[0] * 1000, east[1] * 1000, north[1] * 1000),
+                                                 resolution_km * 1000)
+    if not np.isfinite(values).any():
+        st.write("В выбранной области нет станций")
+        return
+    vlim = float(np.nanmax(np.abs(values)))
+    fig = Figure(figsize=(8, 8 * len(northing) / max(len(easting), 1)))
+    ax = fig.subplots()
+    image = ax.imshow(values, origin='lower', cmap='RdBu_r', vmin=-vlim, vmax=vlim,
+                      extent=[easting[0] / 1000, easting[-1] / 1000, northing[0] / 1000, northing[-1] / 1000])
+    ax.set_xlabel("Восток, км")
+    ax.set_ylabel("Север, км")
+    fig.colorbar(image, ax=ax, label=f"{field}, mGal")
+    st.pyplot(fig)
+
+
+def stations_section(stations):
+    st.subheader("Поиск станций")
+    st.write(f"Станций в наборе: {len(stations)}")
+    col1, col2, col3 = st.columns(3)
+    latitude = col1.number_input("Широта (OSGB36)", value=54.0, min_value=49.0, max_value=61.0)
+    longitude = col2.number_input("Долгота (OSGB36)", value=-2.0, min_value=-9.0, max_value=2.0)
+    radius_km = col3.number_input("Радиус, км", value=10.0, min_value=0.0, max_value=200.0)
+    k = st.slider("Ближайших станций", 1, 100, 10)
+    indices = stations.radius(latitude, longitude, radius_km * 1000) if radius_km > 0 else []
+    st.write(f"Станций в радиусе {radius_km:g} км: {len(indices)}")
+    nearest, distance = stations.nearest(latitude, longitude, k)
+    table = stations.take(nearest)
+    table['DISTANCE_KM'] = distance / 1000
+    st.dataframe(table)
+
+
+@traced('page')
 def great_britain_app():
 
     image_path = './landgrav_csv/GreatBritain.png'
@@ -22,10 +110,27 @@ def great_britain_app():
 
    """)
 
-    st.image(image_path, caption='Карта гравитационных аномалий Великобритании')
+    csv_files = sorted(glob.glob(f"{STATIONS_DIR}/*.csv"))
+    stations = get_stations(csv_files[0]) if csv_files else None
+    if stations is not None:
+        anomaly_map_section(stations)
+    else:
+        st.image(image_path, caption='Карта гравитационных аномалий Великобритании')
 
     st.markdown("""
     <div style="text-align: justify;">
     Аномалии были рассчитаны с учетом геодезической справочной системы 1967 года (GRS67), Международной сети стандартизации гравитации 1971 года (IGSN71) и Национальной гравитационной справочной сети 1973 года (NGRN73).
     </div>
-    """, unsafe_allow_html=True)
\ No newline at end of file
+    """, unsafe_allow_html=True)
+
+    if stations is not None:
+        stations_section(stations)
+
+
+def warm_up():
+    """
+    Предварительная загрузка хранилища станций (выполняется в фоне после первой отрисовки).
+    """
+    csv_files = sorted(glob.glob(f"{STATIONS_DIR}/*.csv"))
+    if csv_files:
+        get_stations(csv_files[0])
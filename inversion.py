@@ -0,0 +1,156 @@
+import numpy as np
+
+from gravity import talwani_edges_jacobian
+
+
+# Подбор многоугольного тела по наблюденному профилю методом Левенберга-Марквардта.
+# Параметры: координаты вершин (x, z в метрах), контраст плотности и постоянный
+# региональный уровень. Якобиан считается аналитически одним транслируемым вызовом
+# для всех станций и рёбер, без конечных разностей.
+
+G = 6.67e-11  # Та же постоянная, что и в talwani_profile
+SCALE = -2 * G * 1e5  # Линейный интеграл -> mGal на единицу плотности
+
+
+def forward_jacobian(stations, vertices, density, station_z=0.0):
+    """
+    Аномалия (mGal) одного многоугольника в точках stations и ее производные:
+    по вершинам - массив (станция, вершина, x/z), по плотности - вектор.
+    """
+    stations = np.atleast_1d(np.asarray(stations, dtype=float))
+    vertices = np.asarray(vertices, dtype=float)
+    start, end = vertices, np.roll(vertices, -1, axis=0)
+    zz, jac = talwani_edges_jacobian(start[:, 0] - stations[:, None], end[:, 0] - stations[:, None],
+                                     start[:, 1] - station_z, end[:, 1] - station_z)
+    total = zz.sum(axis=1)
+    # Вершина i - начало ребра i и конец ребра i - 1
+    d_vertices = np.stack([jac[0] + np.roll(jac[2], 1, axis=1), jac[1] + np.roll(jac[3], 1, axis=1)], axis=-1)
+    return SCALE * density * total, SCALE * density * d_vertices, SCALE * total
+
+
+def orient(vertices):
+    """
+    Обход вершин (x, z вниз), при котором положительный контраст плотности дает
+    положительную аномалию: отрицательная ориентированная площадь.
+    """
+    vertices = np.asarray(vertices, dtype=float)
+    x, z = vertices[:, 0], vertices[:, 1]
+    area = np.sum(x * np.roll(z, -1) - np.roll(x, -1) * z)
+    return vertices[::-1].copy() if area > 0 else vertices.copy()
+
+
+class InversionResult:
+    def __init__(self, vertices, density, offset, predicted, history, iterations, converged, stagnated=False):
+        self.vertices = vertices
+        self.density = density
+        self.offset = offset
+        self.predicted = predicted
+        self.history = history
+        self.iterations = iterations
+        self.converged = converged
+        # Ни один шаг не уменьшил невязку: поиск остановлен без достижения точности
+        self.stagnated = stagnated
+
+    @property
+    def rms(self):
+        return self.history[-1]
+
+
+def invert_profile(stations, observed, vertices, density, station_z=0.0, fit_vertices=True, fit_density=True,
+                   fit_offset=True, offset=0.0, z_limits=None, max_iterations=50, tolerance=1e-6, damping=1e-2):
+    """
+    Подбирает вершины многоугольника, контраст плотности и региональный уровень так,
+    чтобы offset + talwani_profile(stations, [vertices], [density]) приближало observed (mGal).
+    z_limits = (zmin, zmax) ограничивает глубины вершин. Возвращает InversionResult
+    с историей среднеквадратичной невязки по итерациям. converged - относительное
+    улучшение невязки стало меньше tolerance; stagnated - ни один шаг не уменьшил невязку.
+    """
+    stations = np.asarray(stations, dtype=float)
+    observed = np.asarray(observed, dtype=float)
+    valid = np.isfinite(observed)
+    stations, observed = stations[valid], observed[valid]
+    vertices = np.array(vertices, dtype=float)
+    n_vertices = len(vertices)
+    if not (fit_vertices or fit_density or fit_offset):
+        raise ValueError("Не выбрано ни одного подбираемого параметра")
+
+    def pack(vertices, density, offset):
+        parts = []
+        if fit_vertices:
+            parts.append(vertices.ravel())
+        if fit_density:
+            parts.append([density])
+        if fit_offset:
+            parts.append([offset])
+        return np.concatenate(parts)
+
+    def unpack(params):
+        i = 0
+        v, d, o = vertices, density, offset
+        if fit_vertices:
+            v = params[:2 * n_vertices].reshape(n_vertices, 2)
+            if z_limits is not None:
+                v = np.column_stack([v[:, 0], np.clip(v[:, 1], *z_limits)])
+            i = 2 * n_vertices
+        if fit_density:
+            d = params[i]
+            i += 1
+        if fit_offset:
+            o = params[i]
+        return v, d, o
+
+    def evaluate(params):
+        v, d, o = unpack(params)
+        anomaly, d_vertices, d_density = forward_jacobian(stations, v, d, station_z)
+        columns = []
+        if fit_vertices:
+            columns.append(d_vertices.reshape(len(stations), -1))
+        if fit_density:
+            columns.append(d_density[:, None])
+        if fit_offset:
+            columns.append(np.ones((len(stations), 1)))
+        return o + anomaly, np.hstack(columns)
+
+    params = pack(vertices, density, offset)
+    predicted, jacobian = evaluate(params)
+    residual = observed - predicted
+    cost = residual @ residual
+    history = [np.sqrt(cost / len(observed))]
+    converged = stagnated = False
+    iteration = 0
+    for iteration in range(1, max_iterations + 1):
+        normal = jacobian.T @ jacobian
+        gradient = jacobian.T @ residual
+        # Масштабирование Марквардта: шаг не зависит от единиц параметров (м, кг/м^3, mGal)
+        diagonal = np.maximum(np.diag(normal), 1e-12)
+        while True:
+            try:
+                step = np.linalg.solve(normal + damping * np.diag(diagonal), gradient)
+            except np.linalg.LinAlgError:
+                step = np.linalg.lstsq(normal + damping * np.diag(diagonal), gradient, rcond=None)[0]
+            candidate = params + step
+            if z_limits is not None and fit_vertices:
+                candidate[1:2 * n_vertices:2] = np.clip(candidate[1:2 * n_vertices:2], *z_limits)
+            new_predicted, new_jacobian = evaluate(candidate)
+            new_residual = observed - new_predicted
+            new_cost = new_residual @ new_residual
+            if np.isfinite(new_cost) and new_cost < cost:
+                damping = max(damping / 3, 1e-9)
+                break
+            damping *= 4
+            if damping > 1e9:
+                break
+        if damping > 1e9:
+            stagnated = True
+            break
+        improvement = (cost - new_cost) / max(cost, 1e-30)
+        params, predicted, jacobian, residual, cost = candidate, new_predicted, new_jacobian, new_residual, new_cost
+        history.append(np.sqrt(cost / len(observed)))
+        if improvement < tolerance:
+            converged = True
+            break
+
+    v, d, o = unpack(params)
+    full = np.full(valid.shape, np.nan)
+    full[valid] = predicted
+    return InversionResult(v, d, o, full, history, iteration, converged, stagnated)
@@ -0,0 +1,230 @@
+import io
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+import cartopy.crs as ccrs
+from matplotlib.ticker import MaxNLocator
+from PIL import Image, ImageDraw, ImageFont
+
+from pyramid import get_pyramid, block_mean
+from object_cache import ObjectCache
+
+
+def encode_png(image):
+    """
+    Кодирует массив RGB/RGBA uint8 в PNG с быстрым уровнем сжатия.
+    """
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, format='PNG', compress_level=1)
+    return buffer.getvalue()
+
+
+def _label_font(height):
+    try:
+        return ImageFont.load_default(size=max(10, height // 45))
+    except TypeError:
+        return ImageFont.load_default()
+
+
+# Быстрая отрисовка карт: геометрия и береговая линия растеризуются один раз,
+# при смене vmin/vmax или палитры заново применяется только нормализация цвета.
+class FieldRenderer:
+    def __init__(self, data, scale=3, max_images=32, colorbar_width=24, max_size=1024):
+        self.data = data
+        # Для сеток крупнее max_size узлов растр строится по уровню пирамиды
+        n = max(data.sizes['latitude'], data.sizes['longitude'])
+        self.factor = 1
+        self.source = data
+        if n > max_size:
+            levels = get_pyramid(data)
+            self.factor = min((f for f in levels if n // f <= max_size), default=max(levels))
+            self.source = levels[self.factor]
+        self.scale = max(1, min(scale, max_size // (n // self.factor)))
+        self.max_images = max_images
+        self.colorbar_width = colorbar_width
+        self._rasters = {}
+        self._registered = OrderedDict()
+        self._coastlines = None
+        self._images = OrderedDict()
+        # Рендерер общий для сессий: все обращения к _rasters, _registered, _coastlines
+        # и _images идут под этой блокировкой; она повторно входимая, так как image()
+        # вызывает colorize(), а тот - raster() и coastlines()
+        self._lock = threading.RLock()
+
+    @property
+    def extent(self):
+        """
+        Границы изображения по краям ячеек: [lon_min, lon_max, lat_min, lat_max].
+        """
+        lon = self.source.longitude.values
+        lat = self.source.latitude.values
+        dlon = (lon[-1] - lon[0]) / (len(lon) - 1)
+        dlat = (lat[-1] - lat[0]) / (len(lat) - 1)
+        return [lon[0] - dlon / 2, lon[-1] + dlon / 2, lat[0] - dlat / 2, lat[-1] + dlat / 2]
+
+    def raster(self, field):
+        """
+        Поле в узлах карты (север сверху). Для полей набора данных - представление
+        без копирования (для набора из mmap_store - общие страницы), растягивание
+        до пикселей выполняется уже после перевода в цвета.
+        """
+        with self._lock:
+            raster = self._rasters.get(field)
+            if raster is None:
+                raster = self._to_raster(self.source[field].transpose('latitude', 'longitude').values)
+                self._rasters[field] = raster
+            return raster
+
+    def register(self, name, values):
+        """
+        Добавляет для отрисовки производное поле (массив широта x долгота),
+        которого нет в наборе данных, например результат фильтрации.
+        """
+        with self._lock:
+            self._register(name, values)
+
+    def _register(self, name, values):
+        # Вызывается под self._lock
+        if name in self._registered:
+            self._registered.move_to_end(name)
+            return
+        self._rasters[name] = self._to_raster(values)
+        self._registered[name] = None
+        # Производные поля вытесняются так же, как изображения в LRU-кэше
+        while len(self._registered) > self.max_images:
+            evicted, _ = self._registered.popitem(last=False)
+            self._rasters.pop(evicted, None)
+            for key in [key for key in self._images if key[0] == evicted]:
+                del self._images[key]
+
+    def _to_raster(self, values):
+        values = np.asarray(values)
+        if values.shape != (self.source.sizes['latitude'], self.source.sizes['longitude']):
+            values = block_mean(values, self.factor)
+        return np.flipud(values)
+
+    def coastlines(self, shape):
+        """
+        Слой RGBA с береговой линией той же проекции и размера, что и растр поля.
+        """
+        with self._lock:
+            return self._coastlines_for(shape)
+
+    def _coastlines_for(self, shape):
+        # Вызывается под self._lock
+        if self._coastlines is None or self._coastlines.shape[:2] != shape:
+            height, width = shape
+            dpi = 100
+            fig = plt.figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+            ax = fig.add_axes([0, 0, 1, 1], projection=ccrs.PlateCarree())
+            ax.set_extent(self.extent, crs=ccrs.PlateCarree())
+            ax.coastlines()
+            ax.set_facecolor('none')
+            ax.spines['geo'].set_visible(False)
+            fig.patch.set_alpha(0)
+            fig.canvas.draw()
+            self._coastlines = np.asarray(fig.canvas.buffer_rgba())[:height, :width].copy()
+            plt.close(fig)
+        return self._coastlines
+
+    def limits(self, field, vmin=None, vmax=None):
+        """
+        Пределы цветовой шкалы: заданные или по значениям растра.
+        """
+        raster = self.raster(field)
+        if vmin is None:
+            vmin = float(np.nanmin(raster))
+        if vmax is None:
+            vmax = float(np.nanmax(raster))
+        return vmin, vmax
+
+    def colorize(self, field, cmap, vmin=None, vmax=None, colorbar=True):
+        """
+        Применяет нормализацию и палитру к кэшированному растру, накладывает береговую линию
+        и (при colorbar=True) добавляет справа полосу цветовой шкалы с подписями значений.
+        Возвращает массив RGB uint8.
+        """
+        with self._lock:
+            return self._colorize(field, cmap, vmin, vmax, colorbar)
+
+    def _colorize(self, field, cmap, vmin, vmax, colorbar):
+        # Вызывается под self._lock
+        raster = self.raster(field)
+        vmin, vmax = self.limits(field, vmin, vmax)
+        cmap = matplotlib.colormaps[cmap] if isinstance(cmap, str) else cmap
+        # Таблица цветов палитры: индексация uint8 вместо вызова cmap на каждом пикселе
+        lut = cmap(np.linspace(0, 1, cmap.N), bytes=True)[:, :3]
+        scale = cmap.N / (vmax - vmin) if vmax != vmin else 0.0
+        index = np.nan_to_num((raster - vmin) * scale, nan=0.0)
+        rgb = lut[np.clip(index, 0, cmap.N - 1).astype(np.intp)]
+        rgb[np.isnan(raster)] = 255
+        # Узел - квадрат scale x scale пикселей; растягивается уже массив цветов uint8
+        rgb = np.repeat(np.repeat(rgb, self.scale, axis=0), self.scale, axis=1)
+
+        # Береговая линия накладывается только в пикселях, где она есть
+        coast = self.coastlines(rgb.shape[:2])
+        mask = coast[..., 3] > 0
+        alpha = coast[mask, 3:4].astype(np.float32) / 255
+        rgb[mask] = (rgb[mask] * (1 - alpha) + coast[mask, :3] * alpha).astype(np.uint8)
+
+        if not colorbar:
+            return rgb
+        height = rgb.shape[0]
+        gradient = np.linspace(1, 0, height)[:, None].repeat(self.colorbar_width, axis=1)
+        colorbar = cmap(gradient, bytes=True)[..., :3]
+        gap = np.full((height, self.colorbar_width // 2, 3), 255, dtype=np.uint8)
+        labels = self._colorbar_labels(height, vmin, vmax)
+        return np.concatenate([rgb, gap, colorbar, labels], axis=1)
+
+    def _colorbar_labels(self, height, vmin, vmax):
+        # Подписи делений шкалы (как у colorbar matplotlib) на белой полосе справа
+        font = _label_font(height)
+        ticks = MaxNLocator(6).tick_values(vmin, vmax) if vmax > vmin else np.array([vmin])
+        ticks = ticks[(ticks >= vmin) & (ticks <= vmax)]
+        texts = [f"{tick:g}" for tick in ticks]
+        probe = ImageDraw.Draw(Image.new('RGB', (1, 1)))
+        text_width = max((probe.textbbox((0, 0), text, font=font)[2] for text in texts), default=0)
+        tick_length = max(3, self.colorbar_width // 4)
+        panel = Image.new('RGB', (tick_length + text_width + 2 * tick_length, height), (255, 255, 255))
+        draw = ImageDraw.Draw(panel)
+        for tick, text in zip(ticks, texts):
+            y = (vmax - tick) / (vmax - vmin) * (height - 1) if vmax > vmin else height / 2
+            draw.line((0, y, tick_length, y), fill=(0, 0, 0))
+            left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+            y_text = min(max(y - (bottom + top) / 2, 0), height - bottom)
+            draw.text((2 * tick_length, y_text), text, fill=(0, 0, 0), font=font)
+        return np.asarray(panel)
+
+    def image(self, field, cmap, vmin=None, vmax=None, values=None):
+        """
+        PNG-изображение поля. Ограниченный LRU-кэш по (поле, палитра, vmin, vmax).
+        При заданных values поле сначала регистрируется (как register) под той же
+        блокировкой, поэтому другая сессия не может вытеснить его до отрисовки.
+        """
+        key = (field, getattr(cmap, 'name', cmap), vmin, vmax)
+        with self._lock:
+            if values is not None:
+                self._register(field, values)
+            png = self._images.get(key)
+            if png is not None:
+                self._images.move_to_end(key)
+                return png
+            png = encode_png(self.colorize(field, cmap, vmin, vmax))
+            self._images[key] = png
+            while len(self._images) > self.max_images:
+                self._images.popitem(last=False)
+        return png
+
+
+_renderers = ObjectCache(max_entries=8)
+
+
+def get_renderer(data, **options):
+    """
+    Возвращает общий для всех сессий FieldRenderer набора данных
+    с заданными параметрами (scale, max_size и т.д.).
+    """
+    return _renderers.get(data, tuple(sorted(options.items())), lambda: FieldRenderer(data, **options))
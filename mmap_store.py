@@ -0,0 +1,82 @@
+import json
+import mmap
+import os
+import shutil
+
+import numpy as np
+import xarray as xr
+
+
+# Хранение набора данных в каталоге: каждая переменная - отдельный файл .npy,
+# структура (измерения, атрибуты) - в meta.json. Массивы открываются через mmap
+# только для чтения: страницы файла лежат в страничном кэше ОС один раз и
+# разделяются всеми процессами и сессиями, открывшими каталог.
+
+META = 'meta.json'
+
+
+def _json_attrs(attrs):
+    # Атрибуты netCDF могут быть скалярами или массивами numpy
+    return {key: value.tolist() if hasattr(value, 'tolist') else value for key, value in attrs.items()}
+
+
+def write_store(data, directory, float32_fields=()):
+    """
+    Записывает набор данных в каталог directory. Поля из float32_fields
+    сохраняются в float32. Запись идет во временный каталог, который затем
+    переименовывается, поэтому параллельные процессы не увидят недописанный набор.
+    """
+    tmp = f"{directory}.{os.getpid()}.tmp"
+    os.makedirs(tmp, exist_ok=True)
+    try:
+        meta = {'attrs': _json_attrs(data.attrs), 'coords': {}, 'variables': {}}
+        for kind, names in (('coords', data.coords), ('variables', data.data_vars)):
+            for name in names:
+                var = data[name].variable
+                values = var.values
+                if name in float32_fields and values.dtype == np.float64:
+                    values = values.astype(np.float32)
+                np.save(os.path.join(tmp, f"{kind}-{name}.npy"), values)
+                meta[kind][name] = {'dims': list(var.dims), 'attrs': _json_attrs(var.attrs)}
+        with open(os.path.join(tmp, META), 'w') as f:
+            json.dump(meta, f)
+        try:
+            os.rename(tmp, directory)
+        except OSError:
+            # Каталог уже записан другим процессом
+            shutil.rmtree(tmp, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return directory
+
+
+def open_store(directory):
+    """
+    Открывает набор данных из каталога: переменные - представления mmap без копирования,
+    запись в них запрещена.
+    """
+    with open(os.path.join(directory, META)) as f:
+        meta = json.load(f)
+
+    def load(kind, name):
+        return np.load(os.path.join(directory, f"{kind}-{name}.npy"), mmap_mode='r')
+
+    coords = {name: (spec['dims'], load('coords', name), spec['attrs']) for name, spec in meta['coords'].items()}
+    variables = {name: (spec['dims'], load('variables', name), spec['attrs']) for name, spec in meta['variables'].items()}
+    return xr.Dataset(variables, coords=coords, attrs=meta['attrs'])
+
+
+def is_store(directory):
+    return os.path.exists(os.path.join(directory, META))
+
+
+def is_mapped(values):
+    """
+    True, если массив (или массив, представлением которого он является) отображен из файла.
+    """
+    while values is not None:
+        if isinstance(values, (np.memmap, mmap.mmap)):
+            return True
+        values = getattr(values, 'base', None)
+    return False
@@ -1,10 +1,19 @@
+import inspect
+
 import streamlit as st
 import numpy as np
-import xarray as xr
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import cartopy.crs as ccrs
 import cmocean
-import boule as bl
+from gravity_data import load_dataset
+from map_render import get_renderer, encode_png
+from profiles import get_profile_store
+from pyramid import get_pyramid, select_level, color_limits
+import spectral
+from fft_grid import grid_spacing
+from tracing import span, traced
 
 def minmax(data, fields):
     """
@@ -15,44 +24,135 @@ def minmax(data, fields):
     vmax = max(data[field].max() for field in fields)
     return dict(vmin=vmin, vmax=vmax)
 
-# Загрузка набора данных
-data = xr.open_dataset('./Gravity/hawaii-gravity.nc')
-
 # Функция для построения графиков
-def plot_hawaii_data(data, field, **kwargs):
-    fig = plt.figure(figsize=(12, 13))
-    ax = plt.axes(projection=ccrs.PlateCarree())
-    plot_field(ax, data, field, **kwargs)
-    st.pyplot(fig)
+def plot_hawaii_data(data, field, fast=False, **kwargs):
+    if fast:
+        # Быстрый режим: готовое изображение из кэша, без построения фигуры cartopy
+        cmap = kwargs.get('cmap', 'viridis')
+        renderer = get_renderer(data)
+        with span('render_image', field=field):
+            png = renderer.image(field, cmap, kwargs.get('vmin'), kwargs.get('vmax'))
+        st.image(png, caption=field_labels.get(field, field), use_column_width=True)
+        # Оси карты в быстром режиме не рисуются: шкала и границы выводятся подписью
+        vmin, vmax = renderer.limits(field, kwargs.get('vmin'), kwargs.get('vmax'))
+        st.caption(map_caption(renderer, vmin, vmax, field_units.get(field, '')))
+        return
+    with span('cartopy_render', field=field):
+        fig = plt.figure(figsize=(12, 13))
+        ax = plt.axes(projection=ccrs.PlateCarree())
+        plot_field(ax, data, field, **kwargs)
+    with span('st.pyplot'):
+        st.pyplot(fig)
+
+def map_caption(renderer, vmin, vmax, units):
+    """
+    Подпись изображения быстрого режима: пределы цветовой шкалы с единицами и границы карты.
+    """
+    lon_min, lon_max, lat_min, lat_max = renderer.extent
+    return (f"Цветовая шкала: от {vmin:.4g} до {vmax:.4g} {units}; "
+            f"долгота {lon_min:.2f}…{lon_max:.2f}°, широта {lat_min:.2f}…{lat_max:.2f}°")
+
+# Разрешение, с которым st.pyplot сохраняет фигуры
+RENDER_DPI = 200
 
 # Функция для построения поля
 def plot_field(ax, data, field, **kwargs):
-    data[field].plot(ax=ax, transform=ccrs.PlateCarree(), **kwargs)
+    # Берется самый грубый уровень пирамиды, которого хватает на размер осей в пикселях;
+    # полное разрешение - только для приближенных экстентов
+    levels = get_pyramid(data)
+    bbox = ax.get_window_extent()
+    scale = RENDER_DPI / ax.figure.dpi
+    extent = ax.get_extent(crs=ccrs.PlateCarree()) if hasattr(ax, 'get_extent') else None
+    level = select_level(levels, bbox.width * scale, bbox.height * scale, extent)
+    if 'vmin' not in kwargs and 'vmax' not in kwargs:
+        kwargs['vmin'], kwargs['vmax'] = color_limits(levels, field)
+    level[field].plot(ax=ax, transform=ccrs.PlateCarree(), **kwargs)
     ax.coastlines()
 
-# Расчет возмущения гравитационного поля
-ellipsoid = bl.WGS84
-data['normal_gravity'] = ellipsoid.normal_gravity(data.latitude, data.h_over_ellipsoid)
-data['gravity_disturbance'] = data.gravity_earth - data['normal_gravity']
-
 # Интерфейс для изменения границ цветовой шкалы
 def crop_colorbar(cutoff):
     vmin, vmax = -cutoff, cutoff
-    plot_hawaii_data(data, 'gravity_disturbance', cmap='RdBu_r', vmin=vmin, vmax=vmax)
+    data = load_dataset()
+    plot_hawaii_data(data, 'gravity_disturbance', fast=True, cmap='RdBu_r', vmin=vmin, vmax=vmax)
 
-# Бугеррская поправка
-G = 6.67430e-11  # Гравитационная постоянная в м^3 кг^-1 с^-2
-density = 2670.0  # Плотность пластины Буге в кг/м^3
-data['bouguer_plate_correction'] = 2 * np.pi * G * density * data['topography_grd'] * 1e5  # преобразование из м/с^2 в mGal
-data['gravity_bouguer'] = data['gravity_disturbance'] - data['bouguer_plate_correction']
+# Предельное усиление коротких волн при продолжении вниз
+MAX_DOWNWARD_GAIN = 100.0
+
+def downward_limit(data, spacings=2):
+    """
+    Наибольшая глубина продолжения вниз (км): spacings шагов сетки. Глубже
+    усиление exp(|k| h) на коротких волнах превращает продолжение в усиление шума.
+    """
+    return float(np.floor(spacings * min(grid_spacing(data)) / 500) / 2)
+
+# Спектральная обработка выбранного поля: все операторы применяются за одно преобразование Фурье
+def spectral_filter_map(data):
+    st.sidebar.title("Спектральная обработка")
+    field = st.sidebar.selectbox("Поле", ['gravity_disturbance', 'gravity_bouguer', 'gravity_bouguer_complete'],
+                                 format_func=lambda f: field_labels.get(f, f))
+    direction = st.sidebar.radio("Продолжение поля", ['вверх', 'вниз'], horizontal=True)
+    if direction == 'вверх':
+        height = st.sidebar.slider("Продолжение вверх (км)", min_value=0, max_value=50, step=5, value=0)
+    else:
+        # Продолжение вниз неустойчиво: глубина ограничена, усиление коротких волн - MAX_DOWNWARD_GAIN
+        max_depth = downward_limit(data)
+        if max_depth > 0:
+            height = st.sidebar.slider("Продолжение вниз (км)", min_value=0.0, max_value=max_depth, step=0.5, value=0.0)
+        else:
+            # Для сетки с шагом меньше 250 м допустимая глубина меньше шага слайдера
+            st.sidebar.info("Шаг сетки слишком мал для продолжения вниз хотя бы на 0.5 км")
+            height = 0.0
+    derivative = st.sidebar.selectbox("Производная", ['нет', 'вертикальная', 'на восток', 'на север'])
+    long_wavelength = st.sidebar.slider("Подавлять длины волн больше (км, 0 - нет)", min_value=0, max_value=1000, step=50, value=0)
+    short_wavelength = st.sidebar.slider("Подавлять длины волн меньше (км, 0 - нет)", min_value=0, max_value=100, step=5, value=0)
+    derivatives = {'вертикальная': spectral.vertical_derivative, 'на восток': spectral.derivative_x, 'на север': spectral.derivative_y}
+    # Разность поля (mGal) и производной (mGal/м) не имеет смысла
+    residual = st.sidebar.checkbox("Остаточная аномалия (поле минус результат)",
+                                   disabled=derivative in derivatives) and derivative not in derivatives
+
+    operators = []
+    if height and direction == 'вверх':
+        operators.append(spectral.upward(height * 1000))
+    elif height:
+        operators.append(spectral.downward(height * 1000, MAX_DOWNWARD_GAIN))
+    if long_wavelength or short_wavelength:
+        operators.append(spectral.bandpass(long_wavelength * 1000 or None, short_wavelength * 1000 or None))
+    if derivative in derivatives:
+        operators.append(derivatives[derivative]())
+
+    with span('spectral_filter', field=field, operators=len(operators)):
+        result = spectral.filter_field(data, field, operators)
+        if residual:
+            result = data[field].transpose('latitude', 'longitude').values - result
+    name = f"{field}:{tuple(operators)}:{residual}"
+    with span('render_image', field=name):
+        renderer = get_renderer(data)
+        vlim = float(np.nanpercentile(np.abs(result), 99)) or 1.0
+        png = renderer.image(name, 'RdBu_r', -vlim, vlim, values=result)
+    st.image(png, use_column_width=True)
+    units = 'mGal/м' if derivative in derivatives else 'mGal'
+    st.caption(f"{field_labels.get(field, field)}: цветовая шкала от {-vlim:.3g} до {vlim:.3g} {units}")
 
 # Словарь переводов
 field_labels = {
     'gravity_disturbance': 'Потенциал силы тяжести',
     'gravity_bouguer': 'Редукция Бурге',
+    'gravity_bouguer_complete': 'Полная редукция Бурге',
     'topography_ell': 'Топография'
 }
 
+# Единицы полей для подписей шкалы
+field_units = {
+    'gravity_disturbance': 'mGal',
+    'gravity_bouguer': 'mGal',
+    'gravity_bouguer_complete': 'mGal',
+    'h_over_ellipsoid': 'м',
+    'topography_ell': 'м',
+}
+
+# Карты-врезки выводятся в узкой колонке: достаточно растра около 400 пикселей
+INSET_RENDER = dict(scale=1, max_size=400)
+
 # Класс для выбора профиля
 class ProfileSelector:
     def __init__(self, data, fields, projection, figsize=(15, 9), profile_interval=10, dimension='latitude'):
@@ -62,21 +162,45 @@ class ProfileSelector:
         self.figsize = figsize
         self.profile_interval = profile_interval
         self.default_dimension = dimension
+        self.store = get_profile_store(data, list(fields) + ['topography_ell'])
+        self.cut = None
         self._plot_initiated = False
 
+    def _map_image(self, field, cmap):
+        # Карта-врезка рисуется один раз; симметричная шкала, как у xarray для знакопеременных полей
+        vlim = float(np.nanmax(np.abs(self.data[field].values)))
+        return get_renderer(self.data, **INSET_RENDER).colorize(field, cmap, -vlim, vlim, colorbar=False)
+
+    def _draw_profile_line(self, image, index, dimension):
+        # Штриховая линия профиля поверх копии кэшированного изображения карты
+        renderer = get_renderer(self.data, **INSET_RENDER)
+        scale = renderer.scale
+        image = image.copy()
+        # Уровень пирамиды строится с отбрасыванием неполных блоков (boundary='trim'),
+        # поэтому последние узлы исходной сетки попадают в последнюю ячейку растра
+        if dimension.lower() == 'latitude':
+            # Профиль вдоль широты - вертикальная линия на долготе location
+            index = min(index // renderer.factor, image.shape[1] // scale - 1)
+            dashes = (np.arange(image.shape[0]) // 12) % 2 == 0
+            col = index * scale + scale // 2
+            image[dashes, col] = 0
+        else:
+            index = min(index // renderer.factor, image.shape[0] // scale - 1)
+            dashes = (np.arange(image.shape[1]) // 12) % 2 == 0
+            row = (image.shape[0] // scale - 1 - index) * scale + scale // 2
+            image[row, dashes] = 0
+        return image
+
     def plot(self, location, dimension):
+        # Последний срез доступен другим страницам сессии (инверсия на странице Talwani)
+        self.cut = (dimension, location)
         if not self._plot_initiated:
-            self.fig = plt.figure(figsize=self.figsize)
-            grid = plt.GridSpec(2, 4, hspace=0, wspace=0)
-            self.ax_data = self.fig.add_subplot(grid[0, :-1])
-            self.ax_topo = self.fig.add_subplot(grid[1, :-1])
-            self.ax_data_map = self.fig.add_subplot(grid[0, -1], projection=self.projection)
-            self.ax_topo_map = self.fig.add_subplot(grid[1, -1], projection=self.projection)
-
-            extent = [self.data.longitude.min(), self.data.longitude.max(),
-                      self.data.latitude.min(), self.data.latitude.max()]
-            self.ax_data_map.set_extent(extent)
-            self.ax_topo_map.set_extent(extent)
+            # Фигура содержит только панели профилей; карты выводятся отдельными изображениями
+            self.fig = Figure(figsize=(self.figsize[0] * 3 / 4, self.figsize[1]))
+            self.canvas = FigureCanvasAgg(self.fig)
+            grid = self.fig.add_gridspec(2, 1, hspace=0)
+            self.ax_data = self.fig.add_subplot(grid[0])
+            self.ax_topo = self.fig.add_subplot(grid[1])
 
             self._topo_base = -10000
             ylim_topo = [self._topo_base, self.data.topography_ell.max() * 1.1]
@@ -89,47 +213,63 @@ class ProfileSelector:
             self.ax_data.grid(True)
             self.ax_data.set_xticklabels([])
 
-            self._data_lines = {field: self.ax_data.plot([0], [0], '-', label=field_labels.get(field, field))[0] for field in self.fields}
-            self.ax_data.legend(loc='upper right')
+            # Изменяемые элементы рисуются поверх сохраненного фона (blitting)
+            self._data_lines = {field: self.ax_data.plot([0], [0], '-', label=field_labels.get(field, field), animated=True)[0] for field in self.fields}
+            self._legend = self.ax_data.legend(loc='upper right')
+            self._legend.set_animated(True)
 
             self._water_fill = None
             self._topo_fill = None
+            self._dimension = None
+            self._background = None
 
-            plot_field(self.ax_data_map, self.data, self.fields[0], cmap='RdBu_r')
-            plot_field(self.ax_topo_map, self.data, 'topography_ell', cmap=cmocean.cm.delta)
-
-            self._datamap_profile = self.ax_data_map.plot([0, 0], [0, 0], '--k')[0]
-            self._topomap_profile = self.ax_topo_map.plot([0, 0], [0, 0], '--k')[0]
+            self._data_map = self._map_image(self.fields[0], 'RdBu_r')
+            self._topo_map = self._map_image('topography_ell', cmocean.cm.delta)
 
-            plt.tight_layout(pad=0, h_pad=0, w_pad=0)
+            self.fig.tight_layout(pad=0, h_pad=0, w_pad=0)
             self._plot_initiated = True
 
-        dim_comp = set(self.data.dims).difference({dimension}).pop()
-        x = self.data[dimension]
+        with span('profile_extraction', dimension=dimension):
+            x, profile = self.store.profile(dimension, location)
+            index = self.store.index(dimension, location)
         xlim = [x.min(), x.max()]
-        profile = self.data.sel({dim_comp: location}, method='nearest')
 
         for field in self.fields:
             self._data_lines[field].set_data(x, profile[field])
 
+        if self._dimension != dimension:
+            # Ось и «вода» меняются только при смене направления профиля
+            if self._water_fill is not None:
+                self._water_fill.remove()
+            self._water_fill = self.ax_topo.fill_between(xlim, [0, 0], self._topo_base, color='#2780E3')
+            self.ax_data.set_xlim(xlim)
+            self.ax_topo.set_xlim(xlim)
+            self.ax_topo.set_xlabel(dimension.capitalize())
+            self._dimension = dimension
+            self.canvas.draw()
+            self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+
         if self._topo_fill is not None:
             self._topo_fill.remove()
-        if self._water_fill is not None:
-            self._water_fill.remove()
-        self._water_fill = self.ax_topo.fill_between(xlim, [0, 0], self._topo_base, color='#2780E3')
-        self._topo_fill = self.ax_topo.fill_between(x, profile.topography_ell, self._topo_base, color='#333333')
-
-        profile_location = [xlim, [location, location]]
-        if dimension.lower() == 'latitude':
-            profile_location = profile_location[::-1]
-        self._datamap_profile.set_data(*profile_location)
-        self._topomap_profile.set_data(*profile_location)
-
-        self.ax_data.set_xlim(xlim)
-        self.ax_topo.set_xlim(xlim)
-        self.ax_topo.set_xlabel(dimension.capitalize())
-
-        st.pyplot(self.fig)
+        self._topo_fill = self.ax_topo.fill_between(x, profile['topography_ell'], self._topo_base, color='#333333', animated=True)
+
+        with span('profile_draw'):
+            self.canvas.restore_region(self._background)
+            for line in self._data_lines.values():
+                self.ax_data.draw_artist(line)
+            self.ax_data.draw_artist(self._legend)
+            self.ax_topo.draw_artist(self._topo_fill)
+
+        with span('encode_png'):
+            png = encode_png(np.asarray(self.canvas.buffer_rgba()))
+            data_map = self._draw_profile_line(self._data_map, index, dimension)
+            topo_map = self._draw_profile_line(self._topo_map, index, dimension)
+        col_profile, col_maps = st.columns([3, 1])
+        with col_profile:
+            st.image(png, use_column_width=True)
+        with col_maps:
+            st.image(data_map, use_column_width=True)
+            st.image(topo_map, use_column_width=True)
 
     def interact(self):
         dimension = st.sidebar.selectbox("Профиль вдоль", list(self.data.dims.keys()), index=0)
@@ -141,6 +281,7 @@ class ProfileSelector:
 
         self.plot(location, dimension)
 
+@traced('page')
 def nc_app():
     st.title("Локальное гравитационное поле на основе данных гравитационной модели EIGEN-6c4, Глобальная ЦМР ETOPO1")
     
@@ -174,14 +315,25 @@ def nc_app():
     </div>
     """, unsafe_allow_html=True)
 
+    # Набор данных с производными полями берется из общего кэша процесса
+    with span('load_dataset'):
+        data = load_dataset()
 
-    plot_hawaii_data(data, 'h_over_ellipsoid', cmap=cmocean.cm.delta)
+    plot_hawaii_data(data, 'h_over_ellipsoid', fast=True, cmap=cmocean.cm.delta)
     
     st.sidebar.title("Насыщенность цветовой шкалы")
     cutoff = st.sidebar.slider("Абсолютное значение отсечки (mGal)", min_value=50, max_value=600, step=50, value=150)
     
     crop_colorbar(cutoff)
 
+    st.write("""
+    <div style="text-align: center; margin-bottom: 20px;">
+        <h2>Продолжение поля, производные и полосовая фильтрация</h2>
+    </div>
+    """, unsafe_allow_html=True)
+
+    spectral_filter_map(data)
+
     st.write("""
     <div style="text-align: center; margin-bottom: 20px;">
         <h2>Интерактивный элемент для вычисления гравитационного профиля</h2>
@@ -189,7 +341,11 @@ def nc_app():
     """, unsafe_allow_html=True)
     
 
-    profile_selector = ProfileSelector(data, ['gravity_disturbance', 'gravity_bouguer'], figsize=(14, 6.8), projection=ccrs.PlateCarree())
+    # Селектор хранится в сессии: фигура и карты-врезки создаются один раз
+    profile_selector = st.session_state.get('profile_selector')
+    if profile_selector is None or profile_selector.data is not data:
+        profile_selector = ProfileSelector(data, ['gravity_disturbance', 'gravity_bouguer', 'gravity_bouguer_complete'], figsize=(14, 6.8), projection=ccrs.PlateCarree())
+        st.session_state['profile_selector'] = profile_selector
     profile_selector.interact()
 
 
@@ -199,93 +355,12 @@ def nc_app():
     </div>
     """, unsafe_allow_html=True)
 
-    st.write("""
-    ```py
-    class ProfileSelector:
-        def __init__(self, data, fields, projection, figsize=(15, 9), profile_interval=10, dimension='latitude'):
-            self.data = data
-            self.fields = fields
-            self.projection = projection
-            self.figsize = figsize
-            self.profile_interval = profile_interval
-            self.default_dimension = dimension
-            self._plot_initiated = False
-
-        def plot(self, location, dimension):
-            if not self._plot_initiated:
-                self.fig = plt.figure(figsize=self.figsize)
-                grid = plt.GridSpec(2, 4, hspace=0, wspace=0)
-                self.ax_data = self.fig.add_subplot(grid[0, :-1])
-                self.ax_topo = self.fig.add_subplot(grid[1, :-1])
-                self.ax_data_map = self.fig.add_subplot(grid[0, -1], projection=self.projection)
-                self.ax_topo_map = self.fig.add_subplot(grid[1, -1], projection=self.projection)
-
-                extent = [self.data.longitude.min(), self.data.longitude.max(),
-                        self.data.latitude.min(), self.data.latitude.max()]
-                self.ax_data_map.set_extent(extent)
-                self.ax_topo_map.set_extent(extent)
-
-                self._topo_base = -10000
-                ylim_topo = [self._topo_base, self.data.topography_ell.max() * 1.1]
-                ylim_data = list(sorted(minmax(self.data, self.fields).values()))
-
-                self.ax_data.set_ylim(ylim_data)
-                self.ax_data.set_ylabel('mGal')
-                self.ax_topo.set_ylim(ylim_topo)
-                self.ax_topo.set_ylabel('Топография (м)')
-                self.ax_data.grid(True)
-                self.ax_data.set_xticklabels([])
-
-                self._data_lines = {field: self.ax_data.plot([0], [0], '-', label=field_labels.get(field, field))[0] for field in self.fields}
-                self.ax_data.legend(loc='upper right')
-
-                self._water_fill = None
-                self._topo_fill = None
-
-                plot_field(self.ax_data_map, self.data, self.fields[0], cmap='RdBu_r')
-                plot_field(self.ax_topo_map, self.data, 'topography_ell', cmap=cmocean.cm.delta)
-
-                self._datamap_profile = self.ax_data_map.plot([0, 0], [0, 0], '--k')[0]
-                self._topomap_profile = self.ax_topo_map.plot([0, 0], [0, 0], '--k')[0]
-
-                plt.tight_layout(pad=0, h_pad=0, w_pad=0)
-                self._plot_initiated = True
-
-            dim_comp = set(self.data.dims).difference({dimension}).pop()
-            x = self.data[dimension]
-            xlim = [x.min(), x.max()]
-            profile = self.data.sel({dim_comp: location}, method='nearest')
-
-            for field in self.fields:
-                self._data_lines[field].set_data(x, profile[field])
-
-            if self._topo_fill is not None:
-                self._topo_fill.remove()
-            if self._water_fill is not None:
-                self._water_fill.remove()
-            self._water_fill = self.ax_topo.fill_between(xlim, [0, 0], self._topo_base, color='#2780E3')
-            self._topo_fill = self.ax_topo.fill_between(x, profile.topography_ell, self._topo_base, color='#333333')
-
-            profile_location = [xlim, [location, location]]
-            if dimension.lower() == 'latitude':
-                profile_location = profile_location[::-1]
-            self._datamap_profile.set_data(*profile_location)
-            self._topomap_profile.set_data(*profile_location)
-
-            self.ax_data.set_xlim(xlim)
-            self.ax_topo.set_xlim(xlim)
-            self.ax_topo.set_xlabel(dimension.capitalize())
+    # Листинг берется из исходного кода класса и не расходится с реализацией
+    st.code(inspect.getsource(ProfileSelector), language='python')
 
-            st.pyplot(self.fig)
 
-        def interact(self):
-            dimension = st.sidebar.selectbox("Профиль вдоль", list(self.data.dims.keys()), index=0)
-            dim2 = set(self.data.dims).difference({dimension}).pop()
-            options = self.data[dim2].values.tolist()[::self.profile_interval]
-            mid = options[len(options) // 2]
-
-            location = st.sidebar.select_slider(f"на значении {dim2}", options=options, value=mid)
-
-            self.plot(location, dimension)      `
-    ```
-    """, unsafe_allow_html=True)
+def warm_up():
+    """
+    Предварительная загрузка набора данных и пирамиды разрешений (выполняется в фоне после первой отрисовки).
+    """
+    get_pyramid(load_dataset())
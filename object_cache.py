@@ -0,0 +1,113 @@
+import threading
+import weakref
+from collections import OrderedDict
+
+
+# Общий для модулей кэш значений, производных от объекта (набора данных xarray,
+# хранилища станций): рендереров, пирамид, профилей, результатов фильтрации.
+# Объект не хешируется (xr.Dataset), поэтому ключом служит id, а тождество
+# подтверждает слабая ссылка: пока она жива, id не может достаться другому объекту.
+# Когда объект собирается сборщиком мусора, его записи удаляются.
+
+_MISSING = object()
+
+
+class ObjectCache:
+    """
+    Ограниченный LRU-кэш {(объект, ключ): значение} со слабыми ссылками на объекты.
+    """
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self._items = OrderedDict()  # (id объекта, ключ) -> значение
+        self._owners = {}  # id объекта -> слабая ссылка
+        self._dead = []  # (id, ссылка) объектов, собранных во время работы с кэшем
+        self._building = {}  # (id объекта, ключ) -> событие завершения построения
+        self._lock = threading.Lock()
+
+    def _collected(self, owner_id, ref):
+        # Вызывается сборщиком мусора, возможно внутри захваченной блокировки того же
+        # потока: если блокировка занята, записи удаляются при следующем обращении
+        self._dead.append((owner_id, ref))
+        if self._lock.acquire(blocking=False):
+            try:
+                self._purge()
+            finally:
+                self._lock.release()
+
+    def _purge(self):
+        while self._dead:
+            owner_id, ref = self._dead.pop()
+            if self._owners.get(owner_id) is ref:
+                del self._owners[owner_id]
+                for key in [key for key in self._items if key[0] == owner_id]:
+                    del self._items[key]
+
+    def _lookup(self, owner, key):
+        self._purge()
+        ref = self._owners.get(id(owner))
+        if ref is None or ref() is not owner:
+            return _MISSING
+        value = self._items.get((id(owner), key), _MISSING)
+        if value is not _MISSING:
+            self._items.move_to_end((id(owner), key))
+        return value
+
+    def _store(self, owner, key, value):
+        owner_id = id(owner)
+        ref = self._owners.get(owner_id)
+        if ref is None or ref() is not owner:
+            self._owners[owner_id] = weakref.ref(owner, lambda ref: self._collected(owner_id, ref))
+        self._items[(owner_id, key)] = value
+        self._items.move_to_end((owner_id, key))
+        while len(self._items) > self.max_entries:
+            (evicted_id, _), _ = self._items.popitem(last=False)
+            if not any(item[0] == evicted_id for item in self._items):
+                self._owners.pop(evicted_id, None)
+
+    def lookup(self, owner, key=None, default=None):
+        """
+        Значение для (owner, key) или default.
+        """
+        with self._lock:
+            value = self._lookup(owner, key)
+        return default if value is _MISSING else value
+
+    def store(self, owner, key, value):
+        """
+        Запоминает значение для (owner, key), вытесняя давно не использованные записи.
+        """
+        with self._lock:
+            self._store(owner, key, value)
+
+    def get(self, owner, key, factory):
+        """
+        Значение для (owner, key); при промахе создается factory() вне общей блокировки.
+        Параллельные запросы того же ключа ждут завершения построения, а не строят
+        значение повторно; запросы других ключей не ждут.
+        """
+        slot = (id(owner), key)
+        while True:
+            with self._lock:
+                value = self._lookup(owner, key)
+                if value is not _MISSING:
+                    return value
+                event = self._building.get(slot)
+                if event is None:
+                    event = self._building[slot] = threading.Event()
+                    break
+            # Значение строит другой поток; после построения (или ошибки) поиск повторяется
+            event.wait()
+        try:
+            value = factory()
+            self.store(owner, key, value)
+            return value
+        finally:
+            with self._lock:
+                del self._building[slot]
+            event.set()
+
+    def __len__(self):
+        with self._lock:
+            self._purge()
+            return len(self._items)
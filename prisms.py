@@ -0,0 +1,267 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import xarray as xr
+
+from fft_grid import EARTH_RADIUS
+from gravity_data import G, BOUGUER_DENSITY
+
+
+# Трехмерное прямое моделирование притяжения рельефа. Каждая ячейка сетки topography_grd -
+# колонна между геоидом и поверхностью рельефа (над эллипсоидом); точки наблюдения
+# на высотах h_over_ellipsoid. Ближняя зона считается точно прямоугольными призмами
+# (Nagy et al., 2000) с поправкой за кривизну Земли, дальняя - точечными массами блоков
+# factor x factor ячеек в сферической геометрии (тессероид нулевого порядка).
+# Границу зон задают блоки: для всех точек наблюдения одного блока ближняя зона
+# одна и та же, поэтому блок считается одним транслируемым вызовом.
+
+CUTOFF = 50000.0  # Радиус ближней зоны, м
+FACTOR = 4  # Размер блока дальней зоны в ячейках сетки
+
+# Состояние процесса-обработчика: массивы модели передаются один раз через initializer
+_model = None
+
+
+def prism_kernel(x, y, z):
+    # Первообразная вертикального притяжения призмы в вершине (x, y, z) относительно точки
+    r = np.sqrt(x * x + y * y + z * z)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_x = np.log(np.maximum(x + r, 1e-12))
+        log_y = np.log(np.maximum(y + r, 1e-12))
+        angle = np.where(z == 0, 0.0, np.arctan(x * y / (z * r)))
+    return x * log_y + y * log_x - z * angle
+
+
+def prism_gz(x1, x2, y1, y2, z1, z2, density):
+    """
+    Вертикальное притяжение (mGal, положительно вниз) прямоугольных призм
+    [x1, x2] x [y1, y2] x [z1, z2] (м, z вверх, точка наблюдения в начале координат).
+    Аргументы транслируются numpy; результат суммируется по последней оси.
+    """
+    total = 0.0
+    for i, x in enumerate((x1, x2)):
+        for j, y in enumerate((y1, y2)):
+            for k, z in enumerate((z1, z2)):
+                sign = 1 if (i + j + k) % 2 else -1
+                total = total + sign * prism_kernel(x, y, z)
+    return G * 1e5 * np.sum(density * total, axis=-1)
+
+
+def point_mass_gz(observers, radius, masses, positions):
+    """
+    Радиальное притяжение (mGal) точечных масс (кг) в геоцентрических координатах
+    positions (n, 3) в точках с единичными векторами observers (k, 3) на радиусах radius (k,).
+    """
+    projection = observers @ positions.T
+    distance_sq = radius[:, None] ** 2 + np.sum(positions ** 2, axis=1) - 2 * radius[:, None] * projection
+    return G * 1e5 * ((radius[:, None] - projection) / distance_sq ** 1.5) @ masses
+
+
+def unit_vectors(latitude, longitude):
+    lat, lon = np.radians(latitude), np.radians(longitude)
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def _blocks(values, factor):
+    # Суммы по блокам factor x factor; неполные блоки на краях дополняются нулями
+    ny, nx = values.shape[:2]
+    by, bx = -(-ny // factor), -(-nx // factor)
+    padded = np.zeros((by * factor, bx * factor) + values.shape[2:])
+    padded[:ny, :nx] = values
+    return padded.reshape((by, factor, bx, factor) + values.shape[2:]).sum(axis=(1, 3))
+
+
+def build_model(latitude, longitude, topography, geoid, height, density=BOUGUER_DENSITY, water_density=None,
+                cutoff=CUTOFF, factor=FACTOR):
+    """
+    Модель рельефа для прямого расчета: колонны ячеек (от геоида до поверхности
+    рельефа, для отрицательных высот - дефицит массы) и точечные массы блоков дальней зоны.
+    При заданной water_density под водой используется контраст density - water_density.
+    """
+    latitude = np.asarray(latitude, dtype=float)
+    longitude = np.asarray(longitude, dtype=float)
+    topography = np.asarray(topography, dtype=float)
+    geoid = np.asarray(geoid, dtype=float)
+    rho = np.full(topography.shape, float(density))
+    if water_density is not None:
+        rho[topography < 0] -= water_density
+    rho = np.where(topography < 0, -rho, rho)
+    bottom = np.minimum(geoid, geoid + topography)
+    top = np.maximum(geoid, geoid + topography)
+
+    dlat = np.radians(abs(latitude[1] - latitude[0]))
+    dlon = np.radians(abs(longitude[1] - longitude[0]))
+    lat2d = np.broadcast_to(latitude[:, None], topography.shape)
+    lon2d = np.broadcast_to(longitude[None, :], topography.shape)
+    area = EARTH_RADIUS ** 2 * dlat * dlon * np.cos(np.radians(lat2d))
+    mass = rho * (top - bottom) * area
+    # Центр блока - средневзвешенное по |массе| положение ячеек (для пустых блоков - геометрический центр)
+    positions = unit_vectors(lat2d, lon2d) * (EARTH_RADIUS + (top + bottom) / 2)[..., None]
+    weight = np.abs(mass)
+    block_weight = _blocks(weight, factor)
+    count = _blocks(np.ones(topography.shape), factor)
+    centre = np.where(block_weight[..., None] > 0,
+                      _blocks(positions * weight[..., None], factor) / np.maximum(block_weight, 1e-300)[..., None],
+                      _blocks(positions, factor) / count[..., None])
+
+    # Окно ближней зоны в блоках покрывает cutoff по обеим осям при наименьшем шаге по долготе
+    step = EARTH_RADIUS * min(dlat, dlon * np.cos(np.radians(np.abs(latitude).max())))
+    window = int(np.ceil(cutoff / (factor * step)))
+    return dict(latitude=latitude, longitude=longitude, height=np.asarray(height, dtype=float),
+                bottom=bottom, top=top, rho=rho, dlat=dlat, dlon=dlon, factor=factor, window=window,
+                block_mass=_blocks(mass, factor), block_position=centre)
+
+
+def _near_field(model, rows, cols, lat, lon, height):
+    # Точный расчет призмами ячеек rows x cols для точек наблюдения (lat, lon, height)
+    phi = np.radians(model['latitude'][rows])[:, None]
+    lam = np.radians(model['longitude'][cols])[None, :]
+    phi, lam = np.broadcast_arrays(phi, lam)
+    phi, lam = phi.ravel(), lam.ravel()
+    bottom = model['bottom'][rows, cols].ravel()
+    top = model['top'][rows, cols].ravel()
+    rho = model['rho'][rows, cols].ravel()
+    obs_phi = np.radians(lat)[:, None]
+    obs_lam = np.radians(lon)[:, None]
+
+    # Локальная плоская система точки наблюдения; ячейка - призма со своими размерами
+    half_y = EARTH_RADIUS * model['dlat'] / 2
+    half_x = EARTH_RADIUS * model['dlon'] * np.cos(phi) / 2
+    north = EARTH_RADIUS * (phi - obs_phi)
+    east = EARTH_RADIUS * (lam - obs_lam) * np.cos(phi)
+    # Поправка за кривизну: поверхность опускается на s^2 / 2R относительно касательной плоскости
+    drop = (north * north + east * east) / (2 * EARTH_RADIUS)
+    z = -height[:, None] - drop
+    return prism_gz(east - half_x, east + half_x, north - half_y, north + half_y,
+                    z + bottom, z + top, rho)
+
+
+def forward_block_rows(model, start, stop):
+    """
+    Притяжение рельефа (mGal) в точках наблюдения строк блоков start:stop.
+    """
+    factor, window = model['factor'], model['window']
+    ny, nx = model['height'].shape
+    n_by, n_bx = model['block_mass'].shape
+    masses = model['block_mass'].ravel()
+    positions = model['block_position'].reshape(-1, 3)
+    by_index, bx_index = np.divmod(np.arange(masses.size), n_bx)
+    result = np.empty((min(stop * factor, ny) - start * factor, nx))
+    for by in range(start, stop):
+        row_slice = slice(by * factor, min((by + 1) * factor, ny))
+        near_rows = slice(max(by - window, 0) * factor, min((by + window + 1) * factor, ny))
+        for bx in range(n_bx):
+            col_slice = slice(bx * factor, min((bx + 1) * factor, nx))
+            near_cols = slice(max(bx - window, 0) * factor, min((bx + window + 1) * factor, nx))
+            lat, lon = np.meshgrid(model['latitude'][row_slice], model['longitude'][col_slice], indexing='ij')
+            height = model['height'][row_slice, col_slice]
+            near = _near_field(model, near_rows, near_cols, lat.ravel(), lon.ravel(), height.ravel())
+
+            far_mask = (np.abs(by_index - by) > window) | (np.abs(bx_index - bx) > window)
+            radius = EARTH_RADIUS + height.ravel()
+            far = point_mass_gz(unit_vectors(lat.ravel(), lon.ravel()), radius, masses[far_mask], positions[far_mask])
+            result[row_slice.start - start * factor:row_slice.stop - start * factor, col_slice] = \
+                (near + far).reshape(height.shape)
+    return start, result
+
+
+def _init_worker(model):
+    global _model
+    _model = model
+
+
+def _run_chunk(start, stop):
+    return forward_block_rows(_model, start, stop)
+
+
+def forward_model(model, workers=None, chunk_blocks=2):
+    """
+    Притяжение рельефа во всех точках сетки. Строки блоков делятся на задачи по
+    chunk_blocks и распределяются по пулу процессов; массивы модели передаются
+    каждому процессу один раз. workers=1 считает в текущем процессе.
+    """
+    n_by = model['block_mass'].shape[0]
+    factor = model['factor']
+    workers = workers or os.cpu_count() or 1
+    result = np.empty(model['height'].shape)
+    chunks = [(start, min(start + chunk_blocks, n_by)) for start in range(0, n_by, chunk_blocks)]
+    if workers == 1:
+        parts = [forward_block_rows(model, start, stop) for start, stop in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model,)) as pool:
+            parts = [future.result() for future in as_completed([pool.submit(_run_chunk, *c) for c in chunks])]
+    for start, values in parts:
+        result[start * factor:start * factor + len(values)] = values
+    return result
+
+
+def topography_effect(data, density=BOUGUER_DENSITY, water_density=None, cutoff=CUTOFF, factor=FACTOR,
+                      workers=None, chunk_blocks=2):
+    """
+    Притяжение рельефа topography_grd (mGal) в точках h_over_ellipsoid сетки широта x долгота.
+    Физически корректная альтернатива bouguer_plate_correction: учитывает конечные
+    размеры и форму рельефа и кривизну Земли.
+    """
+    data = data.transpose('latitude', 'longitude')
+    model = build_model(data.latitude.values, data.longitude.values, data['topography_grd'].values,
+                        data['geoid'].values, data['h_over_ellipsoid'].values, density, water_density,
+                        cutoff, factor)
+    return forward_model(model, workers, chunk_blocks)
+
+
+def add_topography_effect(data, density=BOUGUER_DENSITY, water_density=None, **kwargs):
+    """
+    Добавляет в набор данных притяжение рельефа topography_prisms и, если есть
+    возмущение силы тяжести, редукцию gravity_bouguer_prisms = gravity_disturbance - topography_prisms.
+    """
+    effect = topography_effect(data, density, water_density, **kwargs)
+    data['topography_prisms'] = (('latitude', 'longitude'), effect)
+    data['topography_prisms'].attrs['units'] = 'mGal'
+    if 'gravity_disturbance' in data:
+        data['gravity_bouguer_prisms'] = data['gravity_disturbance'] - data['topography_prisms']
+    return data
+
+
+def output_path(path):
+    return f"{os.path.splitext(path)[0]}.prisms.nc"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Притяжение рельефа сетки netCDF прямоугольными призмами")
+    parser.add_argument('source', help="Файл netCDF с topography_grd, geoid и h_over_ellipsoid")
+    parser.add_argument('-o', '--output', default=None, help="Файл результата (по умолчанию <source>.prisms.nc)")
+    parser.add_argument('--density', type=float, default=BOUGUER_DENSITY, help="Плотность рельефа, кг/м^3")
+    parser.add_argument('--water-density', type=float, default=None,
+                        help="Плотность воды, кг/м^3 (по умолчанию дефицит массы с плотностью рельефа, как у плиты Буге)")
+    parser.add_argument('--cutoff', type=float, default=CUTOFF, help="Радиус ближней зоны, м")
+    parser.add_argument('--factor', type=int, default=FACTOR, help="Размер блока дальней зоны в ячейках")
+    parser.add_argument('--chunk-blocks', type=int, default=2, help="Число строк блоков в одной задаче")
+    parser.add_argument('--workers', type=int, default=None, help="Число процессов")
+    args = parser.parse_args(argv)
+
+    started = time.time()
+    with xr.open_dataset(args.source) as source:
+        data = source[['topography_grd', 'geoid', 'h_over_ellipsoid']].load()
+    effect = topography_effect(data, args.density, args.water_density, args.cutoff, args.factor,
+                               args.workers, args.chunk_blocks)
+    plate = 2 * np.pi * G * args.density * data['topography_grd'].transpose('latitude', 'longitude').values * 1e5
+    result = xr.Dataset({'topography_prisms': (('latitude', 'longitude'), effect),
+                         'bouguer_plate_correction': (('latitude', 'longitude'), plate)},
+                        coords={'latitude': data.latitude, 'longitude': data.longitude})
+    for name in result.data_vars:
+        result[name].attrs['units'] = 'mGal'
+    target = args.output or output_path(args.source)
+    result.to_netcdf(target)
+    difference = effect - plate
+    print(f"{args.source} -> {target} ({time.time() - started:.1f} с); призмы - плита: "
+          f"среднее {difference.mean():.1f}, СКО {difference.std():.1f}, "
+          f"мин {difference.min():.1f}, макс {difference.max():.1f} mGal")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
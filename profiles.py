@@ -0,0 +1,68 @@
+
+import numpy as np
+
+from mmap_store import is_mapped
+from object_cache import ObjectCache
+
+
+# Хранилище профилей: все строки и столбцы полей извлекаются один раз
+# в непрерывные массивы, после чего выбор профиля сводится к индексации.
+class ProfileStore:
+    def __init__(self, data, fields, dtype=None):
+        self.fields = list(fields)
+        self.dims = list(data[self.fields[0]].dims)
+        self.coords = {dim: data[dim].values for dim in self.dims}
+        self._lookup = {dim: {value: i for i, value in enumerate(values.tolist())}
+                        for dim, values in self.coords.items()}
+        self._order = {dim: np.argsort(values) for dim, values in self.coords.items()}
+
+        # _grids[dim][field] имеет оси (положение профиля, точка вдоль dim), каждый профиль
+        # непрерывен в памяти. Исключение - набор из mmap_store без dtype: копия в каждом
+        # процессе свела бы на нет общие страницы, поэтому хранятся представления без копирования.
+        # dtype задает непрерывную копию в этом типе.
+        self._grids = {}
+        for dim in self.dims:
+            other = self.other_dim(dim)
+            self._grids[dim] = {}
+            for field in self.fields:
+                values = data[field].transpose(other, dim).values
+                if dtype is not None or not is_mapped(values):
+                    values = np.ascontiguousarray(values, dtype=dtype)
+                self._grids[dim][field] = values
+
+    def other_dim(self, dimension):
+        """
+        Второе измерение сетки.
+        """
+        return next(dim for dim in self.dims if dim != dimension)
+
+    def index(self, dimension, location):
+        """
+        Индекс ближайшего к location значения координаты, перпендикулярной профилю.
+        """
+        other = self.other_dim(dimension)
+        i = self._lookup[other].get(location)
+        if i is not None:
+            return i
+        values = self.coords[other]
+        order = self._order[other]
+        pos = np.clip(np.searchsorted(values[order], location), 1, len(values) - 1)
+        left, right = order[pos - 1], order[pos]
+        return left if abs(location - values[left]) <= abs(values[right] - location) else right
+
+    def profile(self, dimension, location):
+        """
+        Возвращает координаты вдоль профиля и словарь {поле: значения} (представления без копирования).
+        """
+        i = self.index(dimension, location)
+        return self.coords[dimension], {field: grid[i] for field, grid in self._grids[dimension].items()}
+
+
+_stores = ObjectCache(max_entries=8)
+
+
+def get_profile_store(data, fields):
+    """
+    Возвращает общий для всех сессий ProfileStore для набора данных и полей.
+    """
+    return _stores.get(data, tuple(fields), lambda: ProfileStore(data, fields))
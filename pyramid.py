@@ -0,0 +1,210 @@
+import argparse
+import os
+import weakref
+
+import numpy as np
+import xarray as xr
+import netCDF4
+
+from object_cache import ObjectCache
+
+
+FACTORS = (2, 4, 8, 16)
+# Уровни записанной пирамиды меньше этого объема читаются в память целиком, байт
+MAX_LOADED_BYTES = 64 * 1024 * 1024
+
+
+def _coarsen(source, step):
+    # Блочные средние полей; блочные min/max накапливаются от уровня к уровню
+    blocks = source.coarsen(latitude=step, longitude=step, boundary='trim')
+    means, minima, maxima = blocks.mean(), blocks.min(), blocks.max()
+    level = xr.Dataset(coords=means.coords)
+    for name in source.data_vars:
+        if name.endswith('_min'):
+            level[name] = minima[name]
+        elif name.endswith('_max'):
+            level[name] = maxima[name]
+        else:
+            level[name] = means[name]
+            if f"{name}_min" not in source:
+                level[f"{name}_min"] = minima[name]
+                level[f"{name}_max"] = maxima[name]
+    return level
+
+
+def build_pyramid(data, factors=FACTORS):
+    """
+    Уменьшенные копии набора данных: словарь {коэффициент: Dataset} с блочными
+    средними, минимумами (<поле>_min) и максимумами (<поле>_max) каждого поля;
+    уровень 1 - исходные данные. Уровни меньше 2x2 узлов не строятся.
+    """
+    levels = {1: data}
+    source, source_factor = data, 1
+    for factor in sorted(factors):
+        if min(data.sizes['latitude'], data.sizes['longitude']) // factor < 2:
+            break
+        if factor % source_factor:
+            source, source_factor = data, 1
+        # Каждый уровень строится из предыдущего, а не из полного разрешения
+        level = _coarsen(source, factor // source_factor)
+        level.attrs['factor'] = factor
+        levels[factor] = level
+        source, source_factor = level, factor
+    return levels
+
+
+def pyramid_path(path):
+    root, _ = os.path.splitext(path)
+    return f"{root}.pyramid.nc"
+
+
+def write_pyramid(levels, path):
+    """
+    Записывает уровни пирамиды (кроме исходного) в группы level<коэффициент> файла netCDF.
+    Ключ исходного набора (encoding['dataset_key'], см. gravity_data.load_dataset)
+    сохраняется в атрибутах уровней, чтобы приложение не взяло пирамиду другой версии данных.
+    """
+    key = levels[1].encoding.get('dataset_key')
+    mode = 'w'
+    for factor, level in sorted(levels.items()):
+        if factor == 1:
+            continue
+        if key is not None:
+            level = level.assign_attrs(dataset_key=key)
+        level.to_netcdf(path, mode=mode, group=f"level{factor}")
+        mode = 'a'
+    return path
+
+
+def open_pyramid(data, path):
+    """
+    Открывает записанную пирамиду; уровень 1 - переданный набор data.
+    Уровни меньше MAX_LOADED_BYTES читаются в память и файл сразу закрывается,
+    большие читаются лениво, а файл закрывается, когда уровень собран сборщиком мусора
+    (после вытеснения из кэша или смены версии данных).
+    """
+    with netCDF4.Dataset(path) as nc:
+        groups = sorted(nc.groups)
+    levels = {1: data}
+    for group in groups:
+        level = xr.open_dataset(path, group=group)
+        if level.nbytes <= MAX_LOADED_BYTES:
+            level.load()
+            level.close()
+        else:
+            # _close - метод хранилища, а не набора: финализатор не удерживает уровень
+            weakref.finalize(level, level._close)
+        levels[int(group[len('level'):])] = level
+    return levels
+
+
+def _extent_slices(level, extent):
+    # Индексы узлов уровня внутри экстента [lon_min, lon_max, lat_min, lat_max]
+    lon = level.longitude.values
+    lat = level.latitude.values
+    lon_idx = np.flatnonzero((lon >= extent[0]) & (lon <= extent[1]))
+    lat_idx = np.flatnonzero((lat >= extent[2]) & (lat <= extent[3]))
+    if not len(lon_idx) or not len(lat_idx):
+        return slice(None), slice(None)
+    return slice(lat_idx[0], lat_idx[-1] + 1), slice(lon_idx[0], lon_idx[-1] + 1)
+
+
+def select_level(levels, width, height, extent=None):
+    """
+    Самый грубый уровень, у которого в экстенте не меньше узлов, чем пикселей
+    (width x height) в области вывода. Возвращает уровень, обрезанный по экстенту.
+    """
+    for factor in sorted(levels, reverse=True):
+        level = levels[factor]
+        lat_slice, lon_slice = _extent_slices(level, extent) if extent is not None else (slice(None), slice(None))
+        subset = level.isel(latitude=lat_slice, longitude=lon_slice)
+        if factor == 1 or (subset.sizes['longitude'] >= width and subset.sizes['latitude'] >= height):
+            return subset
+    return levels[1]
+
+
+def color_limits(levels, field):
+    """
+    Пределы цветовой шкалы по полному разрешению (из блочных min/max грубого уровня),
+    симметричные для знакопеременных полей, как в xarray.
+    """
+    coarsest = levels[max(levels)]
+    if f"{field}_min" in coarsest:
+        vmin = float(coarsest[f"{field}_min"].min())
+        vmax = float(coarsest[f"{field}_max"].max())
+    else:
+        vmin = float(coarsest[field].min())
+        vmax = float(coarsest[field].max())
+    if vmin < 0 < vmax:
+        vlim = max(-vmin, vmax)
+        return -vlim, vlim
+    return vmin, vmax
+
+
+def stored_pyramid(data):
+    """
+    Пирамида, записанная заранее (python pyramid.py) для того же набора данных:
+    файл <source>.pyramid.nc с тем же ключом набора и всеми его полями. Иначе None.
+    """
+    source = data.encoding.get('source')
+    key = data.encoding.get('dataset_key')
+    if source is None or key is None:
+        return None
+    path = pyramid_path(source)
+    if not os.path.exists(path):
+        return None
+    try:
+        levels = open_pyramid(data, path)
+    except (OSError, ValueError):
+        return None
+    stored = [level for factor, level in levels.items() if factor != 1]
+    if not stored or any(level.attrs.get('dataset_key') != key or not all(name in level for name in data.data_vars)
+                         for level in stored):
+        for level in stored:
+            level.close()
+        return None
+    return levels
+
+
+_pyramids = ObjectCache(max_entries=4)
+
+
+def get_pyramid(data):
+    """
+    Пирамида набора данных: уровни читаются лениво из записанного файла пирамиды,
+    если он соответствует набору, иначе строятся в памяти процесса при первом обращении.
+    """
+    return _pyramids.get(data, None, lambda: stored_pyramid(data) or build_pyramid(data))
+
+
+def block_mean(values, factor):
+    """
+    Блочное среднее массива (широта x долгота) с отбрасыванием неполных блоков,
+    согласованное с уровнями build_pyramid.
+    """
+    if factor == 1:
+        return values
+    ny, nx = values.shape[0] // factor, values.shape[1] // factor
+    return values[:ny * factor, :nx * factor].reshape(ny, factor, nx, factor).mean(axis=(1, 3))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Построение пирамиды разрешений для сетки netCDF")
+    parser.add_argument('source', help="Исходный файл netCDF (широта x долгота)")
+    parser.add_argument('-o', '--output', default=None, help="Файл пирамиды (по умолчанию <source>.pyramid.nc)")
+    parser.add_argument('--factors', type=int, nargs='+', default=list(FACTORS))
+    parser.add_argument('--raw', action='store_true',
+                        help="Только поля файла, без производных полей gravity_data (приложение такую пирамиду не читает)")
+    args = parser.parse_args(argv)
+    output = args.output or pyramid_path(args.source)
+    if args.raw:
+        with xr.open_dataset(args.source) as data:
+            write_pyramid(build_pyramid(data, args.factors), output)
+        return
+    # Уровни строятся по тому же набору с производными полями, который открывает приложение
+    from gravity_data import load_dataset
+    write_pyramid(build_pyramid(load_dataset(args.source), args.factors), output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+import argparse
+import glob
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import xarray as xr
+import netCDF4
+import boule as bl
+
+from gravity_data import compute_point_fields, POINT_FIELDS, BOUGUER_DENSITY
+
+
+# Пакетная редукция сеток netCDF (формат ICGEM, измерения latitude x longitude) без Streamlit.
+# Поточечные поля считаются полосами строк на пуле процессов; запись ведет главный процесс.
+
+SKIP_SUFFIXES = ('.reduced.nc', '.pyramid.nc', '.prisms.nc')
+
+
+def find_inputs(paths):
+    """
+    Список файлов netCDF: файлы передаются как есть, каталоги просматриваются на *.nc.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(f for f in sorted(glob.glob(os.path.join(path, '*.nc')))
+                         if not f.endswith(SKIP_SUFFIXES) and '.derived-' not in f)
+        else:
+            files.append(path)
+    return files
+
+
+def output_path(path, output_dir):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(output_dir or os.path.dirname(path), f"{stem}.reduced.nc")
+
+
+def reduce_chunk(path, start, stop, ellipsoid, density, dtype):
+    """
+    Читает строки start:stop файла и возвращает поточечные поля редукции.
+    Выполняется в процессе-обработчике.
+    """
+    with xr.open_dataset(path) as ds:
+        chunk = ds.transpose('latitude', 'longitude').isel(latitude=slice(start, stop)).load()
+    compute_point_fields(chunk, getattr(bl, ellipsoid), density)
+    return start, stop, {field: chunk[field].values.astype(dtype) for field in POINT_FIELDS}
+
+
+def _attrs(var):
+    # _FillValue задается при создании переменной, а не атрибутом
+    return {key: var.getncattr(key) for key in var.ncattrs() if key != '_FillValue'}
+
+
+def _create_output(source, path, chunk_rows, dtype, complevel):
+    # Копия структуры исходного файла плюс переменные для производных полей
+    nc_in = netCDF4.Dataset(source)
+    nc_out = netCDF4.Dataset(path, 'w')
+    n_lat, n_lon = len(nc_in.dimensions['latitude']), len(nc_in.dimensions['longitude'])
+    nc_out.createDimension('latitude', n_lat)
+    nc_out.createDimension('longitude', n_lon)
+    for name in ('latitude', 'longitude'):
+        var = nc_out.createVariable(name, nc_in[name].dtype, (name,))
+        var.setncatts(_attrs(nc_in[name]))
+        var[:] = nc_in[name][:]
+    chunks = (min(chunk_rows, n_lat), n_lon)
+    copied = []
+    for name, var_in in nc_in.variables.items():
+        if var_in.dimensions != ('latitude', 'longitude'):
+            continue
+        var = nc_out.createVariable(name, var_in.dtype, ('latitude', 'longitude'), zlib=True, complevel=complevel,
+                                    chunksizes=chunks, fill_value=getattr(var_in, '_FillValue', None))
+        var.setncatts(_attrs(var_in))
+        copied.append(name)
+    for field in POINT_FIELDS:
+        nc_out.createVariable(field, dtype, ('latitude', 'longitude'), zlib=True, complevel=complevel, chunksizes=chunks)
+        nc_out[field].units = 'mGal'
+    return nc_in, nc_out, copied, n_lat
+
+
+def reduce_files(paths, output_dir=None, ellipsoid='WGS84', density=BOUGUER_DENSITY, chunk_rows=256,
+                 workers=None, float32=False, complevel=4, log=print):
+    """
+    Применяет поточечные редукции ко всем файлам. Задачи (файл, полоса строк) распределяются
+    по пулу процессов; одновременно в работе не более 2 * workers полос, поэтому
+    память ограничена размером нескольких полос независимо от размера сетки.
+    """
+    dtype = np.float32 if float32 else np.float64
+    workers = workers or os.cpu_count() or 1
+    outputs = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for path in paths:
+            started = time.time()
+            target = output_path(path, output_dir)
+            nc_in, nc_out, copied, n_lat = _create_output(path, target, chunk_rows, dtype, complevel)
+            try:
+                queue = deque()
+
+                def write(result):
+                    start, stop, fields = result
+                    for name in copied:
+                        nc_out[name][start:stop] = nc_in[name][start:stop]
+                    for field, values in fields.items():
+                        nc_out[field][start:stop] = values
+
+                for start in range(0, n_lat, chunk_rows):
+                    queue.append(pool.submit(reduce_chunk, path, start, min(start + chunk_rows, n_lat),
+                                             ellipsoid, density, dtype))
+                    if len(queue) >= 2 * workers:
+                        write(queue.popleft().result())
+                while queue:
+                    write(queue.popleft().result())
+            finally:
+                nc_in.close()
+                nc_out.close()
+            log(f"{path} -> {target} ({time.time() - started:.1f} с)")
+            outputs.append(target)
+    return outputs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Нормальная сила тяжести, возмущение и редукция Буге для сеток netCDF (ICGEM)")
+    parser.add_argument('inputs', nargs='+', help="Файлы netCDF или каталоги с ними")
+    parser.add_argument('-o', '--output-dir', default=None, help="Каталог результатов (по умолчанию рядом с исходными)")
+    parser.add_argument('--ellipsoid', default='WGS84', help="Эллипсоид boule (WGS84, GRS80, ...)")
+    parser.add_argument('--density', type=float, default=BOUGUER_DENSITY, help="Плотность пластины Буге, кг/м^3")
+    parser.add_argument('--chunk-rows', type=int, default=256, help="Число строк широты в одной полосе")
+    parser.add_argument('--workers', type=int, default=None, help="Число процессов")
+    parser.add_argument('--float32', action='store_true', help="Сохранять производные поля в float32")
+    parser.add_argument('--complevel', type=int, default=4, help="Уровень сжатия zlib")
+    args = parser.parse_args(argv)
+
+    paths = find_inputs(args.inputs)
+    if not paths:
+        parser.error("не найдено ни одного файла netCDF")
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    reduce_files(paths, args.output_dir, args.ellipsoid, args.density, args.chunk_rows,
+                 args.workers, args.float32, args.complevel)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
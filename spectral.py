@@ -0,0 +1,127 @@
+from functools import lru_cache
+
+import numpy as np
+
+from fft_grid import grid_spacing, pad, wavenumbers
+from object_cache import ObjectCache
+
+
+# Операторы задаются кортежами (имя, параметры...), поэтому цепочка операторов
+# хешируема и служит ключом кэша передаточных функций и результатов.
+def upward(height):
+    """
+    Продолжение вверх на height метров: exp(-|k| h).
+    """
+    return ('upward', float(height))
+
+
+def downward(height, max_gain=100.0):
+    """
+    Продолжение вниз на height метров; усиление ограничено max_gain.
+    """
+    return ('downward', float(height), float(max_gain))
+
+
+def vertical_derivative(order=1):
+    """
+    Вертикальная производная порядка order (ось z направлена вниз): |k|^n.
+    """
+    return ('dz', int(order))
+
+
+def derivative_x(order=1):
+    """
+    Производная на восток: (i kx)^n.
+    """
+    return ('dx', int(order))
+
+
+def derivative_y(order=1):
+    """
+    Производная на север: (i ky)^n.
+    """
+    return ('dy', int(order))
+
+
+def bandpass(long_wavelength=None, short_wavelength=None, order=4):
+    """
+    Полосовой фильтр Баттерворта: подавляет длины волн больше long_wavelength
+    и меньше short_wavelength (метры); None отключает соответствующую границу.
+    """
+    return ('bandpass', long_wavelength and float(long_wavelength), short_wavelength and float(short_wavelength), int(order))
+
+
+def _operator_response(operator, ky, kx, k):
+    name, *params = operator
+    if name == 'upward':
+        return np.exp(-k * params[0])
+    if name == 'downward':
+        height, max_gain = params
+        return np.minimum(np.exp(k * height), max_gain)
+    if name == 'dz':
+        return k ** params[0]
+    if name == 'dx':
+        return (1j * kx) ** params[0]
+    if name == 'dy':
+        return (1j * ky) ** params[0]
+    if name == 'bandpass':
+        long_wavelength, short_wavelength, order = params
+        response = np.ones(k.shape)
+        with np.errstate(divide='ignore'):
+            if long_wavelength:
+                k_low = 2 * np.pi / long_wavelength
+                response = response / np.sqrt(1 + (k_low / k) ** (2 * order))
+            if short_wavelength:
+                k_high = 2 * np.pi / short_wavelength
+                response = response / np.sqrt(1 + (k / k_high) ** (2 * order))
+        return response
+    raise ValueError(f"Неизвестный оператор {name}")
+
+
+@lru_cache(maxsize=32)
+def transfer(operators, shape, spacing):
+    """
+    Передаточная функция цепочки операторов на rfft2-сетке: произведение откликов.
+    """
+    ky, kx, k = wavenumbers(shape, *spacing)
+    response = np.ones(k.shape, dtype=complex)
+    for operator in operators:
+        response = response * _operator_response(operator, ky, kx, k)
+    response.setflags(write=False)
+    return response
+
+
+def apply(grid, spacing, operators, pad_fraction=0.25, pad_mode='reflect'):
+    """
+    Применяет цепочку операторов к сетке: одно прямое и одно обратное преобразование
+    независимо от длины цепочки. spacing - шаг (dy, dx) в метрах со знаком
+    направления осей (положительный - на север и на восток).
+    """
+    grid = np.asarray(grid, dtype=float)
+    padded, region = pad(grid, pad_fraction, pad_mode)
+    response = transfer(tuple(operators), padded.shape, tuple(spacing))
+    return np.fft.irfft2(np.fft.rfft2(padded) * response, s=padded.shape)[region]
+
+
+_results = ObjectCache(max_entries=16)
+
+
+def filter_field(data, field, operators):
+    """
+    Результат фильтрации поля набора данных (массив широта x долгота),
+    кэшируется по (набор данных, поле, цепочка операторов).
+    """
+    operators = tuple(operators)
+    key = (field, operators)
+    result = _results.lookup(data, key)
+    if result is not None:
+        return result
+    dy, dx = grid_spacing(data)
+    # Знак шага задает направление осей для горизонтальных производных
+    dy *= np.sign(data.latitude.values[1] - data.latitude.values[0])
+    dx *= np.sign(data.longitude.values[1] - data.longitude.values[0])
+    values = data[field].transpose('latitude', 'longitude').values
+    result = apply(values, (dy, dx), operators)
+    result.setflags(write=False)
+    _results.store(data, key, result)
+    return result
@@ -1,14 +1,174 @@
 import streamlit as st
 import matplotlib.pyplot as plt
 import os
+import json
+import struct
+import threading
+import numpy as np
 
 def extract_dates_from_filenames(directory):
-    filenames = os.listdir(directory)
-    dates = []
-    for filename in filenames:
-        parts = filename.split("_")
-        if len(parts) == 4 and parts[0] == "GRACE":
-            date_string = "_".join(parts[1:]).split(".")[0]  # Убираем расширение файла
-            dates.append(date_string)
-    dates.sort()  # Сортируем даты по возрастанию
-    return dates
+    # Даты берутся из манифеста, который перестраивается только при изменении каталога
+    return list(get_manifest(directory).labels)
+
+
+# Манифест архива GRACE: даты, пути, размеры файлов и изображений.
+# Хранится рядом с каталогом и перестраивается только при изменении mtime каталога.
+class GraceManifest:
+    def __init__(self, directory, entries, mtime):
+        self.directory = directory
+        self.mtime = mtime
+        # Файлы, имя которых не содержит дату (GRACE_x_y_z), пропускаются
+        entries = [e for e in entries if _parse_label(e['label']) is not None]
+        self.entries = entries
+        # Несколько файлов на одну дату (разные продукты): основной - PNG, затем по имени файла
+        grouped = {}
+        for entry in sorted(entries, key=lambda e: (not e['filename'].lower().endswith('.png'), e['filename'])):
+            grouped.setdefault(entry['label'], []).append(entry)
+        labels = sorted(grouped)
+        primary = [grouped[label][0] for label in labels]
+        self.labels = labels
+        self.dates = np.array([_parse_label(label) for label in labels], dtype='datetime64[D]')
+        self.filenames = [e['filename'] for e in primary]
+        self.sizes = np.array([e['size'] for e in primary], dtype=np.int64)
+        self.dimensions = [tuple(e['dimensions']) if e['dimensions'] else None for e in primary]
+        self._index = {label: i for i, label in enumerate(self.labels)}
+        self._files = {label: [e['filename'] for e in group] for label, group in grouped.items()}
+
+    @staticmethod
+    def manifest_path(directory):
+        return os.path.normpath(directory) + '.manifest.json'
+
+    @classmethod
+    def scan(cls, directory):
+        """
+        Сканирует каталог и разбирает имена файлов GRACE_YYYY_MM_DD.*
+        """
+        mtime = os.stat(directory).st_mtime
+        entries = []
+        with os.scandir(directory) as it:
+            for item in it:
+                parts = item.name.split("_")
+                if len(parts) == 4 and parts[0] == "GRACE":
+                    label = "_".join(parts[1:]).split(".")[0]  # Убираем расширение файла
+                    entries.append(dict(label=label, filename=item.name, size=item.stat().st_size,
+                                        dimensions=_png_dimensions(item.path)))
+        return cls(directory, entries, mtime)
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Загружает сохраненный манифест, если он соответствует текущему mtime каталога,
+        иначе сканирует каталог и сохраняет манифест заново.
+        """
+        mtime = os.stat(directory).st_mtime
+        path = cls.manifest_path(directory)
+        try:
+            with open(path, encoding='utf-8') as f:
+                stored = json.load(f)
+            if stored['mtime'] == mtime:
+                return cls(directory, stored['entries'], mtime)
+        except (OSError, ValueError, KeyError):
+            pass
+        manifest = cls.scan(directory)
+        manifest.save()
+        return manifest
+
+    def save(self):
+        entries = [dict(label=e['label'], filename=e['filename'], size=int(e['size']),
+                        dimensions=list(e['dimensions']) if e['dimensions'] else None) for e in self.entries]
+        tmp_path = f"{self.manifest_path(self.directory)}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(dict(mtime=self.mtime, entries=entries), f)
+            os.replace(tmp_path, self.manifest_path(self.directory))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def path(self, label):
+        """
+        Путь к файлу для даты в формате YYYY_MM_DD или None, если такой даты нет.
+        """
+        i = self._index.get(label)
+        return None if i is None else os.path.join(self.directory, self.filenames[i])
+
+    def paths(self, label):
+        """
+        Все файлы даты label (основной первым); пустой список, если такой даты нет.
+        """
+        return [os.path.join(self.directory, filename) for filename in self._files.get(label, [])]
+
+    def nearest(self, date):
+        """
+        Индекс ближайшей по времени съемки (двоичный поиск).
+        Для пустого архива - ValueError: допустимого индекса нет.
+        """
+        if len(self.dates) == 0:
+            raise ValueError(f"В архиве {self.directory} нет съемок")
+        date = np.datetime64(date, 'D')
+        i = int(np.searchsorted(self.dates, date))
+        if i == 0:
+            return 0
+        if i == len(self.dates):
+            return len(self.dates) - 1
+        return i if self.dates[i] - date < date - self.dates[i - 1] else i - 1
+
+    def between(self, start, end):
+        """
+        Срез индексов съемок в диапазоне дат [start, end].
+        """
+        lo = int(np.searchsorted(self.dates, np.datetime64(start, 'D'), side='left'))
+        hi = int(np.searchsorted(self.dates, np.datetime64(end, 'D'), side='right'))
+        return slice(lo, hi)
+
+    def missing_months(self):
+        """
+        Месяцы без данных между первой и последней съемкой (пропуски GRACE/GRACE-FO).
+        """
+        if not len(self.dates):
+            return np.array([], dtype='datetime64[M]')
+        months = self.dates.astype('datetime64[M]')
+        all_months = np.arange(months[0], months[-1] + 1)
+        return np.setdiff1d(all_months, months)
+
+
+def _parse_label(label):
+    # Дата из метки YYYY_MM_DD или None для меток, не являющихся датой
+    try:
+        return np.datetime64(label.replace('_', '-'), 'D')
+    except ValueError:
+        return None
+
+
+def _png_dimensions(path):
+    # Ширина и высота из заголовка IHDR без декодирования изображения
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(24)
+    except OSError:
+        return None
+    if header[:8] != b'\x89PNG\r\n\x1a\n' or header[12:16] != b'IHDR':
+        return None
+    return list(struct.unpack('>II', header[16:24]))
+
+
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+
+def get_manifest(directory):
+    """
+    Манифест каталога из памяти процесса; при каждом вызове проверяется только mtime каталога.
+    """
+    mtime = os.stat(directory).st_mtime
+    manifest = _manifests.get(directory)
+    if manifest is None or manifest.mtime != mtime:
+        with _manifests_lock:
+            manifest = _manifests.get(directory)
+            if manifest is None or manifest.mtime != mtime:
+                manifest = GraceManifest.load(directory)
+                _manifests[directory] = manifest
+    return manifest
@@ -0,0 +1,51 @@
+import numpy as np
+
+from fft_grid import grid_spacing, pad, wavenumbers
+
+
+G = 6.67430e-11  # Гравитационная постоянная в м^3 кг^-1 с^-2
+WATER_DENSITY = 1030.0  # Плотность морской воды, кг/м^3
+
+
+def _apply_k(values, k, region):
+    # F^-1(|k| F(values)), обрезанное до исходной области
+    return np.fft.irfft2(k * np.fft.rfft2(values), s=values.shape)[region]
+
+
+def terrain_correction(topography, spacing, density=2670.0, water_density=None,
+                       pad_fraction=0.25, pad_mode='reflect', taper=True):
+    """
+    Поправка за рельеф (mGal) спектральным методом в линейном приближении (Forsberg, 1985):
+    c = (Gρ/2) ∫∫ (h - h_P)^2 / s^3 = πGρ [2 h_P F^-1(|k| F(h)) - F^-1(|k| F(h^2))].
+    Рельеф отсчитывается от высоты топографии в самой точке, поэтому поправка
+    дополняет плиту Буге до полной редукции. При заданной water_density
+    для отрицательных высот используется контраст density - water_density.
+    """
+    h = np.asarray(topography, dtype=float)
+    rho = np.full(h.shape, float(density))
+    if water_density is not None:
+        rho[h < 0] -= water_density
+
+    # Плотность включается в свертку, поэтому допускается ее изменение по площади
+    padded_h, region = pad(rho * h, pad_fraction, pad_mode, taper)
+    padded_h2, _ = pad(rho * h * h, pad_fraction, pad_mode, taper)
+    padded_rho, _ = pad(rho, pad_fraction, pad_mode, taper)
+    _, _, k = wavenumbers(padded_h.shape, *spacing)
+
+    term_h = _apply_k(padded_h, k, region)
+    term_h2 = _apply_k(padded_h2, k, region)
+    term_1 = _apply_k(padded_rho, k, region)
+    correction = np.pi * G * (2 * h * term_h - term_h2 - h * h * term_1)
+    return correction * 1e5  # м/с^2 -> mGal
+
+
+def add_terrain_correction(data, density=2670.0, water_density=None, **kwargs):
+    """
+    Добавляет в набор данных поправку за рельеф и полную редукцию Буге
+    gravity_bouguer_complete = gravity_bouguer + terrain_correction.
+    """
+    correction = terrain_correction(data['topography_grd'].transpose('latitude', 'longitude').values,
+                                    grid_spacing(data), density, water_density, **kwargs)
+    data['terrain_correction'] = (('latitude', 'longitude'), correction)
+    data['gravity_bouguer_complete'] = data['gravity_bouguer'] + data['terrain_correction']
+    return data
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from gravity import talwani, talwani_profile, ProfileModel
+
+
+STATIONS = np.linspace(-3000.0, 5000.0, 41)
+SQUARE = np.array([[500.0, 1200.0], [1500.0, 1200.0], [1500.0, 200.0], [500.0, 200.0]])
+TRIANGLE = np.array([[2500.0, 300.0], [3500.0, 900.0], [2000.0, 1500.0]])
+
+
+def scalar_profile(stations, polygons, densities):
+    # Исходный цикл по станциям и рёбрам со скалярной функцией talwani
+    result = []
+    for station in stations:
+        total = 0.0
+        for vertices, density in zip(polygons, densities):
+            for (x1, z1), (x2, z2) in zip(vertices, np.roll(vertices, -1, axis=0)):
+                total += talwani(x1 - station, x2 - station, z1, z2, density)
+        result.append(total)
+    return np.array(result)
+
+
+def test_profile_matches_scalar_loop():
+    polygons, densities = [SQUARE, TRIANGLE], [500.0, -300.0]
+    np.testing.assert_allclose(talwani_profile(STATIONS, polygons, densities),
+                               scalar_profile(STATIONS, polygons, densities), rtol=1e-10, atol=1e-12)
+
+
+def test_profile_model_matches_profile():
+    model = ProfileModel(STATIONS)
+    model.set_body(0, SQUARE, 500.0)
+    model.set_body(1, TRIANGLE, -300.0)
+    moved = SQUARE.copy()
+    moved[1] = [1800.0, 1400.0]
+    model.set_body(0, moved, 400.0)
+    # Перемещение одной вершины пересчитывает два примыкающих ребра
+    assert model.recomputed == 2
+    np.testing.assert_allclose(model.gravity(), talwani_profile(STATIONS, [moved, TRIANGLE], [400.0, -300.0]),
+                               rtol=1e-10, atol=1e-12)
+
+
+def test_profile_model_stations_change_rebuilds():
+    model = ProfileModel(STATIONS)
+    model.set_body(0, TRIANGLE, 250.0)
+    model.set_stations(STATIONS[::2])
+    assert model.recomputed == len(TRIANGLE)
+    np.testing.assert_allclose(model.gravity(), talwani_profile(STATIONS[::2], [TRIANGLE], [250.0]))
+
+
+def test_profile_rejects_degenerate_polygon():
+    with pytest.raises(ValueError):
+        talwani_profile(STATIONS, [SQUARE[:2]], [500.0])
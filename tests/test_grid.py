@@ -0,0 +1,47 @@
+import numpy as np
+
+from bgs_stations import StationStore
+from bgs_grid import StationGridder
+
+
+def synthetic_store(values, n=4000, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(0, 200000, n)
+    y = rng.uniform(0, 200000, n)
+    return StationStore({'LATITUDE': np.zeros(n), 'LONGITUDE': np.zeros(n), 'EASTING': x, 'NORTHING': y,
+                         'G': values(x, y, rng)})
+
+
+def test_linear_field_is_reproduced():
+    store = synthetic_store(lambda x, y, rng: 3.0 + 2e-4 * x - 1e-4 * y)
+    easting, northing, values = StationGridder(store, 'G').grid((20000, 20000, 180000, 180000), 2000, workers=1)
+    expected = 3.0 + 2e-4 * easting[None, :] - 1e-4 * northing[:, None]
+    assert not np.isnan(values).any()
+    np.testing.assert_allclose(values, expected, atol=1e-6)
+
+
+def test_no_seams_at_tile_boundaries():
+    # На шумных данных сплайны соседних тайлов расходятся; смешивание убирает скачок на границе
+    store = synthetic_store(lambda x, y, rng: rng.normal(size=len(x)))
+    gridder = StationGridder(store, 'G', max_stations=300)
+    easting, _, values = gridder.grid((20000, 20000, 180000, 180000), 500, workers=1)
+    curvature = np.abs(np.diff(values, 2, axis=1))
+    boundary = np.searchsorted(easting, gridder.tile_size * 2)
+    assert np.nanmax(curvature[:, boundary - 2:boundary + 1]) < 2 * np.median(np.nanmax(curvature, axis=0))
+
+
+def test_shifted_window_reuses_tiles():
+    store = synthetic_store(lambda x, y, rng: np.sin(x / 30000) + np.cos(y / 20000))
+    gridder = StationGridder(store, 'G')
+    _, _, first = gridder.grid((20000, 20000, 120000, 120000), 1000, workers=1)
+    rasters = dict(gridder._rasters)
+    _, _, shifted = gridder.grid((30000, 20000, 130000, 120000), 1000, workers=1)
+    # Растры тайлов, попавших в оба окна, не пересчитываются
+    assert all(gridder._rasters[key] is raster for key, raster in rasters.items() if key in gridder._rasters)
+    np.testing.assert_allclose(shifted[:, :-10], first[:, 10:])
+
+
+def test_far_nodes_are_masked():
+    store = synthetic_store(lambda x, y, rng: np.ones(len(x)))
+    _, _, values = StationGridder(store, 'G').grid((300000, 300000, 320000, 320000), 1000, workers=1)
+    assert np.isnan(values).all()
@@ -0,0 +1,65 @@
+import gc
+import threading
+
+import numpy as np
+import xarray as xr
+
+from object_cache import ObjectCache
+
+
+def dataset():
+    return xr.Dataset({'g': (('latitude', 'longitude'), np.zeros((3, 4)))})
+
+
+def test_factory_runs_once_per_key():
+    cache, data, calls = ObjectCache(), dataset(), []
+    for _ in range(3):
+        value = cache.get(data, 'key', lambda: calls.append(1) or object())
+    assert len(calls) == 1
+    assert cache.lookup(data, 'key') is value
+    assert cache.lookup(dataset(), 'key') is None
+
+
+def test_entries_are_removed_when_dataset_is_collected():
+    cache = ObjectCache()
+    data = dataset()
+    cache.store(data, 'key', np.ones(3))
+    assert len(cache) == 1
+    del data
+    gc.collect()
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ObjectCache(max_entries=2)
+    first, second, third = dataset(), dataset(), dataset()
+    cache.store(first, None, 1)
+    cache.store(second, None, 2)
+    cache.lookup(first)
+    cache.store(third, None, 3)
+    assert cache.lookup(first) == 1
+    assert cache.lookup(second) is None
+    assert cache.lookup(third) == 3
+
+
+def test_slow_build_does_not_block_other_keys():
+    cache, data = ObjectCache(), dataset()
+    started, release, calls = threading.Event(), threading.Event(), []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'slow'
+
+    threads = [threading.Thread(target=cache.get, args=(data, 'slow', slow)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    assert started.wait(5)
+    # Пока строится один ключ, другие ключи доступны
+    assert cache.get(data, 'fast', lambda: 'fast') == 'fast'
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert cache.lookup(data, 'slow') == 'slow'
+    assert len(calls) == 1
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from bgs_stations import osgb36_to_grid, read_csv
+
+
+def test_ordnance_survey_worked_example():
+    # Пример из «A guide to coordinate systems in Great Britain» (Ordnance Survey), приложение C
+    latitude = 52 + 39 / 60 + 27.2531 / 3600
+    longitude = 1 + 43 / 60 + 4.5177 / 3600
+    easting, northing = osgb36_to_grid(latitude, longitude)
+    assert abs(easting - 651409.903) < 1e-3
+    assert abs(northing - 313177.270) < 1e-3
+
+
+def test_true_origin():
+    easting, northing = osgb36_to_grid(49.0, -2.0)
+    np.testing.assert_allclose([easting, northing], [400000.0, -100000.0], atol=1e-6)
+
+
+def test_read_csv_skips_short_rows(tmp_path):
+    path = tmp_path / 'stations.csv'
+    path.write_text('LATITUDE,LONGITUDE,STATION_ID,BOUGUER ANOMALY\n52,-1,A,3.5\n53,-2\n\n54,-3,C,x\n')
+    with pytest.warns(UserWarning, match='1'):
+        columns = read_csv(path)
+    np.testing.assert_array_equal(columns['STATION_ID'], ['A', 'C'])
+    assert columns['BOUGUER ANOMALY'].dtype == np.float32
+    assert np.isnan(columns['BOUGUER ANOMALY'][1])
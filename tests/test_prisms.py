@@ -0,0 +1,27 @@
+import numpy as np
+
+from gravity_data import G
+from prisms import prism_gz
+
+
+def test_thin_wide_prism_matches_bouguer_slab():
+    # Широкая тонкая призма под точкой наблюдения притягивает как плита Буге 2πGρt
+    density, thickness, extent = 2670.0, 100.0, 1e6
+    gz = prism_gz(-extent, extent, -extent, extent, -200.0, -200.0 + thickness, np.array([density]))
+    np.testing.assert_allclose(gz, 2 * np.pi * G * density * thickness * 1e5, rtol=1e-3)
+
+
+def test_prism_above_pulls_upward():
+    below = prism_gz(-500.0, 500.0, -500.0, 500.0, -300.0, -100.0, np.array([1000.0]))
+    above = prism_gz(-500.0, 500.0, -500.0, 500.0, 100.0, 300.0, np.array([1000.0]))
+    assert below > 0
+    np.testing.assert_allclose(above, -below, rtol=1e-10)
+
+
+def test_prisms_are_additive():
+    # Разбиение призмы на две по высоте не меняет суммарного притяжения
+    density = np.array([1000.0])
+    whole = prism_gz(-400.0, 700.0, -300.0, 200.0, -900.0, -100.0, density)
+    parts = (prism_gz(-400.0, 700.0, -300.0, 200.0, -900.0, -500.0, density)
+             + prism_gz(-400.0, 700.0, -300.0, 200.0, -500.0, -100.0, density))
+    np.testing.assert_allclose(whole, parts, rtol=1e-9)
@@ -0,0 +1,28 @@
+import numpy as np
+import xarray as xr
+
+from mmap_store import write_store, open_store
+from profiles import ProfileStore
+
+
+def dataset():
+    values = np.arange(35.0).reshape(5, 7)
+    return xr.Dataset({'g': (('latitude', 'longitude'), values)},
+                      coords=dict(latitude=np.arange(5.0), longitude=np.arange(7.0)))
+
+
+def test_memory_dataset_profiles_are_contiguous():
+    data = dataset()
+    store = ProfileStore(data, ['g'])
+    for dimension in store.dims:
+        _, profile = store.profile(dimension, 2.0)
+        assert profile['g'].flags.c_contiguous
+    np.testing.assert_array_equal(store.profile('latitude', 2.0)[1]['g'], data.g.values[:, 2])
+
+
+def test_mapped_dataset_profiles_share_pages(tmp_path):
+    data = open_store(write_store(dataset(), str(tmp_path / 'store')))
+    store = ProfileStore(data, ['g'])
+    for dimension in store.dims:
+        _, profile = store.profile(dimension, 3.0)
+        assert np.shares_memory(profile['g'], data.g.values)
@@ -0,0 +1,40 @@
+import gc
+import os
+
+import numpy as np
+import xarray as xr
+
+import pyramid
+from pyramid import build_pyramid, write_pyramid, open_pyramid
+
+
+def open_files(path):
+    # Открытые процессом дескрипторы файла path (Linux)
+    fds = '/proc/self/fd'
+    return sum(os.path.realpath(os.path.join(fds, fd)) == os.path.realpath(path) for fd in os.listdir(fds))
+
+
+def written_pyramid(tmp_path):
+    n = 64
+    data = xr.Dataset({'g': (('latitude', 'longitude'), np.random.default_rng(0).normal(size=(n, n)))},
+                      coords=dict(latitude=np.linspace(18, 21, n), longitude=np.linspace(-157, -154, n)))
+    path = str(tmp_path / 'data.pyramid.nc')
+    return data, write_pyramid(build_pyramid(data), path)
+
+
+def test_small_levels_are_loaded_and_closed(tmp_path):
+    data, path = written_pyramid(tmp_path)
+    levels = open_pyramid(data, path)
+    assert sorted(levels) == [1, 2, 4, 8, 16]
+    assert open_files(path) == 0
+    np.testing.assert_allclose(levels[2].g.values, build_pyramid(data)[2].g.values)
+
+
+def test_lazy_levels_close_when_collected(tmp_path, monkeypatch):
+    monkeypatch.setattr(pyramid, 'MAX_LOADED_BYTES', 0)
+    data, path = written_pyramid(tmp_path)
+    levels = open_pyramid(data, path)
+    assert open_files(path) > 0
+    del levels
+    gc.collect()
+    assert open_files(path) == 0
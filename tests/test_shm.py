@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from grace_shm import legendre
+
+special = pytest.importorskip('scipy.special')
+
+
+def test_legendre_matches_scipy():
+    lmax = 30
+    latitudes = np.linspace(-89.5, 89.5, 37)
+    P = legendre(latitudes, lmax)
+    t = np.sin(np.radians(latitudes))
+    for l in range(lmax + 1):
+        for m in range(l + 1):
+            # Полная нормировка без фазы Кондона-Шортли
+            norm = np.sqrt((2 - (m == 0)) * (2 * l + 1) * special.factorial(l - m) / special.factorial(l + m))
+            expected = (-1) ** m * norm * special.lpmv(m, l, t)
+            np.testing.assert_allclose(P[l, m], expected, rtol=1e-9, atol=1e-12, err_msg=f"l={l}, m={m}")
+
+
+def test_legendre_is_cached_and_read_only():
+    latitudes = np.linspace(-60.0, 60.0, 5)
+    first = legendre(latitudes, 10)
+    assert legendre(latitudes.copy(), 10) is first
+    assert not first.flags.writeable
@@ -0,0 +1,133 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+
+# Легкая трассировка этапов выполнения страницы. Интервалы (span) записываются,
+# только если в текущем контексте начата трассировка (start_trace); иначе span
+# ничего не делает, и инструментированный код работает как прежде.
+
+_trace = contextvars.ContextVar('trace', default=None)
+_depth = contextvars.ContextVar('trace_depth', default=0)
+
+try:
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = None
+
+
+def rss():
+    """
+    Резидентная память процесса в байтах (Linux, /proc/self/statm) или None.
+    """
+    if _PAGE_SIZE is None:
+        return None
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class Trace:
+    """
+    Интервалы одного прогона: имя, начало и длительность (нс от начала трассы),
+    глубина вложенности, поток и изменение резидентной памяти.
+    """
+
+    def __init__(self, name='run'):
+        self.name = name
+        self.origin = time.perf_counter_ns()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, name, start, duration, depth, rss_delta, args):
+        with self._lock:
+            self.spans.append(dict(name=name, start=start - self.origin, duration=duration, depth=depth,
+                                   thread=threading.get_ident(), rss_delta=rss_delta, args=args))
+
+    def ordered(self):
+        return sorted(self.spans, key=lambda s: (s['start'], s['depth']))
+
+    def total(self):
+        """
+        Длительность прогона в секундах по интервалам верхнего уровня.
+        """
+        return sum(s['duration'] for s in self.spans if s['depth'] == 0) / 1e9
+
+    def to_dict(self):
+        return dict(name=self.name, pid=os.getpid(), spans=self.ordered())
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), ensure_ascii=False, default=str)
+
+    def to_chrome_trace(self):
+        """
+        Формат Chrome Trace Event (chrome://tracing, Perfetto): события 'X' в микросекундах.
+        """
+        pid = os.getpid()
+        events = []
+        for s in self.ordered():
+            args = dict(s['args'])
+            if s['rss_delta'] is not None:
+                args['rss_delta_kb'] = s['rss_delta'] // 1024
+            events.append(dict(name=s['name'], cat=self.name, ph='X', ts=s['start'] / 1e3, dur=s['duration'] / 1e3,
+                               pid=pid, tid=s['thread'], args=args))
+        return json.dumps(dict(traceEvents=events, displayTimeUnit='ms'), ensure_ascii=False, default=str)
+
+
+@contextmanager
+def start_trace(name='run'):
+    """
+    Начинает трассировку в текущем контексте; все span внутри попадают в возвращаемую Trace.
+    """
+    trace = Trace(name)
+    token = _trace.set(trace)
+    depth_token = _depth.set(0)
+    try:
+        yield trace
+    finally:
+        _depth.reset(depth_token)
+        _trace.reset(token)
+
+
+@contextmanager
+def span(name, **args):
+    """
+    Интервал трассировки этапа name; args сохраняются как параметры этапа.
+    """
+    trace = _trace.get()
+    if trace is None:
+        yield
+        return
+    depth = _depth.get()
+    token = _depth.set(depth + 1)
+    rss_before = rss()
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter_ns() - start
+        rss_after = rss()
+        _depth.reset(token)
+        delta = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+        trace.add(name, start, duration, depth, delta, args)
+
+
+def traced(name=None):
+    """
+    Декоратор: вызов функции оборачивается в span с именем name (по умолчанию - имя функции).
+    """
+    def decorator(function):
+        label = name or function.__qualname__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(label):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator